@@ -1,16 +1,28 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 from typing import Any
 
 import anyio
 
+from app.academy.judge_cache import JudgeCacheStore, judge_cache_key
+from app.db import SessionLocal
 from app.llm.litellm_client import LLMError, execute_via_litellm
 from app.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on responses scored per judge call; larger batches degrade judge consistency.
+_MAX_JUDGE_BATCH = 20
+
+_RUBRIC = """Scoring rubric (0-100):
+- 0-30: Poor (fails criterion significantly)
+- 31-60: Adequate (meets criterion partially)
+- 61-85: Good (meets criterion well)
+- 86-100: Excellent (exceeds criterion)"""
+
 
 def _extract_json_object(text: str) -> dict[str, Any]:
     t = (text or "").strip()
@@ -47,6 +59,26 @@ def _extract_json_object(text: str) -> dict[str, Any]:
     return obj
 
 
+def _extract_json_array(text: str) -> list[Any]:
+    t = (text or "").strip()
+    if t.startswith("```"):
+        parts = t.split("```")
+        if len(parts) >= 2:
+            candidate = parts[1].strip()
+            if "\n" in candidate and candidate.split("\n", 1)[0].strip().isalpha():
+                candidate = candidate.split("\n", 1)[1].strip()
+            t = candidate
+
+    start = t.find("[")
+    end = t.rfind("]")
+    if start == -1 or end == -1 or end <= start:
+        raise json.JSONDecodeError("no array", t, 0)
+    obj = json.loads(t[start : end + 1])
+    if not isinstance(obj, list):
+        raise json.JSONDecodeError("not list", t, 0)
+    return obj
+
+
 class ResponseEvaluator:
     """Evaluates agent response quality using an LLM-as-judge."""
 
@@ -58,11 +90,16 @@ class ResponseEvaluator:
         "clarity": {"description": "Is the response easy to understand and well-structured?", "weight": 0.10},
     }
 
-    def __init__(self) -> None:
+    # Bump whenever the rubric, criteria or judge prompts change; cached judgements of other
+    # versions are then ignored.
+    RUBRIC_VERSION = 1
+
+    def __init__(self, *, use_cache: bool | None = None) -> None:
         # Route judge calls through the multi-LLM router and default to free Groq.
         # Can be overridden via env vars.
         self.provider = (settings.academy_judge_provider or "groq").strip()
         self.model = (settings.academy_judge_model or "llama-3.3-70b-versatile").strip()
+        self.use_cache = settings.academy_judge_cache_enabled if use_cache is None else bool(use_cache)
 
     async def evaluate(
         self,
@@ -81,25 +118,203 @@ class ResponseEvaluator:
           "subscores": { "helpfulness": 80, ... }
         }
         """
-        subscores = await self._judge_all(
-            user_message=user_message,
-            agent_response=agent_response,
-            agent_role=agent_role,
-            expected_qualities=expected_qualities or [],
+        results = await self.evaluate_many(
+            [
+                {
+                    "user_message": user_message,
+                    "agent_response": agent_response,
+                    "agent_role": agent_role,
+                    "expected_qualities": expected_qualities or [],
+                }
+            ],
+            batch_size=1,
         )
+        return results[0]
+
+    async def evaluate_many(self, items: list[dict[str, Any]], *, batch_size: int | None = None) -> list[dict[str, Any]]:
+        """
+        Evaluate several responses, `batch_size` per judge call (ACADEMY_JUDGE_BATCH_SIZE by default).
+
+        Each item takes the keyword arguments of `evaluate`. Results come back in input order.
+        Responses judged before under the same judge and rubric version come from the judge
+        cache; an item the batch answer does not score validly is re-judged on its own.
+        """
+        size = max(1, min(_MAX_JUDGE_BATCH, int(batch_size or settings.academy_judge_batch_size)))
+        keys = [self._cache_key(item) for item in items]
+        cached = await self._cache_get(keys)
+        misses = [i for i, key in enumerate(keys) if key not in cached]
+
+        fresh: dict[int, dict[str, float] | None] = {}
+        for start in range(0, len(misses), size):
+            chunk = misses[start : start + size]
+            if len(chunk) == 1:
+                fresh[chunk[0]] = await self._judge_item(items[chunk[0]])
+                continue
+            judged = await self._judge_batch([items[i] for i in chunk])
+            retry = [n for n, subscores in enumerate(judged) if subscores is None]
+            if retry:
+                logger.warning("Batch judge left %s/%s items unscored; re-judging individually", len(retry), len(chunk))
+                rejudged = await asyncio.gather(*(self._judge_item(items[chunk[n]]) for n in retry))
+                for n, subscores in zip(retry, rejudged):
+                    judged[n] = subscores
+            fresh.update(zip(chunk, judged))
+
+        await self._cache_put({keys[i]: subscores for i, subscores in fresh.items() if subscores is not None})
+        return [
+            self._with_overall(cached.get(key) or fresh.get(i) or self._fallback_subscores())
+            for i, key in enumerate(keys)
+        ]
+
+    def _cache_key(self, item: dict[str, Any]) -> str:
+        return judge_cache_key(
+            judge_provider=self.provider,
+            judge_model=self.model,
+            rubric_version=self.RUBRIC_VERSION,
+            agent_role=str(item.get("agent_role") or ""),
+            user_message=str(item.get("user_message") or ""),
+            agent_response=str(item.get("agent_response") or ""),
+            expected_qualities=[str(q) for q in item.get("expected_qualities") or []],
+        )
+
+    async def _cache_get(self, keys: list[str]) -> dict[str, dict[str, float]]:
+        if not self.use_cache or not keys:
+            return {}
+        try:
+            rows = await asyncio.to_thread(_cache_get_many, keys)
+        except Exception as e:
+            logger.warning("Judge cache lookup failed: %s", e)
+            return {}
+        # Entries missing a current criterion (stale schema) are judged again.
+        return {key: subscores for key, subscores in rows.items() if set(self.EVALUATION_CRITERIA) <= set(subscores)}
+
+    async def _cache_put(self, entries: dict[str, dict[str, float]]) -> None:
+        if not self.use_cache or not entries:
+            return
+        try:
+            await asyncio.to_thread(
+                _cache_put_many,
+                entries,
+                judge_provider=self.provider,
+                judge_model=self.model,
+                rubric_version=self.RUBRIC_VERSION,
+            )
+        except Exception as e:
+            logger.warning("Judge cache write failed: %s", e)
+
+    def _fallback_subscores(self) -> dict[str, float]:
+        return {k: 50.0 for k in self.EVALUATION_CRITERIA.keys()}
+
+    def _with_overall(self, subscores: dict[str, float]) -> dict[str, Any]:
         overall = 0.0
         for criterion, details in self.EVALUATION_CRITERIA.items():
             overall += float(subscores.get(criterion, 50.0)) * float(details["weight"])
         return {"overall": round(overall, 2), "subscores": subscores}
 
-    async def _judge_all(
+    async def _judge_item(self, item: dict[str, Any]) -> dict[str, float] | None:
+        return await self._judge_one(
+            user_message=str(item.get("user_message") or ""),
+            agent_response=str(item.get("agent_response") or ""),
+            agent_role=str(item.get("agent_role") or ""),
+            expected_qualities=list(item.get("expected_qualities") or []),
+        )
+
+    def _criteria_lines(self) -> str:
+        return "\n".join(f"- {k}: {v['description']}" for k, v in self.EVALUATION_CRITERIA.items())
+
+    async def _judge_batch(self, items: list[dict[str, Any]]) -> list[dict[str, float] | None]:
+        """
+        Score several responses in one judge call with a shared rubric. Returns subscores per
+        item, or None for items missing from the answer or not validly scored.
+        """
+        keys = ", ".join(self.EVALUATION_CRITERIA.keys())
+        judge_system = (
+            "You are an expert evaluator grading several AI agent responses independently.\n"
+            "For each response, briefly analyze it in its 'reasoning' field, then score each criterion "
+            "as a number from 0 to 100.\n"
+            f"Return ONLY a JSON array with one object per response, each with keys: id, reasoning, {keys}.\n"
+            "Output must start with '[' and end with ']'."
+        )
+        blocks = []
+        for index, item in enumerate(items, start=1):
+            qualities = list(item.get("expected_qualities") or [])
+            blocks.append(
+                f"""### Response id={index}
+Agent role: {item.get("agent_role") or ""}
+Expected qualities: {", ".join(qualities) if qualities else "(none provided)"}
+
+User Message:
+{item.get("user_message") or ""}
+
+Agent Response:
+{item.get("agent_response") or ""}
+"""
+            )
+        judge_user = f"""Evaluate each agent response to its user message on its own merits.
+
+{_RUBRIC}
+
+Criteria:
+{self._criteria_lines()}
+
+{chr(10).join(blocks)}
+Return a JSON array of {len(items)} objects, ids 1 to {len(items)}.
+"""
+
+        text = ""
+        try:
+            result = await execute_via_litellm(
+                provider=self.provider,
+                model=self.model,
+                system=judge_system,
+                user=judge_user,
+            )
+            text = (result.get("response") or result.get("content") or result.get("text") or "").strip()
+            data = _extract_json_array(text)
+        except (LLMError, json.JSONDecodeError) as e:
+            logger.error("Batch judge evaluation failed: %s | response_snippet=%r", e, text[:240].replace("\n", " "))
+            return [None] * len(items)
+        except Exception as e:  # pragma: no cover
+            logger.exception("Unexpected batch evaluator error: %s", e)
+            return [None] * len(items)
+
+        judged: list[dict[str, float] | None] = [None] * len(items)
+        for entry in data:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                index = int(entry.get("id")) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < len(items) and judged[index] is None:
+                judged[index] = self._validated_subscores(entry)
+        return judged
+
+    def _validated_subscores(self, entry: dict[str, Any]) -> dict[str, float] | None:
+        # A missing or non-numeric score is not defaulted to 50: the judgement is discarded, so
+        # it is re-judged (batch items) or falls back to neutral scores without being cached.
+        subscores: dict[str, float] = {}
+        for k in self.EVALUATION_CRITERIA.keys():
+            value = entry.get(k)
+            if isinstance(value, bool):
+                return None
+            try:
+                v = float(value)
+            except (TypeError, ValueError):
+                return None
+            if v != v:  # NaN
+                return None
+            subscores[k] = max(0.0, min(100.0, v))
+        return subscores
+
+    async def _judge_one(
         self,
         *,
         user_message: str,
         agent_response: str,
         agent_role: str,
         expected_qualities: list[str],
-    ) -> dict[str, float]:
+    ) -> dict[str, float] | None:
+        """Single-response judge call; None when the judge fails or does not score every criterion."""
         judge_system = (
             "You are an expert evaluator grading an AI agent response.\n"
             "First, analyze the response step-by-step in your 'reasoning' field.\n"
@@ -109,17 +324,11 @@ class ResponseEvaluator:
         )
 
         qualities_text = f"Expected qualities: {', '.join(expected_qualities)}" if expected_qualities else "Expected qualities: (none provided)"
-        criteria_lines = "\n".join(
-            f"- {k}: {v['description']}" for k, v in self.EVALUATION_CRITERIA.items()
-        )
+        criteria_lines = self._criteria_lines()
 
         judge_user = f"""Evaluate a {agent_role}'s response to a user.
 
-Scoring rubric (0-100):
-- 0-30: Poor (fails criterion significantly)
-- 31-60: Adequate (meets criterion partially)
-- 61-85: Good (meets criterion well)
-- 86-100: Excellent (exceeds criterion)
+{_RUBRIC}
 
 Criteria:
 {criteria_lines}
@@ -151,16 +360,22 @@ Return JSON with reasoning and scores.
             except Exception:
                 snippet = "<unavailable>"
             logger.error("Judge evaluation failed: %s | response_snippet=%r", e, snippet)
-            return {k: 50.0 for k in self.EVALUATION_CRITERIA.keys()}
+            return None
         except Exception as e:  # pragma: no cover
             logger.exception("Unexpected evaluator error: %s", e)
-            return {k: 50.0 for k in self.EVALUATION_CRITERIA.keys()}
+            return None
 
-        subscores: dict[str, float] = {}
-        for k in self.EVALUATION_CRITERIA.keys():
-            try:
-                v = float(data.get(k, 50.0))
-            except Exception:
-                v = 50.0
-            subscores[k] = max(0.0, min(100.0, v))
+        subscores = self._validated_subscores(data)
+        if subscores is None:
+            logger.error("Judge evaluation returned incomplete scores: %r", {k: data.get(k) for k in self.EVALUATION_CRITERIA})
         return subscores
+
+
+def _cache_get_many(keys: list[str]) -> dict[str, dict[str, float]]:
+    with SessionLocal() as db:
+        return JudgeCacheStore(db).get_many(keys)
+
+
+def _cache_put_many(entries: dict[str, dict[str, float]], **kwargs: Any) -> None:
+    with SessionLocal() as db:
+        JudgeCacheStore(db).put_many(entries, **kwargs)
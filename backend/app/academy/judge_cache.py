@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+import json
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Rows from other rubric versions are deleted on every Nth write instead of by a separate job.
+_SWEEP_EVERY = 200
+
+
+def judge_cache_key(
+    *,
+    judge_provider: str,
+    judge_model: str,
+    rubric_version: int,
+    agent_role: str,
+    user_message: str,
+    agent_response: str,
+    expected_qualities: list[str],
+) -> str:
+    """
+    Cache key of a judgement: the judge, the rubric version and everything the judge prompt
+    shows about the response. The agent role is part of the prompt, so it is part of the key.
+    """
+    payload = json.dumps(
+        [judge_provider, judge_model, int(rubric_version), agent_role, user_message, agent_response, list(expected_qualities)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JudgeCacheStore:
+    """
+    Judge subscores in `academy_judge_cache`, shared by every trainer and retraining run.
+
+    Entries do not expire: a judgement only changes with the judge model or the rubric, and
+    both are in the key. Only valid judgements are stored, never the neutral fallback scores.
+    """
+
+    _writes = 0
+
+    def __init__(self, db: Session) -> None:
+        self.db = db
+
+    def get_many(self, cache_keys: list[str]) -> dict[str, dict[str, float]]:
+        if not cache_keys:
+            return {}
+        rows = self.db.execute(
+            text(
+                """
+                update academy_judge_cache
+                set hits = hits + 1, last_hit_at = now()
+                where cache_key = any(:cache_keys)
+                returning cache_key, subscores;
+                """
+            ),
+            {"cache_keys": list(dict.fromkeys(cache_keys))},
+        ).all()
+        self.db.commit()
+        return {str(row[0]): dict(row[1] or {}) for row in rows}
+
+    def put_many(
+        self,
+        entries: dict[str, dict[str, float]],
+        *,
+        judge_provider: str,
+        judge_model: str,
+        rubric_version: int,
+    ) -> None:
+        if not entries:
+            return
+        self.db.execute(
+            text(
+                """
+                insert into academy_judge_cache (cache_key, judge_provider, judge_model, rubric_version, subscores, created_at)
+                values (:cache_key, :judge_provider, :judge_model, :rubric_version, cast(:subscores as jsonb), now())
+                on conflict (cache_key) do update set
+                  subscores = excluded.subscores,
+                  created_at = excluded.created_at;
+                """
+            ),
+            [
+                {
+                    "cache_key": cache_key,
+                    "judge_provider": judge_provider,
+                    "judge_model": judge_model,
+                    "rubric_version": int(rubric_version),
+                    "subscores": json.dumps(subscores),
+                }
+                for cache_key, subscores in entries.items()
+            ],
+        )
+        JudgeCacheStore._writes += 1
+        if JudgeCacheStore._writes % _SWEEP_EVERY == 0:
+            self.db.execute(
+                text("delete from academy_judge_cache where rubric_version <> :rubric_version;"),
+                {"rubric_version": int(rubric_version)},
+            )
+        self.db.commit()
@@ -1,23 +1,29 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Mapping, Sequence
 
 import anyio
 from sqlalchemy import select, text
+from sqlalchemy.orm import Session
 
 from app.academy.evaluator import ResponseEvaluator
 from app.db import SessionLocal
 from app.llm.litellm_client import LLMError, execute_via_litellm
 from app.models import AgentCatalog
 from app.schema import ensure_schema
+from app.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Progress is flushed at least this often even when results arrive slowly.
+_FLUSH_INTERVAL_S = 5.0
+
 
 @dataclass(frozen=True)
 class TrainingResult:
@@ -25,23 +31,38 @@ class TrainingResult:
     agent_code: str
     human_name: str | None
     conversations: int
+    failed_conversations: int
     avg_quality_score: float
     high_scores: int
     low_scores: int
 
 
+class _PipelineFailed:
+    """Queued when the pipeline itself (not a single scenario) fails."""
+
+    def __init__(self, error: BaseException | None) -> None:
+        self.error = error or RuntimeError("Training pipeline failed")
+
+
 class SyntheticTrainer:
     """Runs synthetic training conversations for agents and stores evaluation results."""
 
     def __init__(self) -> None:
         self.evaluator = ResponseEvaluator()
+        self._semaphores: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = {}
 
     async def train_agent(
         self,
         *,
         agent_code: str,
         conversation_count: int = 100,
+        judge_batch_size: int | None = None,
     ) -> dict[str, Any]:
+        """
+        Run up to `conversation_count` scenarios for an agent and store their evaluations.
+
+        `judge_batch_size` responses are scored per judge call (ACADEMY_JUDGE_BATCH_SIZE by default).
+        """
         conversation_count = max(1, min(500, int(conversation_count)))
         started = time.time()
 
@@ -101,74 +122,46 @@ class SyntheticTrainer:
             high_scores = 0
             low_scores = 0
             completed = 0
+            failed = 0
+            pending_rows: list[dict[str, Any]] = []
+            flush_every = max(1, int(settings.academy_results_flush_every))
+            last_flush = time.monotonic()
 
+            # One agent-call task per scenario; finished responses are judged in batches of
+            # judge_batch_size. Agent and judge slots are bounded separately, so judging overlaps
+            # the remaining agent calls. Each scenario puts exactly one outcome on the queue.
+            outcomes: asyncio.Queue = asyncio.Queue()
+            tasks: list[asyncio.Task] = []
+            feeder = asyncio.create_task(
+                self._feed_pipeline(
+                    agent=agent,
+                    scenarios=scenarios,
+                    judge_batch_size=max(1, int(judge_batch_size or settings.academy_judge_batch_size)),
+                    outcomes=outcomes,
+                    tasks=tasks,
+                )
+            )
+            feeder.add_done_callback(
+                lambda t: outcomes.put_nowait(_PipelineFailed(t.exception()))
+                if not t.cancelled() and t.exception() is not None
+                else None
+            )
+            tasks.append(feeder)
             try:
-                for idx, s in enumerate(scenarios, start=1):
-                    user_message = (s.get("user_message") or "").strip()
-                    expected_qualities = list(s.get("expected_qualities") or [])
-
-                    if not user_message:
-                        continue
-
-                    try:
-                        system = (agent.system_prompt or "").strip() or f"You are {agent.name}."
-                        agent_llm = await execute_via_litellm(
-                            provider=agent.llm_provider or "",
-                            model=agent.llm_model or "",
-                            system=system,
-                            user=user_message,
-                        )
-                        response_text = (agent_llm.get("response") or "").strip()
-                        if not response_text:
-                            raise LLMError("Agent returned an empty response.")
-
-                        evaluation = await self.evaluator.evaluate(
-                            user_message=user_message,
-                            agent_response=response_text,
-                            agent_role=agent.name or agent.code,
-                            expected_qualities=expected_qualities,
-                        )
-                        quality_score = float(evaluation.get("overall") or 0.0)
-                        subscores = evaluation.get("subscores") or {}
-
-                        db.execute(
-                            text(
-                                """
-                                insert into evaluation_results (
-                                  training_session_id,
-                                  scenario_id,
-                                  agent_code,
-                                  user_message,
-                                  agent_response,
-                                  quality_score,
-                                  subscores,
-                                  evaluated_at
-                                )
-                                values (
-                                  :training_session_id,
-                                  :scenario_id,
-                                  :agent_code,
-                                  :user_message,
-                                  :agent_response,
-                                  :quality_score,
-                                  cast(:subscores as jsonb),
-                                  :evaluated_at
-                                );
-                                """
-                            ),
-                            {
-                                "training_session_id": session_id,
-                                "scenario_id": str(s["id"]),
-                                "agent_code": agent_code,
-                                "user_message": user_message,
-                                "agent_response": response_text,
-                                "quality_score": quality_score,
-                                "subscores": json.dumps(subscores),
-                                "evaluated_at": datetime.now(timezone.utc),
-                            },
-                        )
-                        db.commit()
+                for idx in range(1, len(scenarios) + 1):
+                    outcome = await outcomes.get()
+                    if isinstance(outcome, _PipelineFailed):
+                        raise outcome.error
+                    if isinstance(outcome, Exception):
+                        logger.error("Error in scenario %s/%s for %s: %s", idx, len(scenarios), agent_code, outcome)
+                        failed += 1
+                        row = None
+                    else:
+                        row = outcome
 
+                    if row is not None:
+                        pending_rows.append(row)
+                        quality_score = float(row["quality_score"])
                         total_quality += quality_score
                         completed += 1
                         if quality_score >= 85:
@@ -176,19 +169,24 @@ class SyntheticTrainer:
                         elif quality_score < 60:
                             low_scores += 1
 
-                        if idx % 10 == 0:
-                            avg_so_far = total_quality / max(1, completed)
-                            logger.info(
-                                "Synthetic training %s: %s/%s complete (avg %.1f)",
-                                agent_code,
-                                idx,
-                                len(scenarios),
-                                avg_so_far,
-                            )
-                    except Exception as e:
-                        logger.error("Error in scenario %s/%s for %s: %s", idx, len(scenarios), agent_code, e)
-                        db.rollback()
-                        continue
+                    if (
+                        len(pending_rows) >= flush_every
+                        or idx == len(scenarios)
+                        or time.monotonic() - last_flush >= _FLUSH_INTERVAL_S
+                    ):
+                        self._flush_results(db, session_id=session_id, rows=pending_rows, completed=completed, failed=failed)
+                        pending_rows = []
+                        last_flush = time.monotonic()
+
+                    if idx % 10 == 0:
+                        avg_so_far = total_quality / max(1, completed)
+                        logger.info(
+                            "Synthetic training %s: %s/%s complete (avg %.1f)",
+                            agent_code,
+                            idx,
+                            len(scenarios),
+                            avg_so_far,
+                        )
 
                 avg_quality = total_quality / completed if completed else 0.0
 
@@ -207,12 +205,13 @@ class SyntheticTrainer:
                 db.commit()
 
                 logger.info(
-                    "Training complete for %s: avg=%.1f, high=%s, low=%s, conversations=%s, elapsed=%.1fs",
+                    "Training complete for %s: avg=%.1f, high=%s, low=%s, conversations=%s, failed=%s, elapsed=%.1fs",
                     agent_code,
                     avg_quality,
                     high_scores,
                     low_scores,
                     completed,
+                    failed,
                     time.time() - started,
                 )
 
@@ -221,6 +220,7 @@ class SyntheticTrainer:
                     agent_code=agent_code,
                     human_name=agent.human_name,
                     conversations=completed,
+                    failed_conversations=failed,
                     avg_quality_score=round(avg_quality, 2),
                     high_scores=high_scores,
                     low_scores=low_scores,
@@ -241,3 +241,147 @@ class SyntheticTrainer:
                 )
                 db.commit()
                 raise
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def _feed_pipeline(
+        self,
+        *,
+        agent: AgentCatalog,
+        scenarios: Sequence[Mapping[str, Any]],
+        judge_batch_size: int,
+        outcomes: asyncio.Queue,
+        tasks: list[asyncio.Task],
+    ) -> None:
+        """Start the agent calls and hand their responses to judge batches as they finish."""
+        agent_tasks = [asyncio.create_task(self._agent_response(agent=agent, scenario=s)) for s in scenarios]
+        tasks.extend(agent_tasks)
+        ready: list[dict[str, Any]] = []
+        for next_done in asyncio.as_completed(agent_tasks):
+            try:
+                item = await next_done
+            except Exception as e:
+                outcomes.put_nowait(e)
+                continue
+            if item is None:
+                outcomes.put_nowait(None)
+                continue
+            ready.append(item)
+            if len(ready) >= judge_batch_size:
+                tasks.append(asyncio.create_task(self._judge(agent=agent, batch=ready, outcomes=outcomes)))
+                ready = []
+        if ready:
+            tasks.append(asyncio.create_task(self._judge(agent=agent, batch=ready, outcomes=outcomes)))
+
+    async def _agent_response(self, *, agent: AgentCatalog, scenario: Mapping[str, Any]) -> dict[str, Any] | None:
+        user_message = (scenario.get("user_message") or "").strip()
+        if not user_message:
+            return None
+
+        system = (agent.system_prompt or "").strip() or f"You are {agent.name}."
+        async with self._slots("agent", settings.academy_agent_concurrency):
+            agent_llm = await execute_via_litellm(
+                provider=agent.llm_provider or "",
+                model=agent.llm_model or "",
+                system=system,
+                user=user_message,
+            )
+        response_text = (agent_llm.get("response") or "").strip()
+        if not response_text:
+            raise LLMError("Agent returned an empty response.")
+        return {
+            "scenario_id": str(scenario["id"]),
+            "user_message": user_message,
+            "agent_response": response_text,
+            "expected_qualities": list(scenario.get("expected_qualities") or []),
+        }
+
+    async def _judge(self, *, agent: AgentCatalog, batch: list[dict[str, Any]], outcomes: asyncio.Queue) -> None:
+        """Judge a batch of responses with one call and queue their `evaluation_results` rows."""
+        try:
+            async with self._slots("judge", settings.academy_judge_concurrency):
+                evaluations = await self.evaluator.evaluate_many(
+                    [
+                        {
+                            "user_message": item["user_message"],
+                            "agent_response": item["agent_response"],
+                            "agent_role": agent.name or agent.code,
+                            "expected_qualities": item["expected_qualities"],
+                        }
+                        for item in batch
+                    ],
+                    batch_size=len(batch),
+                )
+        except Exception as e:
+            for _ in batch:
+                outcomes.put_nowait(e)
+            return
+        for item, evaluation in zip(batch, evaluations):
+            outcomes.put_nowait(
+                {
+                    "scenario_id": item["scenario_id"],
+                    "agent_code": agent.code,
+                    "user_message": item["user_message"],
+                    "agent_response": item["agent_response"],
+                    "quality_score": float(evaluation.get("overall") or 0.0),
+                    "subscores": json.dumps(evaluation.get("subscores") or {}),
+                    "evaluated_at": datetime.now(timezone.utc),
+                }
+            )
+
+    def _slots(self, kind: str, limit: int) -> asyncio.Semaphore:
+        # Shared by every train_agent call on this trainer, so BatchTrainer's concurrent agents
+        # draw from one budget. Rebuilt when a script starts a new event loop.
+        loop = asyncio.get_running_loop()
+        current = self._semaphores.get(kind)
+        if current is None or current[0] is not loop:
+            current = (loop, asyncio.Semaphore(max(1, int(limit))))
+            self._semaphores[kind] = current
+        return current[1]
+
+    def _flush_results(
+        self, db: Session, *, session_id: str, rows: list[dict[str, Any]], completed: int, failed: int
+    ) -> None:
+        """Insert a batch of results and publish the session's progress in one commit."""
+        if rows:
+            db.execute(
+                text(
+                    """
+                    insert into evaluation_results (
+                      training_session_id,
+                      scenario_id,
+                      agent_code,
+                      user_message,
+                      agent_response,
+                      quality_score,
+                      subscores,
+                      evaluated_at
+                    )
+                    values (
+                      :training_session_id,
+                      :scenario_id,
+                      :agent_code,
+                      :user_message,
+                      :agent_response,
+                      :quality_score,
+                      cast(:subscores as jsonb),
+                      :evaluated_at
+                    );
+                    """
+                ),
+                [{**row, "training_session_id": session_id} for row in rows],
+            )
+        db.execute(
+            text(
+                """
+                update training_sessions
+                set completed_interactions = :completed,
+                    failed_interactions = :failed,
+                    progress_updated_at = now()
+                where id = :id;
+                """
+            ),
+            {"completed": int(completed), "failed": int(failed), "id": session_id},
+        )
+        db.commit()
@@ -182,6 +182,9 @@ def get_training_session(session_id: UUID, db: Session = Depends(get_db)) -> dic
               started_at,
               completed_at,
               total_interactions,
+              completed_interactions,
+              failed_interactions,
+              progress_updated_at,
               avg_quality_score,
               status,
               improvement_notes,
@@ -196,7 +199,7 @@ def get_training_session(session_id: UUID, db: Session = Depends(get_db)) -> dic
         raise HTTPException(status_code=404, detail="Training session not found")
 
     data = dict(row)
-    for k in ("started_at", "completed_at"):
+    for k in ("started_at", "completed_at", "progress_updated_at"):
         v = data.get(k)
         if hasattr(v, "isoformat"):
             data[k] = v.isoformat()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from typing import Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.db import get_db
+from app.integrations.delivery import OutboundDeliveryStore, delivery_worker
+
+router = APIRouter()
+
+DeliveryStatus = Literal["pending", "sending", "retrying", "delivered", "dead"]
+
+
+@router.get("/v1/deliveries")
+def list_deliveries(
+    status: DeliveryStatus | None = None,
+    workflow_id: str | None = None,
+    limit: int = Query(default=50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+) -> list[dict]:
+    org_id = (x_org_id or "org_test").strip()
+    return OutboundDeliveryStore(db).list(org_id=org_id, status=status, workflow_id=workflow_id, limit=limit)
+
+
+@router.get("/v1/deliveries/dead-letters")
+def list_dead_letters(
+    limit: int = Query(default=50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+) -> list[dict]:
+    org_id = (x_org_id or "org_test").strip()
+    return OutboundDeliveryStore(db).list_dead_letters(org_id=org_id, limit=limit)
+
+
+@router.get("/v1/deliveries/{delivery_id}")
+def get_delivery(delivery_id: UUID, db: Session = Depends(get_db), x_org_id: str | None = Header(default=None, alias="X-Org-Id")) -> dict:
+    org_id = (x_org_id or "org_test").strip()
+    delivery = OutboundDeliveryStore(db).get(str(delivery_id), org_id=org_id)
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return delivery
+
+
+@router.post("/v1/deliveries/{delivery_id}/retry")
+def retry_delivery(delivery_id: UUID, db: Session = Depends(get_db), x_org_id: str | None = Header(default=None, alias="X-Org-Id")) -> dict:
+    """Re-queue a dead-lettered delivery with a fresh attempt budget."""
+    org_id = (x_org_id or "org_test").strip()
+    store = OutboundDeliveryStore(db)
+    if not store.requeue(str(delivery_id), org_id=org_id):
+        if not store.get(str(delivery_id), org_id=org_id):
+            raise HTTPException(status_code=404, detail="Delivery not found")
+        raise HTTPException(status_code=409, detail="Only dead-lettered deliveries can be retried")
+    delivery_worker.wake()
+    return {"ok": True, "delivery_id": str(delivery_id), "status": "pending"}
@@ -1,18 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 from pathlib import Path
+from typing import Any
 import uuid
 
+import anyio
 from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, UploadFile
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from app.db import get_db
-from app.files.extractors import extract_file_content
+from app.files.executor import EXTRACTION_HEARTBEAT_S, extraction_executor
+from app.files.images import remove_image_variants
+from app.retrieval import knowledge_index
 from app.settings import settings
 
 router = APIRouter()
 
+_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
 ALLOWED_EXTENSIONS = {".pdf", ".docx", ".xlsx", ".csv", ".txt", ".md", ".json", ".png", ".jpg", ".jpeg", ".webp"}
 
 
@@ -23,6 +31,175 @@ def _ensure_org(org_id: str, db: Session) -> None:
     )
 
 
+async def _stream_to_disk(upload: UploadFile, destination: Path, max_bytes: int) -> tuple[int, str]:
+    """
+    Copy an upload to `destination` in fixed-size chunks, hashing as it goes.
+
+    Memory stays at one chunk per upload; the size limit is enforced as bytes arrive and a
+    partial file is never left behind under the final name.
+    """
+    partial = destination.with_name(destination.name + ".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(partial, "wb") as handle:
+            while True:
+                chunk = await upload.read(_UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File too large. Max {settings.upload_max_size_mb}MB")
+                digest.update(chunk)
+                await handle.write(chunk)
+        await anyio.Path(partial).rename(destination)
+    except BaseException:
+        await anyio.Path(partial).unlink(missing_ok=True)
+        raise
+    return size, digest.hexdigest()
+
+
+def _stale_extraction_s() -> float:
+    # Queued and running extractions heartbeat their row; one silent this long lost its worker.
+    return EXTRACTION_HEARTBEAT_S * 4
+
+
+def _blob_path(upload_root: Path, sha256: str, suffix: str) -> Path:
+    return upload_root / "blobs" / sha256[:2] / f"{sha256}{suffix}"
+
+
+def _register_upload(
+    db: Session,
+    *,
+    file_id: str,
+    org_id: str,
+    filename: str,
+    file_type: str,
+    staging_path: Path,
+    stored_path: Path,
+    sha256: str,
+    file_size: int,
+    uploaded_by: str,
+) -> dict[str, Any]:
+    """
+    Record an upload whose bytes sit at `staging_path`, storing them once per hash, and commit.
+
+    The hash is claimed first: a concurrent first upload of the same content blocks on the
+    insert until this transaction commits, then finds the row and reuses its blob path.
+    """
+    _ensure_org(org_id, db)
+    claimed = db.execute(
+        text(
+            """
+            insert into file_blobs (sha256, blob_path, file_size, extracted_text, extraction_status, created_at)
+            values (:sha256, :blob_path, :file_size, '', 'pending', now())
+            on conflict (sha256) do nothing
+            returning sha256;
+            """
+        ),
+        {"sha256": sha256, "blob_path": str(stored_path), "file_size": file_size},
+    ).first()
+    blob = None
+    deduplicated = False
+    if claimed:
+        stored_path.parent.mkdir(parents=True, exist_ok=True)
+        staging_path.rename(stored_path)
+        extraction_status = "pending"
+        needs_extraction = True
+    else:
+        # Locking the blob row orders this upload against a delete dropping the last reference.
+        blob = db.execute(
+            text(
+                """
+                select
+                  blob_path,
+                  extracted_text,
+                  extraction_status,
+                  extraction_status in ('pending', 'running')
+                    and coalesce(extraction_heartbeat_at, extraction_started_at, created_at)
+                      < now() - make_interval(secs => :stale_s) as stale
+                from file_blobs
+                where sha256 = :sha256
+                for update;
+                """
+            ),
+            {"sha256": sha256, "stale_s": _stale_extraction_s()},
+        ).mappings().first()
+        stored_path = Path(str(blob["blob_path"]))
+        extraction_status = str(blob["extraction_status"])
+        deduplicated = stored_path.exists()
+        if deduplicated:
+            staging_path.unlink(missing_ok=True)
+            # Re-run extractions that were cancelled or orphaned by a worker that went away.
+            needs_extraction = extraction_status == "cancelled" or (
+                bool(blob["stale"]) and not extraction_executor.is_running(sha256)
+            )
+        else:
+            # The blob file went missing; restore it at the recorded path.
+            stored_path.parent.mkdir(parents=True, exist_ok=True)
+            staging_path.rename(stored_path)
+            needs_extraction = True
+        if needs_extraction:
+            extraction_status = "pending"
+            db.execute(
+                text(
+                    """
+                    update file_blobs
+                    set extraction_status = 'pending',
+                        extraction_error = null,
+                        extraction_started_at = null,
+                        extraction_heartbeat_at = now()
+                    where sha256 = :sha256;
+                    """
+                ),
+                {"sha256": sha256},
+            )
+
+    row = db.execute(
+        text(
+            """
+            insert into uploaded_files
+              (file_id, org_id, filename, file_path, file_type, file_size, sha256, extracted_text, uploaded_by, uploaded_at, is_active)
+            values
+              (cast(:file_id as uuid), :org_id, :filename, :file_path, :file_type, :file_size, :sha256, '', :uploaded_by, now(), true)
+            returning file_id, org_id, filename, file_type, file_size, sha256, uploaded_at;
+            """
+        ),
+        {
+            "file_id": file_id,
+            "org_id": org_id,
+            "filename": filename,
+            "file_path": str(stored_path),
+            "file_type": file_type,
+            "file_size": file_size,
+            "sha256": sha256,
+            "uploaded_by": uploaded_by,
+        },
+    ).mappings().first()
+    chunk_ids, vectors = [], None
+    if extraction_status == "completed" and blob and blob["extracted_text"]:
+        chunk_ids, vectors = knowledge_index.write_chunks(
+            db,
+            source_type="file",
+            source_id=file_id,
+            org_id=org_id,
+            title=filename,
+            content=str(blob["extracted_text"]),
+            category=None,
+            source_hash=sha256,
+        )
+    db.commit()
+    return {
+        "row": row,
+        "stored_path": stored_path,
+        "deduplicated": deduplicated,
+        "extraction_status": extraction_status,
+        "needs_extraction": needs_extraction,
+        "chunk_ids": chunk_ids,
+        "vectors": vectors,
+    }
+
+
 @router.post("/v1/files/upload")
 async def upload_file(
     file: UploadFile = File(...),
@@ -40,53 +217,54 @@ async def upload_file(
     if suffix not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"Unsupported file type: {suffix}")
 
-    content = await file.read()
-    if len(content) > int(settings.upload_max_size_mb) * 1024 * 1024:
-        raise HTTPException(status_code=413, detail=f"File too large. Max {settings.upload_max_size_mb}MB")
-
     file_id = str(uuid.uuid4())
     upload_root = Path(settings.upload_dir).resolve()
-    org_dir = upload_root / effective_org
-    org_dir.mkdir(parents=True, exist_ok=True)
-    stored_name = f"{file_id}{suffix}"
-    stored_path = org_dir / stored_name
-    stored_path.write_bytes(content)
+    staging_path = upload_root / "tmp" / f"{file_id}{suffix}"
+    await anyio.Path(staging_path.parent).mkdir(parents=True, exist_ok=True)
+    file_size, sha256 = await _stream_to_disk(file, staging_path, int(settings.upload_max_size_mb) * 1024 * 1024)
 
-    extracted_text = ""
+    # The claim holds a row lock until commit, so it runs in a thread with the file move and
+    # the commit: a second upload of the same bytes waits there, not on the event loop.
     try:
-        extracted_text = extract_file_content(stored_path, file.content_type or "", filename)
+        registered = await asyncio.to_thread(
+            _register_upload,
+            db,
+            file_id=file_id,
+            org_id=effective_org,
+            filename=filename,
+            file_type=file.content_type or suffix.replace(".", ""),
+            staging_path=staging_path,
+            stored_path=_blob_path(upload_root, sha256, suffix),
+            sha256=sha256,
+            file_size=file_size,
+            uploaded_by=uploaded_by,
+        )
     except Exception:
-        extracted_text = ""
-
-    _ensure_org(effective_org, db)
-    row = db.execute(
-        text(
-            """
-            insert into uploaded_files
-              (file_id, org_id, filename, file_path, file_type, file_size, extracted_text, uploaded_by, uploaded_at, is_active)
-            values
-              (cast(:file_id as uuid), :org_id, :filename, :file_path, :file_type, :file_size, :extracted_text, :uploaded_by, now(), true)
-            returning file_id, org_id, filename, file_type, file_size, uploaded_at;
-            """
-        ),
-        {
-            "file_id": file_id,
-            "org_id": effective_org,
-            "filename": filename,
-            "file_path": str(stored_path),
-            "file_type": file.content_type or suffix.replace(".", ""),
-            "file_size": len(content),
-            "extracted_text": extracted_text[:100_000],
-            "uploaded_by": uploaded_by,
-        },
-    ).mappings().first()
-    db.commit()
+        await anyio.Path(staging_path).unlink(missing_ok=True)
+        raise
+    row = registered["row"]
+    if registered["chunk_ids"]:
+        knowledge_index.publish(
+            org_id=effective_org,
+            source_type="file",
+            source_id=file_id,
+            keys=registered["chunk_ids"],
+            vectors=registered["vectors"],
+        )
+    if registered["needs_extraction"]:
+        # Extraction runs in the process pool; clients poll GET /v1/files/{file_id}.
+        extraction_executor.submit(
+            sha256=sha256, path=registered["stored_path"], mime_type=file.content_type or "", filename=filename
+        )
     return {
         "file_id": str(row["file_id"]),
         "org_id": str(row["org_id"]),
         "filename": str(row["filename"]),
         "file_type": str(row["file_type"]),
         "file_size": int(row["file_size"] or 0),
+        "sha256": str(row["sha256"]),
+        "deduplicated": registered["deduplicated"],
+        "extraction_status": registered["extraction_status"],
         "uploaded_at": row["uploaded_at"],
     }
 
@@ -97,9 +275,43 @@ def get_file(file_id: str, db: Session = Depends(get_db), x_org_id: str | None =
     row = db.execute(
         text(
             """
-            select file_id, org_id, filename, file_type, file_size, uploaded_by, uploaded_at, is_active
-            from uploaded_files
-            where file_id = cast(:file_id as uuid) and org_id = :org_id and is_active = true
+            select
+              f.file_id, f.org_id, f.filename, f.file_type, f.file_size, f.uploaded_by, f.uploaded_at, f.is_active,
+              coalesce(b.extraction_status, 'completed') as extraction_status,
+              b.extraction_error,
+              b.image_meta
+            from uploaded_files f
+            left join file_blobs b on b.sha256 = f.sha256
+            where f.file_id = cast(:file_id as uuid) and f.org_id = :org_id and f.is_active = true
+            limit 1;
+            """
+        ),
+        {"file_id": file_id, "org_id": org_id},
+    ).mappings().first()
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+    item = dict(row)
+    image_meta = item.pop("image_meta", None) or None
+    if image_meta:
+        # Variant paths stay server-side; clients only see what was rendered.
+        item["image"] = {
+            "width": image_meta.get("width"),
+            "height": image_meta.get("height"),
+            "variant_sizes": [variant.get("size") for variant in image_meta.get("variants") or []],
+        }
+    return item
+
+
+@router.post("/v1/files/{file_id}/extraction/cancel")
+def cancel_extraction(file_id: str, db: Session = Depends(get_db), x_org_id: str | None = Header(default=None, alias="X-Org-Id")) -> dict:
+    org_id = (x_org_id or "org_test").strip()
+    row = db.execute(
+        text(
+            """
+            select f.sha256, b.extraction_status
+            from uploaded_files f
+            join file_blobs b on b.sha256 = f.sha256
+            where f.file_id = cast(:file_id as uuid) and f.org_id = :org_id and f.is_active = true
             limit 1;
             """
         ),
@@ -107,7 +319,8 @@ def get_file(file_id: str, db: Session = Depends(get_db), x_org_id: str | None =
     ).mappings().first()
     if not row:
         raise HTTPException(status_code=404, detail="File not found")
-    return dict(row)
+    cancelled = extraction_executor.cancel(str(row["sha256"]))
+    return {"ok": True, "file_id": file_id, "cancelled": cancelled, "extraction_status": "cancelled" if cancelled else row["extraction_status"]}
 
 
 @router.delete("/v1/files/{file_id}")
@@ -119,18 +332,43 @@ def delete_file(file_id: str, db: Session = Depends(get_db), x_org_id: str | Non
             update uploaded_files
             set is_active = false
             where file_id = cast(:file_id as uuid) and org_id = :org_id and is_active = true
-            returning file_path;
+            returning file_path, sha256;
             """
         ),
         {"file_id": file_id, "org_id": org_id},
     ).mappings().first()
-    db.commit()
     if not row:
+        db.commit()
         raise HTTPException(status_code=404, detail="File not found")
-    try:
-        Path(str(row["file_path"])).unlink(missing_ok=True)
-    except Exception:
-        pass
+
+    knowledge_index.remove_source(db, org_id=org_id, source_type="file", source_id=file_id)
+    if row["sha256"]:
+        # Content-addressed blob: remove it only when no active upload references the hash.
+        # The blob is unlinked while its row is still locked so a concurrent upload of the
+        # same bytes either sees the row (and keeps it alive) or re-creates the file.
+        blob = db.execute(
+            text("select blob_path from file_blobs where sha256 = :sha256 for update;"),
+            {"sha256": row["sha256"]},
+        ).mappings().first()
+        references = db.execute(
+            text("select count(*)::int from uploaded_files where sha256 = :sha256 and is_active = true;"),
+            {"sha256": row["sha256"]},
+        ).scalar_one()
+        if blob and int(references or 0) == 0:
+            extraction_executor.cancel(str(row["sha256"]))
+            db.execute(text("delete from file_blobs where sha256 = :sha256;"), {"sha256": row["sha256"]})
+            try:
+                Path(str(blob["blob_path"])).unlink(missing_ok=True)
+                remove_image_variants(Path(str(blob["blob_path"])))
+            except Exception:
+                pass
+        db.commit()
+    else:
+        db.commit()
+        try:
+            Path(str(row["file_path"])).unlink(missing_ok=True)
+        except Exception:
+            pass
     return {"ok": True, "file_id": file_id}
 
 
@@ -5,10 +5,11 @@ import asyncio
 import json
 import re
 import requests
+from typing import Literal
 import uuid
 
 from fastapi import APIRouter, Depends, Header, HTTPException
-from fastapi.responses import Response, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy import func as sqlfunc, select, text
 from sqlalchemy.orm import Session
@@ -19,6 +20,7 @@ from app.db import SessionLocal, get_db
 from app.integrations.email import email_integration
 from app.integrations.slack import slack_integration
 from app.integrations.webhook import webhook_integration
+from app.llm.intent_classifier import intent_classifier, intent_precision
 from app.llm.litellm_client import LLMError, execute_via_litellm
 from app.memory.extractor import memory_extractor
 from app.llm.multi_router import get_multi_llm_router
@@ -31,7 +33,12 @@ from app.runtime.model_policy import model_policy_service
 from app.runtime.session_manager import session_manager
 from app.runtime.tool_policy import tool_policy_service
 from app.runtime.tool_registry import ToolCallContext, tool_registry
+from app.tools.search_cache import search_cache
 from app.workflows.engine import WorkflowEngine
+from app.workflows.jobs import TERMINAL_EVENTS, workflow_jobs
+from app.workflows.plans import WorkflowPlan, workflow_plan_cache
+from app.workflows.runs import WorkflowRunStore
+from app.workflows.scheduler import ScheduleLeases, lease_seconds, next_run_at, renewing_leases, schedule_zone
 from app.schemas import AgentDetailOut, AgentOut
 from app.schemas_chat import ChatIn, ChatOut
 from app.schemas_execute import (
@@ -58,19 +65,7 @@ _OUTPUT_FORMATS = {"text", "markdown", "json", "email", "csv", "code", "presenta
 
 
 def _infer_department_from_message(message: str) -> str | None:
-    content = (message or "").lower()
-    keyword_map: dict[str, tuple[str, ...]] = {
-        "Customer Experience": ("support", "ticket", "complaint", "customer", "onboarding", "faq"),
-        "Sales & Business Development": ("lead", "prospect", "pipeline", "outreach", "closing", "sales"),
-        "Marketing & Creative": ("blog", "copy", "campaign", "social", "content", "brand"),
-        "Operations & Admin": ("calendar", "schedule", "priorities", "travel", "admin", "process"),
-        "Technical & IT": ("api", "code", "bug", "deploy", "infra", "security", "database", "sql"),
-        "Specialized Services": ("legal", "compliance", "finance", "audit", "contract", "policy"),
-    }
-    for department, keywords in keyword_map.items():
-        if any(word in content for word in keywords):
-            return department
-    return None
+    return intent_classifier.classify(message).department
 
 
 def _pick_colleague_for_department(
@@ -221,13 +216,7 @@ def _to_context_lines(context: ExecuteContext) -> list[str]:
 
 
 def _next_run_at(cron_expression: str, tz_name: str = "UTC") -> datetime | None:
-    if not croniter:
-        return None
-    base = datetime.now(timezone.utc)
-    try:
-        return croniter(cron_expression, base).get_next(datetime)
-    except Exception:
-        return None
+    return next_run_at(cron_expression, tz_name)
 
 router = APIRouter()
 
@@ -242,6 +231,11 @@ def llm_router_stats() -> dict:
     return get_multi_llm_router().cost_summary()
 
 
+@router.get("/v1/llm/intent/stats")
+def llm_intent_stats() -> dict:
+    return {"intents": intent_precision.summary()}
+
+
 @router.get("/v1/llm/router/catalog")
 def llm_router_catalog() -> dict:
     router_instance = get_multi_llm_router()
@@ -1284,6 +1278,12 @@ async def execute_agent(
                 "model_used": result.get("model_used"),
                 "search_used": bool(result.get("search_used")),
                 "docs_used": bool(result.get("docs_used")),
+                "search_triggered": bool(result.get("search_triggered")),
+                "docs_triggered": bool(result.get("docs_triggered")),
+                "search_referenced": bool(result.get("search_referenced")),
+                "docs_referenced": bool(result.get("docs_referenced")),
+                "images_attached": int(result.get("images_attached") or 0),
+                "images_dropped": int(result.get("images_dropped") or 0),
             },
         )
     )
@@ -1717,13 +1717,18 @@ def list_tools() -> dict:
     return {"tools": tool_registry.list_tools()}
 
 
+@router.get("/v1/tools/web_search/cache/stats")
+def web_search_cache_stats() -> dict:
+    return search_cache.stats()
+
+
 @router.post("/v1/tools/run")
 def run_tool(
     payload: ToolRunIn,
     x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
 ) -> dict:
     org_id = x_org_id or "org_test"
-    result = tool_registry.run(
+    result = tool_registry.run_sync(
         tool_name=payload.tool_name,
         context=ToolCallContext(org_id=org_id, session_id=payload.session_id, agent_code=payload.agent_code),
         args=payload.args,
@@ -2046,10 +2051,16 @@ class WorkflowStepIn(BaseModel):
     use_previous_response: bool = True
     conditions: dict[str, str] = Field(default_factory=dict)
     next: str | None = Field(default=None, max_length=64)
+    depends_on: list[str] | None = None
+    type: Literal["agent", "map"] | None = None
+    map_over: str | None = Field(default=None, max_length=64)
+    max_concurrency: int | None = Field(default=None, ge=1, le=64)
+    memoize: bool = True
     set_var: str | None = Field(default=None, max_length=64)
     action: str | None = Field(default=None, max_length=32)
     integration_id: str | None = Field(default=None, max_length=64)
     action_config: dict = Field(default_factory=dict)
+    wait_for_ack: bool = False
 
 
 class WorkflowExecuteIn(BaseModel):
@@ -2058,6 +2069,12 @@ class WorkflowExecuteIn(BaseModel):
     context: ExecuteContext = Field(default_factory=ExecuteContext)
     steps: list[WorkflowStepIn] = Field(min_length=1)
     workflow_definition: dict | None = None
+    execution_mode: Literal["sequential", "parallel"] = "sequential"
+    max_concurrency: int | None = Field(default=None, ge=1, le=32)
+    memoize_ttl_s: int | None = Field(default=None, ge=0)
+    step_retries: int = Field(default=0, ge=0, le=5)
+    retry_backoff_s: float = Field(default=1.0, ge=0, le=60)
+    background: bool = False
 
 
 class WorkflowStepOut(BaseModel):
@@ -2069,6 +2086,10 @@ class WorkflowStepOut(BaseModel):
     model_used: str
     latency_ms: int
     trace_id: str
+    items_total: int | None = None
+    items_failed: int | None = None
+    item_errors: list[dict] = Field(default_factory=list)
+    cached: bool = False
 
 
 class WorkflowExecuteOut(BaseModel):
@@ -2085,10 +2106,16 @@ class WorkflowTemplateStep(BaseModel):
     use_previous_response: bool = True
     conditions: dict[str, str] = Field(default_factory=dict)
     next: str | None = Field(default=None, max_length=64)
+    depends_on: list[str] | None = None
+    type: Literal["agent", "map"] | None = None
+    map_over: str | None = Field(default=None, max_length=64)
+    max_concurrency: int | None = Field(default=None, ge=1, le=64)
+    memoize: bool = True
     set_var: str | None = Field(default=None, max_length=64)
     action: str | None = Field(default=None, max_length=32)
     integration_id: str | None = Field(default=None, max_length=64)
     action_config: dict = Field(default_factory=dict)
+    wait_for_ack: bool = False
 
 
 class WorkflowTemplateIn(BaseModel):
@@ -2097,6 +2124,9 @@ class WorkflowTemplateIn(BaseModel):
     context: ExecuteContext = Field(default_factory=ExecuteContext)
     steps: list[WorkflowTemplateStep] = Field(min_length=1)
     workflow_definition: dict | None = None
+    execution_mode: Literal["sequential", "parallel"] = "sequential"
+    max_concurrency: int | None = Field(default=None, ge=1, le=32)
+    memoize_ttl_s: int | None = Field(default=None, ge=0)
     is_active: bool = True
 
 
@@ -2116,6 +2146,44 @@ class WorkflowTemplateRunIn(BaseModel):
     initial_message: str = Field(min_length=1, max_length=20000)
     session_id: str | None = Field(default=None, min_length=1, max_length=128)
     context_override: ExecuteContext | None = None
+    step_retries: int = Field(default=0, ge=0, le=5)
+    retry_backoff_s: float = Field(default=1.0, ge=0, le=60)
+    background: bool = False
+
+
+class WorkflowResumeIn(BaseModel):
+    step_retries: int = Field(default=0, ge=0, le=5)
+    retry_backoff_s: float = Field(default=1.0, ge=0, le=60)
+    background: bool = False
+
+
+class WorkflowRunStepOut(BaseModel):
+    step_index: int
+    step_id: str
+    agent_code: str
+    status: str
+    attempts: int
+    response: str
+    model_used: str
+    latency_ms: int
+    cached: bool = False
+    error_message: str | None = None
+    completed_at: datetime | None = None
+
+
+class WorkflowRunOut(BaseModel):
+    workflow_id: str
+    session_id: str
+    template_id: str | None = None
+    status: str
+    current_step_id: str | None = None
+    steps_count: int
+    final_response: str
+    error_message: str | None = None
+    started_at: datetime
+    updated_at: datetime
+    completed_at: datetime | None = None
+    steps: list[WorkflowRunStepOut]
 
 
 class WorkflowScheduleIn(BaseModel):
@@ -2183,7 +2251,13 @@ def _merge_context(base: ExecuteContext, override: ExecuteContext | None) -> Exe
     return ExecuteContext(**data)
 
 
-def _build_workflow_definition(steps: list[WorkflowStepIn]) -> dict:
+def _build_workflow_definition(
+    steps: list[WorkflowStepIn],
+    *,
+    execution_mode: str = "sequential",
+    max_concurrency: int | None = None,
+    memoize_ttl_s: int | None = None,
+) -> dict:
     built_steps: list[dict] = []
     for index, step in enumerate(steps, start=1):
         step_id = (step.id or f"step_{index}").strip()
@@ -2201,7 +2275,43 @@ def _build_workflow_definition(steps: list[WorkflowStepIn]) -> dict:
                 "action_config": dict(step.action_config or {}),
             }
         )
-    return {"start_step_id": built_steps[0]["id"] if built_steps else None, "steps": built_steps}
+        if step.depends_on is not None:
+            built_steps[-1]["depends_on"] = [item.strip() for item in step.depends_on if item.strip()]
+        if not step.memoize:
+            built_steps[-1]["memoize"] = False
+        if step.wait_for_ack:
+            built_steps[-1]["wait_for_ack"] = True
+        if step.type == "map":
+            built_steps[-1].update(
+                {"type": "map", "map_over": (step.map_over or "").strip(), "max_concurrency": step.max_concurrency}
+            )
+    definition = {"start_step_id": built_steps[0]["id"] if built_steps else None, "steps": built_steps}
+    if execution_mode != "sequential":
+        definition["execution_mode"] = execution_mode
+    if max_concurrency:
+        definition["max_concurrency"] = int(max_concurrency)
+    if memoize_ttl_s:
+        definition["memoize_ttl_s"] = int(memoize_ttl_s)
+    return definition
+
+
+def _template_plan(
+    db: Session,
+    *,
+    template_id: str,
+    updated_at: datetime | None,
+    workflow_definition: dict | None,
+    steps: list | None,
+) -> WorkflowPlan:
+    """Compiled plan for a stored template, compiled once per template version (`updated_at`)."""
+
+    def compile_template() -> WorkflowPlan:
+        definition = dict(workflow_definition or {}) or _build_workflow_definition(
+            [WorkflowStepIn(**item) for item in (steps or [])]
+        )
+        return WorkflowEngine(db).compile_plan(definition)
+
+    return workflow_plan_cache.get_or_compile(template_id, updated_at, compile_template)
 
 
 @router.post("/v1/workflows/validate")
@@ -2214,31 +2324,7 @@ def validate_workflow_definition(payload: dict, db: Session = Depends(get_db)) -
     return {"valid": len(errors) == 0, "errors": errors}
 
 
-@router.post("/v1/workflows/execute", response_model=WorkflowExecuteOut)
-async def execute_workflow(
-    payload: WorkflowExecuteIn,
-    db: Session = Depends(get_db),
-    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
-) -> WorkflowExecuteOut:
-    from fastapi import HTTPException
-
-    org_id = x_org_id or "org_test"
-    max_steps = max(1, int(settings.workflow_max_steps))
-    if len(payload.steps) > max_steps:
-        raise HTTPException(status_code=400, detail=f"Too many steps. Max allowed: {max_steps}")
-
-    workflow_id = str(uuid.uuid4())
-    session_id = payload.session_id or f"wf-{workflow_id}"
-    definition = payload.workflow_definition if isinstance(payload.workflow_definition, dict) else _build_workflow_definition(payload.steps)
-    context = payload.context
-    engine = WorkflowEngine(db)
-    final_response, step_results = await engine.execute_workflow(
-        org_id=org_id,
-        session_id=session_id,
-        initial_message=payload.initial_message,
-        context=context,
-        workflow_definition=definition,
-    )
+def _workflow_output(workflow_id: str, session_id: str, final_response: str, step_results: list) -> WorkflowExecuteOut:
     outputs = [
         WorkflowStepOut(
             step_index=item.step_index,
@@ -2249,10 +2335,13 @@ async def execute_workflow(
             model_used=item.model_used,
             latency_ms=item.latency_ms,
             trace_id=item.trace_id,
+            items_total=item.items_total,
+            items_failed=item.items_failed,
+            item_errors=item.item_errors,
+            cached=item.cached,
         )
         for item in step_results
     ]
-
     return WorkflowExecuteOut(
         workflow_id=workflow_id,
         session_id=session_id,
@@ -2261,6 +2350,298 @@ async def execute_workflow(
     )
 
 
+def _workflow_accepted(workflow_id: str, session_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        content={
+            "workflow_id": workflow_id,
+            "session_id": session_id,
+            "status": "queued",
+            "status_url": f"/v1/workflows/runs/{workflow_id}",
+            "events_url": f"/v1/workflows/runs/{workflow_id}/events",
+        },
+    )
+
+
+async def _run_workflow(
+    db: Session,
+    *,
+    org_id: str,
+    payload: WorkflowExecuteIn,
+    template_id: str | None = None,
+    schedule_id: str | None = None,
+    plan: WorkflowPlan | None = None,
+) -> WorkflowExecuteOut | JSONResponse:
+    """
+    Create a checkpointed workflow_runs row and execute it; failures keep the row resumable.
+
+    Template runs pass their cached `plan`; ad-hoc payloads are compiled here. With
+    `payload.background` the run is handed to the job pool and a 202 is returned at once.
+    """
+    if plan is None:
+        max_steps = max(1, int(settings.workflow_max_steps))
+        if len(payload.steps) > max_steps:
+            raise HTTPException(status_code=400, detail=f"Too many steps. Max allowed: {max_steps}")
+        definition = (
+            payload.workflow_definition
+            if isinstance(payload.workflow_definition, dict)
+            else _build_workflow_definition(
+                payload.steps,
+                execution_mode=payload.execution_mode,
+                max_concurrency=payload.max_concurrency,
+                memoize_ttl_s=payload.memoize_ttl_s,
+            )
+        )
+        plan = WorkflowEngine(db).compile_plan(definition)
+    else:
+        definition = plan.definition()
+
+    workflow_id = str(uuid.uuid4())
+    session_id = payload.session_id or f"wf-{workflow_id}"
+    db.execute(
+        text("insert into organizations (org_id, name) values (:org_id, :name) on conflict (org_id) do nothing"),
+        {"org_id": org_id, "name": ""},
+    )
+    WorkflowRunStore(db).create_run(
+        workflow_id=workflow_id,
+        org_id=org_id,
+        session_id=session_id,
+        initial_message=payload.initial_message,
+        context=payload.context.model_dump(),
+        workflow_definition=definition,
+        template_id=template_id,
+        schedule_id=schedule_id,
+        status="queued" if payload.background else "running",
+    )
+    if payload.background:
+        workflow_jobs.submit(
+            workflow_id=workflow_id,
+            org_id=org_id,
+            session_id=session_id,
+            initial_message=payload.initial_message,
+            context=payload.context,
+            workflow_definition=definition,
+            plan=plan,
+            step_retries=payload.step_retries,
+            retry_backoff_s=payload.retry_backoff_s,
+        )
+        return _workflow_accepted(workflow_id, session_id)
+    engine = WorkflowEngine(db)
+    try:
+        final_response, step_results = await engine.execute_workflow(
+            org_id=org_id,
+            session_id=session_id,
+            initial_message=payload.initial_message,
+            context=payload.context,
+            plan=plan,
+            workflow_id=workflow_id,
+            step_retries=payload.step_retries,
+            retry_backoff_s=payload.retry_backoff_s,
+        )
+    except HTTPException as exc:
+        # The run stays resumable via POST /v1/workflows/runs/{workflow_id}/resume.
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail, headers={"X-Workflow-Id": workflow_id}) from exc
+    return _workflow_output(workflow_id, session_id, final_response, step_results)
+
+
+@router.post("/v1/workflows/execute", response_model=WorkflowExecuteOut)
+async def execute_workflow(
+    payload: WorkflowExecuteIn,
+    db: Session = Depends(get_db),
+    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+) -> WorkflowExecuteOut:
+    org_id = x_org_id or "org_test"
+    return await _run_workflow(db, org_id=org_id, payload=payload)
+
+
+@router.get("/v1/workflows/runs/{workflow_id}", response_model=WorkflowRunOut)
+def get_workflow_run(
+    workflow_id: str,
+    db: Session = Depends(get_db),
+    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+) -> WorkflowRunOut:
+    org_id = x_org_id or "org_test"
+    store = WorkflowRunStore(db)
+    run = store.get_run(workflow_id, org_id=org_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Workflow run not found")
+    return WorkflowRunOut(
+        workflow_id=str(run["workflow_id"]),
+        session_id=str(run["session_id"]),
+        template_id=str(run["template_id"]) if run["template_id"] else None,
+        status=str(run["status"]),
+        current_step_id=run["current_step_id"],
+        steps_count=int(run["steps_count"] or 0),
+        final_response=str(run["final_response"] or ""),
+        error_message=run["error_message"],
+        started_at=run["started_at"],
+        updated_at=run["updated_at"],
+        completed_at=run["completed_at"],
+        steps=[
+            WorkflowRunStepOut(
+                step_index=int(row["step_index"]),
+                step_id=str(row["step_id"]),
+                agent_code=str(row["agent_code"] or ""),
+                status=str(row["status"]),
+                attempts=int(row["attempts"] or 0),
+                response=str(row["response"] or ""),
+                model_used=str(row["model_used"] or ""),
+                latency_ms=int(row["latency_ms"] or 0),
+                cached=bool((row["result"] or {}).get("cached")),
+                error_message=row["error_message"],
+                completed_at=row["completed_at"],
+            )
+            for row in store.list_steps(workflow_id)
+        ],
+    )
+
+
+@router.post("/v1/workflows/runs/{workflow_id}/resume", response_model=WorkflowExecuteOut)
+async def resume_workflow_run(
+    workflow_id: str,
+    payload: WorkflowResumeIn | None = None,
+    db: Session = Depends(get_db),
+    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+) -> WorkflowExecuteOut:
+    """Continue a failed or cancelled run from its first unfinished step; finished steps are not re-run."""
+    org_id = x_org_id or "org_test"
+    options = payload or WorkflowResumeIn()
+    store = WorkflowRunStore(db)
+    run = store.get_run(workflow_id, org_id=org_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Workflow run not found")
+    if not run["workflow_definition"]:
+        raise HTTPException(status_code=409, detail="Workflow run predates checkpointing and cannot be resumed")
+    if not store.mark_running(workflow_id, status="queued" if options.background else "running"):
+        raise HTTPException(status_code=409, detail=f"Workflow run is {run['status']}; only failed or cancelled runs can resume")
+
+    if options.background:
+        workflow_jobs.submit(
+            workflow_id=workflow_id,
+            org_id=org_id,
+            session_id=str(run["session_id"]),
+            initial_message=str(run["initial_message"] or ""),
+            context=ExecuteContext(**(run["context"] or {})),
+            workflow_definition=dict(run["workflow_definition"]),
+            step_retries=options.step_retries,
+            retry_backoff_s=options.retry_backoff_s,
+            resume=True,
+        )
+        return _workflow_accepted(workflow_id, str(run["session_id"]))
+
+    engine = WorkflowEngine(db)
+    final_response, step_results = await engine.execute_workflow(
+        org_id=org_id,
+        session_id=str(run["session_id"]),
+        initial_message=str(run["initial_message"] or ""),
+        context=ExecuteContext(**(run["context"] or {})),
+        workflow_definition=dict(run["workflow_definition"]),
+        workflow_id=workflow_id,
+        resume=True,
+        step_retries=options.step_retries,
+        retry_backoff_s=options.retry_backoff_s,
+    )
+    return _workflow_output(workflow_id, str(run["session_id"]), final_response, step_results)
+
+
+@router.post("/v1/workflows/runs/{workflow_id}/cancel")
+def cancel_workflow_run(
+    workflow_id: str,
+    db: Session = Depends(get_db),
+    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+) -> dict:
+    org_id = x_org_id or "org_test"
+    store = WorkflowRunStore(db)
+    run = store.get_run(workflow_id, org_id=org_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Workflow run not found")
+    # The flag reaches the owning worker's cancel poll; a local job is also cancelled directly.
+    status = store.request_cancel(workflow_id)
+    if status is None:
+        raise HTTPException(status_code=409, detail=f"Workflow run is {run['status']}; nothing to cancel")
+    cancelled_locally = workflow_jobs.cancel(workflow_id)
+    return {"ok": True, "workflow_id": workflow_id, "status": "cancelling", "cancelled_locally": cancelled_locally}
+
+
+def _run_progress(workflow_id: str) -> tuple[dict | None, list[dict]]:
+    with SessionLocal() as db:
+        store = WorkflowRunStore(db)
+        return store.get_run(workflow_id), store.list_steps(workflow_id)
+
+
+@router.get("/v1/workflows/runs/{workflow_id}/events")
+async def stream_workflow_run_events(
+    workflow_id: str,
+    db: Session = Depends(get_db),
+    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+):
+    """
+    SSE stream of a run's events: step_started, step_completed, step_failed, token, run_*.
+
+    Jobs owned by this worker stream live (history is replayed first). For runs owned by
+    another worker, progress is polled from workflow_run_steps, so only step_completed and
+    the final run_* event are available there.
+    """
+    org_id = x_org_id or "org_test"
+    run = WorkflowRunStore(db).get_run(workflow_id, org_id=org_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Workflow run not found")
+    channel = workflow_jobs.channel(workflow_id)
+
+    async def live_events():
+        history, queue = channel.subscribe()
+        try:
+            for item in history:
+                yield _sse_frame(item["event"], {"seq": item["seq"], **item["data"]})
+                if item["event"] in TERMINAL_EVENTS:
+                    return
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse_frame(item["event"], {"seq": item["seq"], **item["data"]})
+                if item["event"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            channel.unsubscribe(queue)
+
+    async def polled_events():
+        seen: set[int] = set()
+        while True:
+            current, steps = await asyncio.to_thread(_run_progress, workflow_id)
+            for step in steps:
+                if step["status"] == "completed" and int(step["step_index"]) not in seen:
+                    seen.add(int(step["step_index"]))
+                    yield _sse_frame(
+                        "step_completed",
+                        {
+                            "step_id": step["step_id"],
+                            "step_index": int(step["step_index"]),
+                            "agent_code": step["agent_code"],
+                            "response": step["response"],
+                            "model_used": step["model_used"],
+                            "latency_ms": int(step["latency_ms"] or 0),
+                        },
+                    )
+            status = str((current or {}).get("status") or "failed")
+            if status in {"completed", "failed", "cancelled"}:
+                yield _sse_frame(
+                    f"run_{status}",
+                    {
+                        "workflow_id": workflow_id,
+                        "final_response": (current or {}).get("final_response") or "",
+                        "error": (current or {}).get("error_message"),
+                    },
+                )
+                return
+            await asyncio.sleep(1.0)
+
+    events = live_events() if channel is not None else polled_events()
+    return StreamingResponse(events, media_type="text/event-stream")
+
+
 @router.post("/v1/workflows/templates", response_model=WorkflowTemplateOut)
 def create_workflow_template(
     payload: WorkflowTemplateIn,
@@ -2273,7 +2654,12 @@ def create_workflow_template(
     max_steps = max(1, int(settings.workflow_max_steps))
     if len(payload.steps) > max_steps:
         raise HTTPException(status_code=400, detail=f"Too many steps. Max allowed: {max_steps}")
-    workflow_definition = payload.workflow_definition or _build_workflow_definition([WorkflowStepIn(**item.model_dump()) for item in payload.steps])
+    workflow_definition = payload.workflow_definition or _build_workflow_definition(
+        [WorkflowStepIn(**item.model_dump()) for item in payload.steps],
+        execution_mode=payload.execution_mode,
+        max_concurrency=payload.max_concurrency,
+        memoize_ttl_s=payload.memoize_ttl_s,
+    )
     engine = WorkflowEngine(db)
     errors = engine.validate_definition(workflow_definition)
     if errors:
@@ -2380,7 +2766,7 @@ async def run_workflow_template(
     template = db.execute(
         text(
             """
-            select template_id, name, context, steps, workflow_definition, is_active
+            select template_id, name, context, steps, workflow_definition, is_active, updated_at
             from workflow_templates
             where org_id = :org_id and template_id = cast(:template_id as uuid)
             limit 1;
@@ -2395,37 +2781,25 @@ async def run_workflow_template(
 
     base_context = ExecuteContext(**(template["context"] or {}))
     merged_context = _merge_context(base_context, payload.context_override)
-    steps = [WorkflowStepIn(**item) for item in (template["steps"] or [])]
-    definition = dict(template["workflow_definition"] or {}) if template.get("workflow_definition") else _build_workflow_definition(steps)
-    run_input = WorkflowExecuteIn(
+    plan = _template_plan(
+        db,
+        template_id=template_id,
+        updated_at=template["updated_at"],
+        workflow_definition=template["workflow_definition"],
+        steps=template["steps"],
+    )
+    # Fields come from the already validated request; the steps live in the cached plan.
+    run_input = WorkflowExecuteIn.model_construct(
         initial_message=payload.initial_message,
         session_id=payload.session_id,
         context=merged_context,
-        steps=steps,
-        workflow_definition=definition,
+        steps=[],
+        step_retries=payload.step_retries,
+        retry_backoff_s=payload.retry_backoff_s,
+        background=payload.background,
     )
     try:
-        result = await execute_workflow(payload=run_input, db=db, x_org_id=org_id)
-        db.execute(
-            text(
-                """
-                insert into workflow_runs
-                  (workflow_id, org_id, template_id, session_id, status, initial_message, final_response, steps_count, completed_at)
-                values
-                  (:workflow_id, :org_id, cast(:template_id as uuid), :session_id, 'completed', :initial_message, :final_response, :steps_count, now());
-                """
-            ),
-            {
-                "workflow_id": result.workflow_id,
-                "org_id": org_id,
-                "template_id": template_id,
-                "session_id": result.session_id,
-                "initial_message": payload.initial_message,
-                "final_response": result.final_response,
-                "steps_count": len(result.steps),
-            },
-        )
-        db.commit()
+        result = await _run_workflow(db, org_id=org_id, payload=run_input, template_id=template_id, plan=plan)
     except HTTPException:
         db.rollback()
         raise
@@ -2448,6 +2822,8 @@ def create_workflow_schedule(
     org_id = x_org_id or "org_test"
     if not _validate_cron_expression(payload.cron_expression):
         raise HTTPException(status_code=400, detail="Invalid cron expression")
+    if schedule_zone(payload.timezone) is None:
+        raise HTTPException(status_code=400, detail="Invalid timezone")
 
     template_row = db.execute(
         text(
@@ -2551,21 +2927,29 @@ def list_workflow_schedules(
     ]
 
 
-@router.post("/v1/workflows/schedules/{schedule_id}/run", response_model=WorkflowScheduledRunOut)
-async def run_workflow_schedule(
+async def execute_workflow_schedule(
+    db: Session,
+    *,
+    org_id: str,
     schedule_id: str,
-    db: Session = Depends(get_db),
-    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+    lease_owner: str,
 ) -> WorkflowScheduledRunOut:
-    from fastapi import HTTPException
+    """
+    Run a schedule whose lease `lease_owner` holds, then release it.
 
-    org_id = x_org_id or "org_test"
+    The lease is re-checked before the run starts: if it expired while the schedule waited
+    for a slot, another worker may have claimed it, and this call fails with 409 instead.
+    `next_run_at` advances whether the run succeeds or fails, so a failing schedule is retried
+    at its next slot rather than on every poll. A run cancelled by shutdown only drops the
+    lease, leaving the slot due for another worker.
+    """
     row = db.execute(
         text(
             """
             select
               ws.schedule_id, ws.template_id, ws.name, ws.cron_expression, ws.initial_message, ws.timezone, ws.is_active,
-              wt.context, wt.steps, wt.is_active as template_active
+              wt.context, wt.steps, wt.workflow_definition, wt.updated_at as template_updated_at,
+              wt.is_active as template_active
             from workflow_schedules ws
             join workflow_templates wt on wt.template_id = ws.template_id
             where ws.org_id = :org_id and ws.schedule_id = cast(:schedule_id as uuid)
@@ -2574,56 +2958,50 @@ async def run_workflow_schedule(
         ),
         {"org_id": org_id, "schedule_id": schedule_id},
     ).mappings().first()
+    leases = ScheduleLeases(db)
     if not row:
+        leases.release(schedule_id, owner=lease_owner, advance=False)
         raise HTTPException(status_code=404, detail="Workflow schedule not found")
-    if not bool(row["is_active"]):
-        raise HTTPException(status_code=409, detail="Workflow schedule is inactive")
-    if not bool(row["template_active"]):
-        raise HTTPException(status_code=409, detail="Workflow template is inactive")
-
-    run_input = WorkflowExecuteIn(
-        initial_message=str(row["initial_message"]),
-        session_id=None,
-        context=ExecuteContext(**(row["context"] or {})),
-        steps=[WorkflowStepIn(**item) for item in (row["steps"] or [])],
-    )
-    result = await execute_workflow(payload=run_input, db=db, x_org_id=org_id)
+    if not leases.hold(schedule_id, owner=lease_owner, lease_s=lease_seconds()):
+        raise HTTPException(status_code=409, detail="Workflow schedule lease expired before the run started")
 
     last_run = datetime.now(timezone.utc)
     next_run = _next_run_at(str(row["cron_expression"]), str(row["timezone"]))
-    db.execute(
-        text(
-            """
-            update workflow_schedules
-            set last_run_at = :last_run_at,
-                next_run_at = :next_run_at,
-                updated_at = now()
-            where schedule_id = cast(:schedule_id as uuid);
-            """
-        ),
-        {"schedule_id": schedule_id, "last_run_at": last_run, "next_run_at": next_run},
-    )
-    db.execute(
-        text(
-            """
-            insert into workflow_runs
-              (workflow_id, org_id, template_id, schedule_id, session_id, status, initial_message, final_response, steps_count, completed_at)
-            values
-              (:workflow_id, :org_id, cast(:template_id as uuid), cast(:schedule_id as uuid), :session_id, 'completed', :initial_message, :final_response, :steps_count, now());
-            """
-        ),
-        {
-            "workflow_id": result.workflow_id,
-            "org_id": org_id,
-            "template_id": str(row["template_id"]),
-            "schedule_id": schedule_id,
-            "session_id": result.session_id,
-            "initial_message": str(row["initial_message"]),
-            "final_response": result.final_response,
-            "steps_count": len(result.steps),
-        },
-    )
-    db.commit()
+    try:
+        if not bool(row["is_active"]):
+            raise HTTPException(status_code=409, detail="Workflow schedule is inactive")
+        if not bool(row["template_active"]):
+            raise HTTPException(status_code=409, detail="Workflow template is inactive")
+        plan = _template_plan(
+            db,
+            template_id=str(row["template_id"]),
+            updated_at=row["template_updated_at"],
+            workflow_definition=row["workflow_definition"],
+            steps=row["steps"],
+        )
+        run_input = WorkflowExecuteIn.model_construct(
+            initial_message=str(row["initial_message"]),
+            session_id=None,
+            context=ExecuteContext(**(row["context"] or {})),
+            steps=[],
+        )
+        result = await _run_workflow(
+            db,
+            org_id=org_id,
+            payload=run_input,
+            template_id=str(row["template_id"]),
+            schedule_id=schedule_id,
+            plan=plan,
+        )
+    except asyncio.CancelledError:
+        db.rollback()
+        leases.release(schedule_id, owner=lease_owner, advance=False)
+        raise
+    except Exception:
+        db.rollback()
+        leases.release(schedule_id, owner=lease_owner, last_run_at=last_run, next_run_at=next_run)
+        raise
+    leases.release(schedule_id, owner=lease_owner, last_run_at=last_run, next_run_at=next_run)
 
     return WorkflowScheduledRunOut(
         schedule_id=schedule_id,
@@ -2633,44 +3011,68 @@ async def run_workflow_schedule(
     )
 
 
+@router.post("/v1/workflows/schedules/{schedule_id}/run", response_model=WorkflowScheduledRunOut)
+async def run_workflow_schedule(
+    schedule_id: str,
+    db: Session = Depends(get_db),
+    x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
+) -> WorkflowScheduledRunOut:
+    org_id = x_org_id or "org_test"
+    owner = f"manual:{uuid.uuid4().hex}"
+    if not ScheduleLeases(db).claim(schedule_id, org_id=org_id, owner=owner, lease_s=lease_seconds()):
+        exists = db.execute(
+            text(
+                "select 1 from workflow_schedules where org_id = :org_id and schedule_id = cast(:schedule_id as uuid);"
+            ),
+            {"org_id": org_id, "schedule_id": schedule_id},
+        ).first()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Workflow schedule not found")
+        raise HTTPException(status_code=409, detail="Workflow schedule is already running")
+    async with renewing_leases([schedule_id], owner=owner):
+        return await execute_workflow_schedule(db, org_id=org_id, schedule_id=schedule_id, lease_owner=owner)
+
+
 @router.post("/v1/workflows/schedules/run-due", response_model=WorkflowDueRunOut)
 async def run_due_workflow_schedules(
     limit: int = 10,
     db: Session = Depends(get_db),
     x_org_id: str | None = Header(default=None, alias="X-Org-Id"),
 ) -> WorkflowDueRunOut:
-    from fastapi import HTTPException
+    """
+    Claim and run this org's due schedules now; rows leased by the scheduler loop are skipped.
 
+    At most WORKFLOW_SCHEDULER_MAX_CONCURRENCY run at once; the leases of claimed schedules
+    still waiting for a slot are renewed along with the running ones.
+    """
     org_id = x_org_id or "org_test"
     capped_limit = max(1, min(50, int(limit)))
-    now = datetime.now(timezone.utc)
-    due = db.execute(
-        text(
-            """
-            select schedule_id
-            from workflow_schedules
-            where org_id = :org_id
-              and is_active = true
-              and next_run_at is not null
-              and next_run_at <= :now
-            order by next_run_at asc
-            limit :limit;
-            """
-        ),
-        {"org_id": org_id, "now": now, "limit": capped_limit},
-    ).mappings().all()
-
-    items: list[WorkflowDueRunItem] = []
-    for row in due:
-        schedule_id = str(row["schedule_id"])
-        try:
-            out = await run_workflow_schedule(schedule_id=schedule_id, db=db, x_org_id=org_id)
-            items.append(WorkflowDueRunItem(schedule_id=schedule_id, workflow_id=out.workflow.workflow_id, status="completed"))
-        except HTTPException as e:
-            items.append(WorkflowDueRunItem(schedule_id=schedule_id, status="failed", error=str(e.detail)))
-        except Exception as e:
-            items.append(WorkflowDueRunItem(schedule_id=schedule_id, status="failed", error=str(e)))
-
+    owner = f"manual:{uuid.uuid4().hex}"
+    claimed = ScheduleLeases(db).claim_due(
+        owner=owner,
+        limit=capped_limit,
+        lease_s=lease_seconds(),
+        global_cap=max(1, int(settings.workflow_scheduler_global_max_concurrency)),
+        org_id=org_id,
+    )
+    semaphore = asyncio.Semaphore(max(1, int(settings.workflow_scheduler_max_concurrency)))
+
+    async def _run(schedule_id: str) -> WorkflowDueRunItem:
+        async with semaphore:
+            try:
+                with SessionLocal() as run_db:
+                    out = await execute_workflow_schedule(
+                        run_db, org_id=org_id, schedule_id=schedule_id, lease_owner=owner
+                    )
+                return WorkflowDueRunItem(schedule_id=schedule_id, workflow_id=out.workflow.workflow_id, status="completed")
+            except HTTPException as e:
+                return WorkflowDueRunItem(schedule_id=schedule_id, status="failed", error=str(e.detail))
+            except Exception as e:
+                return WorkflowDueRunItem(schedule_id=schedule_id, status="failed", error=str(e))
+
+    schedule_ids = [str(row["schedule_id"]) for row in claimed]
+    async with renewing_leases(schedule_ids, owner=owner):
+        items = list(await asyncio.gather(*(_run(schedule_id) for schedule_id in schedule_ids)))
     return WorkflowDueRunOut(processed=len(items), items=items)
 
 
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable
+
+from sqlalchemy import text
+
+from app.db import SessionLocal
+from app.files.extractors import extract_file_content, extract_pdf, is_pdf, pdf_page_count
+from app.files.images import generate_image_variants, is_image
+from app.retrieval import knowledge_index
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Extra time the parent waits past the in-worker alarm before it kills the pool.
+_HARD_TIMEOUT_GRACE_S = 5.0
+# Queued and running extractions touch `file_blobs.extraction_heartbeat_at` this often, so
+# other API workers can tell a long extraction from one whose worker went away.
+EXTRACTION_HEARTBEAT_S = 30.0
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum: int, frame: Any) -> None:
+    raise ExtractionTimeout()
+
+
+def _run_with_alarm(fn: Callable[..., Any], time_limit_s: float, *args: Any) -> Any:
+    """Worker-side soft limit: pool tasks run on the worker's main thread, so SIGALRM works."""
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, max(0.1, time_limit_s))
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class ExtractionExecutor:
+    """
+    Runs CPU-bound text extraction in a process pool, off the API event loop.
+
+    Uploads register a pending `file_blobs` row and return; `submit` extracts in the
+    background under a concurrency cap and per-file time/page limits, then stores the text
+    and indexes every upload referencing that hash. PDFs are split into page ranges that run
+    in parallel; images get resized variants instead of text. The status is polled through `file_blobs.extraction_status`.
+    """
+
+    def __init__(self) -> None:
+        self._pool: ProcessPoolExecutor | None = None
+        self._semaphore: tuple[asyncio.AbstractEventLoop, asyncio.Semaphore] | None = None
+        self._worker_slots: tuple[asyncio.AbstractEventLoop, asyncio.Semaphore] | None = None
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._heartbeat_task: asyncio.Task | None = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: workers must not inherit the API's DB connections or running threads.
+            self._pool = ProcessPoolExecutor(
+                max_workers=max(1, int(settings.extraction_max_workers)),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _recycle_pool(self) -> None:
+        """Kill the pool's workers; the only way to stop a task stuck past its alarm."""
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore[0] is not loop:
+            self._semaphore = (loop, asyncio.Semaphore(max(1, int(settings.extraction_max_concurrency))))
+        return self._semaphore[1]
+
+    def _get_worker_slots(self) -> asyncio.Semaphore:
+        """One slot per pool worker, so a task handed to the pool starts at once instead of queueing."""
+        loop = asyncio.get_running_loop()
+        if self._worker_slots is None or self._worker_slots[0] is not loop:
+            self._worker_slots = (loop, asyncio.Semaphore(max(1, int(settings.extraction_max_workers))))
+        return self._worker_slots[1]
+
+    def is_running(self, sha256: str) -> bool:
+        task = self._tasks.get(sha256)
+        return task is not None and not task.done()
+
+    def submit(self, *, sha256: str, path: Path, mime_type: str, filename: str) -> None:
+        if self.is_running(sha256):
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._run(sha256=sha256, path=path, mime_type=mime_type, filename=filename)
+        )
+        self._tasks[sha256] = task
+        task.add_done_callback(lambda _: self._tasks.pop(sha256, None))
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+
+    def cancel(self, sha256: str) -> bool:
+        """Cancel a queued or running extraction; safe to call from threadpool routes."""
+        task = self._tasks.get(sha256)
+        if task is None or task.done():
+            return False
+        task.get_loop().call_soon_threadsafe(task.cancel)
+        return True
+
+    async def shutdown(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _heartbeat_loop(self) -> None:
+        while self._tasks:
+            await asyncio.sleep(EXTRACTION_HEARTBEAT_S)
+            sha256s = [sha256 for sha256, task in list(self._tasks.items()) if not task.done()]
+            if not sha256s:
+                continue
+            try:
+                await asyncio.to_thread(_heartbeat, sha256s)
+            except Exception as exc:
+                logger.warning("Extraction heartbeat failed: %s", exc)
+
+    async def _call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        limit = float(settings.extraction_timeout_s)
+        loop = asyncio.get_running_loop()
+        # Waiting for a worker happens here, outside the deadline: only a task that has run past
+        # its alarm on a worker may time out, and only then is the pool worth tearing down.
+        async with self._get_worker_slots():
+            future = loop.run_in_executor(self._get_pool(), _run_with_alarm, fn, limit, *args)
+            try:
+                return await asyncio.wait_for(future, timeout=limit + _HARD_TIMEOUT_GRACE_S)
+            except asyncio.TimeoutError:
+                self._recycle_pool()
+                raise ExtractionTimeout()
+
+    async def _extract(self, path: Path, mime_type: str, filename: str) -> tuple[str, dict[str, Any] | None]:
+        if is_image(mime_type, filename):
+            return "", await self._call(generate_image_variants, path)
+        return await self._extract_text(path, mime_type, filename), None
+
+    async def _extract_text(self, path: Path, mime_type: str, filename: str) -> str:
+        if not is_pdf(mime_type, filename):
+            return await self._call(extract_file_content, path, mime_type, filename)
+        pages = min(int(await self._call(pdf_page_count, path)), max(1, int(settings.extraction_max_pdf_pages)))
+        step = max(1, int(settings.extraction_pdf_pages_per_task))
+        parts = await asyncio.gather(*(self._call(extract_pdf, path, start, min(start + step, pages)) for start in range(0, pages, step)))
+        return "\n\n".join(part for part in parts if part).strip()
+
+    async def _run(self, *, sha256: str, path: Path, mime_type: str, filename: str) -> None:
+        status, error, extracted, image_meta = "completed", None, "", None
+        try:
+            async with self._get_semaphore():
+                await asyncio.to_thread(_set_status, sha256, "running", None)
+                try:
+                    extracted, image_meta = await self._extract(path, mime_type, filename)
+                except BrokenProcessPool:
+                    # A sibling task's timeout recycled the pool under us; retry once on a fresh one.
+                    extracted, image_meta = await self._extract(path, mime_type, filename)
+                extracted = extracted[:100_000]
+        except asyncio.CancelledError:
+            status, error = "cancelled", "Extraction cancelled"
+        except ExtractionTimeout:
+            # EXTRACTION_TIMEOUT_S bounds each pool task: a whole file, or one batch of PDF pages.
+            status, error = "failed", f"Extraction step exceeded {settings.extraction_timeout_s:g}s"
+        except Exception as exc:
+            status, error = "failed", str(exc)[:500]
+        try:
+            await asyncio.to_thread(_finish, sha256, status, error, extracted, image_meta)
+        except Exception as exc:
+            logger.error("Failed to store extraction result for %s: %s", sha256, exc)
+
+
+def _set_status(sha256: str, status: str, error: str | None) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            text(
+                """
+                update file_blobs
+                set extraction_status = :status,
+                    extraction_error = :error,
+                    extraction_started_at = case when :status = 'running' then now() else extraction_started_at end,
+                    extraction_heartbeat_at = now()
+                where sha256 = :sha256;
+                """
+            ),
+            {"sha256": sha256, "status": status, "error": error},
+        )
+        db.commit()
+
+
+def _heartbeat(sha256s: list[str]) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            text(
+                """
+                update file_blobs
+                set extraction_heartbeat_at = now()
+                where sha256 = any(:sha256s) and extraction_status in ('pending', 'running');
+                """
+            ),
+            {"sha256s": sha256s},
+        )
+        db.commit()
+
+
+def _finish(sha256: str, status: str, error: str | None, extracted_text: str, image_meta: dict[str, Any] | None = None) -> None:
+    published = []
+    with SessionLocal() as db:
+        db.execute(
+            text(
+                """
+                update file_blobs
+                set extraction_status = :status,
+                    extraction_error = :error,
+                    extracted_text = :extracted_text,
+                    image_meta = cast(:image_meta as jsonb)
+                where sha256 = :sha256;
+                """
+            ),
+            {
+                "sha256": sha256,
+                "status": status,
+                "error": error,
+                "extracted_text": extracted_text,
+                "image_meta": json.dumps(image_meta) if image_meta is not None else None,
+            },
+        )
+        if status == "completed" and extracted_text:
+            references = db.execute(
+                text("select file_id, org_id, filename from uploaded_files where sha256 = :sha256 and is_active = true;"),
+                {"sha256": sha256},
+            ).mappings().all()
+            for ref in references:
+                keys, vectors = knowledge_index.write_chunks(
+                    db,
+                    source_type="file",
+                    source_id=str(ref["file_id"]),
+                    org_id=str(ref["org_id"]),
+                    title=str(ref["filename"]),
+                    content=extracted_text,
+                    category=None,
+                    source_hash=sha256,
+                )
+                published.append((str(ref["org_id"]), str(ref["file_id"]), keys, vectors))
+        db.commit()
+    for org_id, file_id, keys, vectors in published:
+        knowledge_index.publish(org_id=org_id, source_type="file", source_id=file_id, keys=keys, vectors=vectors)
+
+
+extraction_executor = ExtractionExecutor()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Any
+
+from PIL import Image, ImageOps
+
+# Longest-edge sizes pre-rendered at upload. 1024 is what vision models get; 512 serves
+# previews and keeps a cheaper option for multi-image prompts.
+IMAGE_VARIANT_SIZES = (512, 1024)
+_IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def is_image(mime_type: str, filename: str) -> bool:
+    return filename.lower().endswith(_IMAGE_SUFFIXES) or (mime_type or "").lower().startswith("image/")
+
+
+def variant_path(blob_path: Path, size: int) -> Path:
+    return blob_path.with_name(f"{blob_path.stem}.{size}.jpg")
+
+
+def generate_image_variants(path: Path) -> dict[str, Any]:
+    """
+    Render JPEG variants next to the blob and return their metadata for `file_blobs.image_meta`.
+
+    Runs in the extraction pool. Alpha is flattened onto white, since not every provider
+    accepts transparency; images already smaller than a size are stored once at their own size.
+    """
+    variants: list[dict[str, Any]] = []
+    with Image.open(path) as source:
+        source_format = str(source.format or path.suffix.lstrip(".")).lower()
+        image = ImageOps.exif_transpose(source)
+        width, height = image.size
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        for size in IMAGE_VARIANT_SIZES:
+            rendered = image.copy()
+            rendered.thumbnail((size, size), Image.LANCZOS)
+            destination = variant_path(path, size)
+            partial = destination.with_name(destination.name + ".part")
+            rendered.save(partial, format="JPEG", quality=85, optimize=True)
+            partial.replace(destination)
+            variants.append({"size": size, "path": str(destination), "width": rendered.width, "height": rendered.height})
+            if max(width, height) <= size:
+                break
+    return {"width": width, "height": height, "format": source_format, "mime_type": "image/jpeg", "variants": variants}
+
+
+def remove_image_variants(blob_path: Path) -> None:
+    for size in IMAGE_VARIANT_SIZES:
+        variant_path(blob_path, size).unlink(missing_ok=True)
+
+
+@dataclass(frozen=True)
+class ImageInput:
+    """An image attachment resolved to a variant file; bytes are only read when a request is built."""
+
+    file_id: str
+    filename: str
+    path: str
+    mime_type: str
+    sha256: str
+    # Set for blobs uploaded before variants existed: the original is downsized per request.
+    resize_px: int | None = None
+
+    def read_bytes(self) -> bytes:
+        if self.resize_px is None:
+            return Path(self.path).read_bytes()
+        with Image.open(self.path) as source:
+            image = ImageOps.exif_transpose(source).convert("RGB")
+            image.thumbnail((self.resize_px, self.resize_px), Image.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue()
+
+    def content_part(self) -> dict[str, Any]:
+        mime_type = "image/jpeg" if self.resize_px is not None else self.mime_type
+        encoded = base64.b64encode(self.read_bytes()).decode("ascii")
+        return {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded}"}}
+
+
+def pick_variant(image_meta: dict[str, Any] | None, max_px: int) -> dict[str, Any] | None:
+    """Largest stored variant that fits `max_px`, else the smallest one."""
+    variants = sorted((image_meta or {}).get("variants") or [], key=lambda item: int(item.get("size") or 0))
+    if not variants:
+        return None
+    fitting = [item for item in variants if int(item.get("size") or 0) <= max_px]
+    return fitting[-1] if fitting else variants[0]
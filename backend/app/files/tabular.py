@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import csv
+import io
+from collections import Counter
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from openpyxl import load_workbook
+
+# Stop reading after this many data rows per table; the profile then says it is truncated.
+MAX_PROFILE_ROWS = 200_000
+# Distinct values tracked per column for "top values"; later unseen values are not counted,
+# which keeps memory flat on high-cardinality columns (IDs, free text).
+_MAX_TRACKED_VALUES = 1000
+_SAMPLE_ROWS = 3
+_NULL_STRINGS = frozenset({"", "null", "none", "nan", "n/a", "na", "-"})
+
+
+def _classify(value: Any) -> tuple[str, Any]:
+    """Map a cell to (kind, comparable value); kind is one of null/bool/number/date/text."""
+    if value is None:
+        return "null", None
+    if isinstance(value, bool):
+        return "bool", value
+    if isinstance(value, (int, float)):
+        return "number", value
+    if isinstance(value, (datetime, date)):
+        return "date", value
+    if isinstance(value, time):
+        return "text", value.isoformat()
+    raw = str(value).strip()
+    if raw.lower() in _NULL_STRINGS:
+        return "null", None
+    if raw.lower() in {"true", "false", "yes", "no"}:
+        return "bool", raw.lower() in {"true", "yes"}
+    if any(ch.isdigit() for ch in raw):
+        try:
+            return "number", float(raw.replace(",", ""))
+        except ValueError:
+            pass
+    if len(raw) >= 8 and raw[:4].isdigit() and raw[4] in "-/":
+        try:
+            return "date", datetime.fromisoformat(raw.replace("/", "-"))
+        except ValueError:
+            pass
+    return "text", raw
+
+
+class ColumnProfile:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.kinds: Counter[str] = Counter()
+        self.minimum: Any = None
+        self.maximum: Any = None
+        self.values: Counter[str] = Counter()
+
+    def add(self, value: Any) -> None:
+        self.count += 1
+        kind, comparable = _classify(value)
+        if kind == "null":
+            self.nulls += 1
+            return
+        self.kinds[kind] += 1
+        if kind in {"number", "date"}:
+            try:
+                if self.minimum is None or comparable < self.minimum:
+                    self.minimum = comparable
+                if self.maximum is None or comparable > self.maximum:
+                    self.maximum = comparable
+            except TypeError:
+                pass  # mixed number/date column; keep the first kind's range
+        key = str(value).strip()[:60]
+        if key in self.values or len(self.values) < _MAX_TRACKED_VALUES:
+            self.values[key] += 1
+
+    @property
+    def kind(self) -> str:
+        if not self.kinds:
+            return "empty"
+        kind, hits = self.kinds.most_common(1)[0]
+        return kind if hits >= 0.9 * sum(self.kinds.values()) else "mixed"
+
+    def render(self) -> str:
+        null_rate = (self.nulls / self.count * 100.0) if self.count else 0.0
+        parts = [f"{self.kind}", f"nulls {null_rate:.1f}%"]
+        if self.minimum is not None:
+            parts.append(f"min {_fmt(self.minimum)}, max {_fmt(self.maximum)}")
+        distinct = len(self.values)
+        parts.append(f"distinct {distinct}{'+' if distinct >= _MAX_TRACKED_VALUES else ''}")
+        top = [(value, hits) for value, hits in self.values.most_common(3) if hits > 1]
+        if top:
+            parts.append("top " + ", ".join(f"{value!r} ({hits})" for value, hits in top))
+        return f"- {self.name}: " + "; ".join(parts)
+
+
+def _fmt(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="minutes") if value.time() != time() else value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def profile_rows(name: str, rows: Iterable[Iterable[Any]], max_rows: int = MAX_PROFILE_ROWS) -> str:
+    """One streaming pass: first row is the header, then at most `max_rows` data rows."""
+    iterator: Iterator[Iterable[Any]] = iter(rows)
+    header: list[str] = []
+    for first in iterator:
+        header = [str(cell).strip() if cell is not None else "" for cell in first]
+        if any(header):
+            break
+    if not any(header):
+        return ""
+    columns = [ColumnProfile(label or f"column_{index + 1}") for index, label in enumerate(header)]
+    samples: list[list[str]] = []
+    row_count = 0
+    truncated = False
+    for row in iterator:
+        cells = list(row)
+        if not any(cell not in (None, "") for cell in cells):
+            continue
+        if row_count >= max_rows:
+            truncated = True
+            break
+        row_count += 1
+        for index, column in enumerate(columns):
+            column.add(cells[index] if index < len(cells) else None)
+        if len(samples) < _SAMPLE_ROWS:
+            samples.append(["" if cell is None else _fmt(cell) for cell in cells[: len(columns)]])
+
+    lines = [f"Table: {name} ({row_count}{'+' if truncated else ''} rows, {len(columns)} columns)", "Columns:"]
+    lines.extend(column.render() for column in columns)
+    if samples:
+        lines.append("Sample rows:")
+        # csv.writer quotes values that contain commas, quotes or newlines.
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow([column.name for column in columns])
+        writer.writerows(samples)
+        lines.append(buffer.getvalue().rstrip("\n"))
+    return "\n".join(lines)
+
+
+def extract_csv_profile(path: Path, name: str | None = None) -> str:
+    with path.open("r", encoding="utf-8", errors="ignore", newline="") as handle:
+        sample = handle.read(4 * 1024)
+        handle.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample) if sample.strip() else csv.excel
+        except csv.Error:
+            dialect = csv.excel
+        return profile_rows(name or path.name, csv.reader(handle, dialect))
+
+
+def extract_xlsx_profile(path: Path) -> str:
+    # read_only streams rows from the sheet XML instead of building the whole workbook.
+    workbook = load_workbook(str(path), read_only=True, data_only=True)
+    try:
+        sections = [profile_rows(sheet.title, sheet.iter_rows(values_only=True)) for sheet in workbook.worksheets]
+    finally:
+        workbook.close()
+    return "\n\n".join(section for section in sections if section)
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import asyncio
+
+import aiohttp
+
+from app.settings import settings
+
+# One pooled ClientSession per event loop. The API runs a single loop, but scripts that call
+# `asyncio.run` repeatedly get a fresh session instead of one bound to a closed loop.
+_sessions: dict[int, tuple[asyncio.AbstractEventLoop, aiohttp.ClientSession]] = {}
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the process-wide pooled aiohttp session for the running event loop."""
+    loop = asyncio.get_running_loop()
+    row = _sessions.get(id(loop))
+    if row is not None and row[0] is loop and not row[1].closed:
+        return row[1]
+
+    for key, (other_loop, _) in list(_sessions.items()):
+        if other_loop.is_closed():
+            _sessions.pop(key, None)
+
+    connector = aiohttp.TCPConnector(
+        limit=max(1, int(settings.http_pool_size)),
+        limit_per_host=max(1, int(settings.http_pool_per_host)),
+        ttl_dns_cache=300,
+        keepalive_timeout=30,
+    )
+    session = aiohttp.ClientSession(connector=connector)
+    _sessions[id(loop)] = (loop, session)
+    return session
+
+
+async def close_http_session() -> None:
+    loop = asyncio.get_running_loop()
+    row = _sessions.pop(id(loop), None)
+    if row is not None and not row[1].closed:
+        await row[1].close()
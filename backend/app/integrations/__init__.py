@@ -1,3 +1,4 @@
+from app.integrations.delivery import DeliveryWorker, OutboundDeliveryStore, delivery_worker
 from app.integrations.email import EmailIntegration, email_integration
 from app.integrations.slack import SlackIntegration, slack_integration
 from app.integrations.webhook import WebhookIntegration, webhook_integration
@@ -9,4 +10,7 @@ __all__ = [
     "email_integration",
     "WebhookIntegration",
     "webhook_integration",
+    "OutboundDeliveryStore",
+    "DeliveryWorker",
+    "delivery_worker",
 ]
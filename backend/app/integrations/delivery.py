@@ -0,0 +1,547 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import uuid
+from typing import Any
+from urllib.parse import urlparse
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.integrations.email import email_integration
+from app.integrations.slack import slack_integration
+from app.integrations.webhook import webhook_integration
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_CHANNELS = ("slack", "email", "webhook")
+TERMINAL_STATUSES = frozenset({"delivered", "dead"})
+# Ack waiters re-check the row this often, for deliveries picked up by another worker.
+_ACK_POLL_S = 1.0
+
+_DELIVERY_COLUMNS = """
+    delivery_id, org_id, channel, integration_id, destination, workflow_id, step_id, status, attempts,
+    max_attempts, next_attempt_at, last_error, result, created_at, updated_at, delivered_at
+"""
+
+
+class PermanentDeliveryError(Exception):
+    """A delivery that cannot succeed on retry (missing or inactive integration, bad config)."""
+
+
+def delivery_destination(channel: str, config: dict[str, Any]) -> str:
+    """Host a delivery talks to; concurrency is limited per destination."""
+    if channel == "email":
+        return f"smtp://{str(config.get('smtp_host') or '').strip().lower()}:{int(config.get('smtp_port') or 587)}"
+    url = str(config.get("webhook_url") if channel == "slack" else config.get("url") or "")
+    return f"{channel}://{(urlparse(url.strip()).hostname or '').lower()}"
+
+
+def delivery_slot_key(destination: str | None, channel: str) -> str:
+    """Key the per-destination concurrency limit counts under."""
+    return str(destination or channel)
+
+
+def retry_delay_s(attempt: int) -> float:
+    """Exponential backoff with equal jitter: half the step is fixed, half random."""
+    base = max(0.1, float(settings.outbound_delivery_backoff_s))
+    step = min(float(settings.outbound_delivery_max_backoff_s), base * (2 ** max(0, attempt - 1)))
+    return step / 2 + random.uniform(0, step / 2)
+
+
+class OutboundDeliveryStore:
+    """SQL for `outbound_deliveries` and its dead-letter table `outbound_dead_letters`."""
+
+    def __init__(self, db: Session) -> None:
+        self.db = db
+
+    def enqueue(
+        self,
+        *,
+        org_id: str,
+        channel: str,
+        integration_id: str,
+        destination: str,
+        payload: dict[str, Any],
+        workflow_id: str | None = None,
+        step_id: str | None = None,
+        idempotency_key: str | None = None,
+    ) -> str:
+        """
+        Queue a delivery and return its id. A repeated idempotency key returns the existing
+        delivery; if it was dead-lettered it is queued again with a fresh attempt budget, so a
+        resumed step can still get its message out.
+        """
+        row = self.db.execute(
+            text(
+                """
+                insert into outbound_deliveries
+                  (org_id, channel, integration_id, destination, payload, workflow_id, step_id, idempotency_key,
+                   status, max_attempts, next_attempt_at, created_at, updated_at)
+                values
+                  (:org_id, :channel, cast(:integration_id as uuid), :destination, cast(:payload as jsonb), :workflow_id,
+                   :step_id, :idempotency_key, 'pending', :max_attempts, now(), now(), now())
+                on conflict (idempotency_key) where idempotency_key is not null
+                do update set
+                  status = case when outbound_deliveries.status = 'dead' then 'pending' else outbound_deliveries.status end,
+                  attempts = case when outbound_deliveries.status = 'dead' then 0 else outbound_deliveries.attempts end,
+                  next_attempt_at = case when outbound_deliveries.status = 'dead' then now()
+                                         else outbound_deliveries.next_attempt_at end,
+                  updated_at = case when outbound_deliveries.status = 'dead' then now() else outbound_deliveries.updated_at end
+                returning delivery_id;
+                """
+            ),
+            {
+                "org_id": org_id,
+                "channel": channel,
+                "integration_id": integration_id,
+                "destination": destination,
+                "payload": json.dumps(payload),
+                "workflow_id": workflow_id,
+                "step_id": step_id,
+                "idempotency_key": idempotency_key,
+                "max_attempts": max(1, int(settings.outbound_delivery_max_attempts)),
+            },
+        ).first()
+        if idempotency_key is not None:
+            # A requeued delivery is no longer dead; nothing is deleted for live ones.
+            self.db.execute(
+                text("delete from outbound_dead_letters where delivery_id = cast(:delivery_id as uuid);"),
+                {"delivery_id": str(row[0])},
+            )
+        self.db.commit()
+        return str(row[0])
+
+    def get(self, delivery_id: str, *, org_id: str | None = None) -> dict[str, Any] | None:
+        row = self.db.execute(
+            text(
+                f"""
+                select {_DELIVERY_COLUMNS}
+                from outbound_deliveries
+                where delivery_id = cast(:delivery_id as uuid)
+                  and (cast(:org_id as text) is null or org_id = :org_id)
+                limit 1;
+                """
+            ),
+            {"delivery_id": delivery_id, "org_id": org_id},
+        ).mappings().first()
+        return dict(row) if row else None
+
+    def list(
+        self,
+        *,
+        org_id: str,
+        status: str | None = None,
+        workflow_id: str | None = None,
+        limit: int = 50,
+    ) -> list[dict[str, Any]]:
+        rows = self.db.execute(
+            text(
+                f"""
+                select {_DELIVERY_COLUMNS}
+                from outbound_deliveries
+                where org_id = :org_id
+                  and (cast(:status as text) is null or status = :status)
+                  and (cast(:workflow_id as text) is null or workflow_id = :workflow_id)
+                order by created_at desc
+                limit :limit;
+                """
+            ),
+            {"org_id": org_id, "status": status, "workflow_id": workflow_id, "limit": int(limit)},
+        ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def list_dead_letters(self, *, org_id: str, limit: int = 50) -> list[dict[str, Any]]:
+        rows = self.db.execute(
+            text(
+                """
+                select delivery_id, org_id, channel, destination, payload, attempts, last_error, dead_at
+                from outbound_dead_letters
+                where org_id = :org_id
+                order by dead_at desc
+                limit :limit;
+                """
+            ),
+            {"org_id": org_id, "limit": int(limit)},
+        ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def claim_due(
+        self,
+        *,
+        owner: str,
+        limit: int,
+        lease_s: float,
+        per_destination: int,
+        busy: dict[str, int] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Claim up to `limit` due deliveries, at most `per_destination` per destination counting the
+        caller's `busy` sends, so every claimed row can start at once and its lease is not spent
+        waiting for a slot. Destinations are keyed as in `delivery_slot_key`.
+        """
+        # Expired leases cover workers that died mid-send; their attempt is counted again.
+        # Row locks cannot be taken in a windowed query, so candidates are locked first and
+        # ranked per destination after; unclaimed candidates unlock at commit.
+        rows = self.db.execute(
+            text(
+                """
+                with candidates as (
+                  select delivery_id, coalesce(nullif(destination, ''), channel) as slot_key, next_attempt_at
+                  from outbound_deliveries
+                  where (status in ('pending', 'retrying') and next_attempt_at <= now())
+                     or (status = 'sending' and lease_expires_at <= now())
+                  order by next_attempt_at asc
+                  limit :scan_limit
+                  for update skip locked
+                ),
+                due as (
+                  select delivery_id
+                  from (
+                    select delivery_id, slot_key, next_attempt_at,
+                           row_number() over (partition by slot_key order by next_attempt_at) as slot_rank
+                    from candidates
+                  ) ranked
+                  where slot_rank + coalesce(cast(cast(:busy as jsonb) ->> slot_key as integer), 0) <= :per_destination
+                  order by next_attempt_at asc
+                  limit :limit
+                )
+                update outbound_deliveries od
+                set status = 'sending',
+                    attempts = od.attempts + 1,
+                    lease_owner = :owner,
+                    lease_expires_at = now() + make_interval(secs => :lease_s),
+                    updated_at = now()
+                from due
+                where od.delivery_id = due.delivery_id
+                returning od.delivery_id, od.org_id, od.channel, od.integration_id, od.destination, od.payload,
+                          od.attempts, od.max_attempts;
+                """
+            ),
+            {
+                "owner": owner,
+                "limit": int(limit),
+                "scan_limit": int(limit) * 10,
+                "lease_s": float(lease_s),
+                "per_destination": int(per_destination),
+                "busy": json.dumps(busy or {}),
+            },
+        ).mappings().all()
+        self.db.commit()
+        return [dict(row) for row in rows]
+
+    def load_integration(self, integration_id: str) -> dict[str, Any] | None:
+        row = self.db.execute(
+            text(
+                """
+                select integration_type, config, is_active
+                from integration_configs
+                where integration_id = cast(:integration_id as uuid)
+                limit 1;
+                """
+            ),
+            {"integration_id": integration_id},
+        ).mappings().first()
+        return dict(row) if row else None
+
+    # The outcome writers below only apply while `owner` still holds the lease: after it expires
+    # another worker may have reclaimed the row, and its outcome wins.
+
+    def mark_delivered(self, delivery_id: str, *, owner: str, result: dict[str, Any]) -> bool:
+        updated = self.db.execute(
+            text(
+                """
+                update outbound_deliveries
+                set status = 'delivered', result = cast(:result as jsonb), last_error = null,
+                    lease_owner = null, lease_expires_at = null, delivered_at = now(), updated_at = now()
+                where delivery_id = cast(:delivery_id as uuid) and lease_owner = :owner;
+                """
+            ),
+            {"delivery_id": delivery_id, "owner": owner, "result": json.dumps(result, default=str)},
+        ).rowcount
+        self.db.commit()
+        return bool(updated)
+
+    def schedule_retry(self, delivery_id: str, *, owner: str, error: str, delay_s: float) -> bool:
+        updated = self.db.execute(
+            text(
+                """
+                update outbound_deliveries
+                set status = 'retrying', last_error = :error,
+                    next_attempt_at = now() + make_interval(secs => :delay_s),
+                    lease_owner = null, lease_expires_at = null, updated_at = now()
+                where delivery_id = cast(:delivery_id as uuid) and lease_owner = :owner;
+                """
+            ),
+            {"delivery_id": delivery_id, "owner": owner, "error": error[:2000], "delay_s": float(delay_s)},
+        ).rowcount
+        self.db.commit()
+        return bool(updated)
+
+    def dead_letter(self, delivery_id: str, *, owner: str, error: str) -> bool:
+        updated = self.db.execute(
+            text(
+                """
+                update outbound_deliveries
+                set status = 'dead', last_error = :error, lease_owner = null, lease_expires_at = null, updated_at = now()
+                where delivery_id = cast(:delivery_id as uuid) and lease_owner = :owner;
+                """
+            ),
+            {"delivery_id": delivery_id, "owner": owner, "error": error[:2000]},
+        ).rowcount
+        if not updated:
+            self.db.commit()
+            return False
+        self.db.execute(
+            text(
+                """
+                insert into outbound_dead_letters (delivery_id, org_id, channel, destination, payload, attempts, last_error, dead_at)
+                select delivery_id, org_id, channel, destination, payload, attempts, last_error, now()
+                from outbound_deliveries
+                where delivery_id = cast(:delivery_id as uuid)
+                on conflict (delivery_id) do update set
+                  attempts = excluded.attempts,
+                  last_error = excluded.last_error,
+                  dead_at = excluded.dead_at;
+                """
+            ),
+            {"delivery_id": delivery_id, "error": error[:2000]},
+        )
+        self.db.commit()
+        return True
+
+    def requeue(self, delivery_id: str, *, org_id: str) -> bool:
+        """Send a dead-lettered delivery again with a fresh attempt budget."""
+        row = self.db.execute(
+            text(
+                """
+                update outbound_deliveries
+                set status = 'pending', attempts = 0, next_attempt_at = now(), updated_at = now()
+                where delivery_id = cast(:delivery_id as uuid) and org_id = :org_id and status = 'dead'
+                returning delivery_id;
+                """
+            ),
+            {"delivery_id": delivery_id, "org_id": org_id},
+        ).first()
+        if row is not None:
+            self.db.execute(
+                text("delete from outbound_dead_letters where delivery_id = cast(:delivery_id as uuid);"),
+                {"delivery_id": delivery_id},
+            )
+        self.db.commit()
+        return row is not None
+
+
+async def send_delivery(
+    channel: str, config: dict[str, Any], payload: dict[str, Any], *, attempts: int = 1
+) -> dict[str, Any]:
+    """Send through the integration clients. Queued sends make one attempt; retries are the queue's job."""
+    if channel == "slack":
+        return await slack_integration.post_message(
+            webhook_url=str(config.get("webhook_url") or ""), text=str(payload.get("text") or "")
+        )
+    if channel == "email":
+        smtp_user = str(config.get("smtp_user") or "")
+        return await email_integration.send_email(
+            smtp_host=str(config.get("smtp_host") or ""),
+            smtp_port=int(config.get("smtp_port") or 587),
+            smtp_user=smtp_user,
+            smtp_password=str(config.get("smtp_password") or ""),
+            from_email=str(config.get("from_email") or smtp_user),
+            to_email=str(payload.get("to_email") or ""),
+            subject=str(payload.get("subject") or ""),
+            body=str(payload.get("body") or ""),
+            use_tls=bool(config.get("use_tls", True)),
+        )
+    if channel == "webhook":
+        headers = dict(config.get("headers") or {})
+        return await webhook_integration.send_webhook(
+            url=str(config.get("url") or ""),
+            payload=dict(payload.get("body") or {}),
+            headers={str(k): str(v) for k, v in headers.items()},
+            attempts=attempts,
+        )
+    raise PermanentDeliveryError(f"Unsupported delivery channel: {channel}")
+
+
+class DeliveryWorker:
+    """
+    Drains `outbound_deliveries` in the background of every API worker.
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED and a lease, so workers never send the same
+    delivery at once. Sends run concurrently up to OUTBOUND_DELIVERY_CONCURRENCY, and to
+    OUTBOUND_DELIVERY_PER_DESTINATION per host so one slow endpoint cannot take every slot;
+    claims respect both caps, so a claimed row starts sending at once. HTTP
+    goes through the shared pooled session. Failures retry with jittered exponential backoff
+    and land in `outbound_dead_letters` after OUTBOUND_DELIVERY_MAX_ATTEMPTS.
+    """
+
+    def __init__(self) -> None:
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._loop_task: asyncio.Task | None = None
+        self._wake_event: asyncio.Event | None = None
+        self._inflight: set[asyncio.Task] = set()
+        # In-flight sends per destination slot key; claims never exceed the per-destination cap.
+        self._busy: dict[str, int] = {}
+        self._waiters: dict[str, set[asyncio.Future]] = {}
+
+    def start(self) -> None:
+        if self._loop_task is not None and not self._loop_task.done():
+            return
+        self._wake_event = asyncio.Event()
+        self._loop_task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+        # In-flight sends are abandoned; their leases expire and another worker retries them.
+        for task in list(self._inflight):
+            task.cancel()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def wake(self) -> None:
+        """Start polling now instead of at the next interval (called right after enqueueing)."""
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    async def wait_for(self, delivery_id: str, *, timeout_s: float) -> dict[str, Any] | None:
+        """Wait until a delivery is delivered or dead-lettered; returns its row as of the deadline."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(0.0, float(timeout_s))
+        future: asyncio.Future = loop.create_future()
+        self._waiters.setdefault(delivery_id, set()).add(future)
+        try:
+            while True:
+                row = await asyncio.to_thread(_load_delivery, delivery_id)
+                remaining = deadline - loop.time()
+                if row is None or row["status"] in TERMINAL_STATUSES or remaining <= 0:
+                    return row
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), timeout=min(remaining, _ACK_POLL_S))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            waiters = self._waiters.get(delivery_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    self._waiters.pop(delivery_id, None)
+
+    async def _poll_loop(self) -> None:
+        assert self._wake_event is not None
+        interval = max(0.5, float(settings.outbound_delivery_poll_s))
+        while True:
+            self._wake_event.clear()
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Outbound delivery poll failed: %s", exc)
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def tick(self) -> int:
+        free = max(1, int(settings.outbound_delivery_concurrency)) - len(self._inflight)
+        if free <= 0:
+            return 0
+        claimed = await asyncio.to_thread(_claim_due, self.owner, free, dict(self._busy))
+        for row in claimed:
+            slot_key = delivery_slot_key(row["destination"], str(row["channel"]))
+            self._busy[slot_key] = self._busy.get(slot_key, 0) + 1
+            task = asyncio.create_task(self._deliver(row))
+            self._inflight.add(task)
+            task.add_done_callback(lambda done, key=slot_key: self._on_delivery_done(done, key))
+        return len(claimed)
+
+    def _on_delivery_done(self, task: asyncio.Task, slot_key: str) -> None:
+        self._inflight.discard(task)
+        remaining = self._busy.get(slot_key, 0) - 1
+        if remaining > 0:
+            self._busy[slot_key] = remaining
+        else:
+            self._busy.pop(slot_key, None)
+        # A freed slot may let more due rows through right away.
+        self.wake()
+
+    async def _deliver(self, row: dict[str, Any]) -> None:
+        delivery_id = str(row["delivery_id"])
+        channel = str(row["channel"])
+        try:
+            integration = await asyncio.to_thread(_load_integration, str(row["integration_id"]))
+            if integration is None or not bool(integration["is_active"]):
+                raise PermanentDeliveryError("Integration is missing or inactive")
+            if str(integration["integration_type"]).strip().lower() != channel:
+                raise PermanentDeliveryError(f"Integration is not {channel}")
+            result = await send_delivery(channel, dict(integration["config"] or {}), dict(row["payload"] or {}))
+        except asyncio.CancelledError:
+            raise
+        except (PermanentDeliveryError, ValueError) as exc:
+            recorded = await asyncio.to_thread(_dead_letter, delivery_id, self.owner, str(exc))
+        except Exception as exc:
+            error = str(exc) or type(exc).__name__
+            if int(row["attempts"]) >= int(row["max_attempts"]):
+                recorded = await asyncio.to_thread(_dead_letter, delivery_id, self.owner, error)
+            else:
+                delay_s = retry_delay_s(int(row["attempts"]))
+                recorded = await asyncio.to_thread(_schedule_retry, delivery_id, self.owner, error, delay_s)
+                if recorded:
+                    logger.info("Delivery %s to %s failed (attempt %s), retrying in %.1fs: %s",
+                                delivery_id, row["destination"], row["attempts"], delay_s, error)
+                    return
+        else:
+            recorded = await asyncio.to_thread(_mark_delivered, delivery_id, self.owner, result)
+        if not recorded:
+            logger.warning("Delivery %s lease expired before its outcome was recorded; the new holder decides", delivery_id)
+        for future in self._waiters.get(delivery_id, ()):
+            if not future.done():
+                future.set_result(None)
+
+
+def _claim_due(owner: str, limit: int, busy: dict[str, int]) -> list[dict[str, Any]]:
+    with SessionLocal() as db:
+        return OutboundDeliveryStore(db).claim_due(
+            owner=owner,
+            limit=limit,
+            lease_s=max(30.0, float(settings.outbound_delivery_lease_s)),
+            per_destination=max(1, int(settings.outbound_delivery_per_destination)),
+            busy=busy,
+        )
+
+
+def _load_delivery(delivery_id: str) -> dict[str, Any] | None:
+    with SessionLocal() as db:
+        return OutboundDeliveryStore(db).get(delivery_id)
+
+
+def _load_integration(integration_id: str) -> dict[str, Any] | None:
+    with SessionLocal() as db:
+        return OutboundDeliveryStore(db).load_integration(integration_id)
+
+
+def _mark_delivered(delivery_id: str, owner: str, result: dict[str, Any]) -> bool:
+    with SessionLocal() as db:
+        return OutboundDeliveryStore(db).mark_delivered(delivery_id, owner=owner, result=result)
+
+
+def _schedule_retry(delivery_id: str, owner: str, error: str, delay_s: float) -> bool:
+    with SessionLocal() as db:
+        return OutboundDeliveryStore(db).schedule_retry(delivery_id, owner=owner, error=error, delay_s=delay_s)
+
+
+def _dead_letter(delivery_id: str, owner: str, error: str) -> bool:
+    with SessionLocal() as db:
+        return OutboundDeliveryStore(db).dead_letter(delivery_id, owner=owner, error=error)
+
+
+delivery_worker = DeliveryWorker()
@@ -1,11 +1,126 @@
 from __future__ import annotations
 
+import asyncio
+import time
+from dataclasses import dataclass, field
 from email.message import EmailMessage
 
 import aiosmtplib
 
+from app.settings import settings
+
+_SMTP_TIMEOUT_S = 20
+# Errors that mean the connection itself is gone (server idle timeout, reset), not the message.
+_DISCONNECTED = (aiosmtplib.SMTPServerDisconnected, ConnectionError)
+
+PoolKey = tuple[str, int, str, bool]
+
+
+@dataclass
+class _PooledConnection:
+    client: aiosmtplib.SMTP
+    last_used: float = field(default_factory=time.monotonic)
+    messages_sent: int = 0
+
+
+class SMTPPool:
+    """
+    Logged-in SMTP connections to one server and account, reused across sends.
+
+    At most SMTP_POOL_PER_SERVER messages are in flight at once, each on its own connection.
+    Connections idle longer than SMTP_POOL_IDLE_TIMEOUT_S, or that have sent
+    SMTP_POOL_MAX_MESSAGES_PER_CONNECTION messages, are closed instead of reused. A send on a
+    reused connection the server has since dropped is retried once on a fresh connection.
+    """
+
+    def __init__(self, key: PoolKey, *, password: str) -> None:
+        self.hostname, self.port, self.username, self.use_tls = key
+        self.password = password
+        self._slots = asyncio.Semaphore(max(1, int(settings.smtp_pool_per_server)))
+        self._idle: list[_PooledConnection] = []
+
+    async def send(self, message: EmailMessage) -> None:
+        async with self._slots:
+            conn = self._take_idle()
+            reused = conn is not None
+            if conn is None:
+                conn = await self._connect()
+            try:
+                await conn.client.send_message(message)
+            except _DISCONNECTED:
+                _close(conn)
+                if not reused:
+                    raise
+                conn = await self._connect()
+                try:
+                    await conn.client.send_message(message)
+                except BaseException:
+                    _close(conn)
+                    raise
+            except BaseException:
+                # The session state after a refused or interrupted message is unknown; start clean.
+                _close(conn)
+                raise
+            conn.messages_sent += 1
+            conn.last_used = time.monotonic()
+            if conn.messages_sent < max(1, int(settings.smtp_pool_max_messages_per_connection)):
+                self._idle.append(conn)
+            else:
+                await _quit(conn)
+
+    def _take_idle(self) -> _PooledConnection | None:
+        cutoff = time.monotonic() - max(1.0, float(settings.smtp_pool_idle_timeout_s))
+        while self._idle:
+            conn = self._idle.pop()  # most recently used first; it is the least likely to be dropped
+            if conn.last_used >= cutoff and conn.client.is_connected:
+                return conn
+            _close(conn)
+        return None
+
+    async def _connect(self) -> _PooledConnection:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+            timeout=_SMTP_TIMEOUT_S,
+        )
+        await client.connect()
+        return _PooledConnection(client=client)
+
+    def close_idle(self, *, older_than_s: float = 0.0) -> None:
+        cutoff = time.monotonic() - older_than_s
+        keep = [conn for conn in self._idle if conn.last_used > cutoff and conn.client.is_connected]
+        for conn in self._idle:
+            if conn not in keep:
+                _close(conn)
+        self._idle = keep
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(_quit(conn) for conn in idle), return_exceptions=True)
+
+
+def _close(conn: _PooledConnection) -> None:
+    try:
+        conn.client.close()
+    except Exception:
+        pass
+
+
+async def _quit(conn: _PooledConnection) -> None:
+    try:
+        await conn.client.quit()
+    except Exception:
+        _close(conn)
+
 
 class EmailIntegration:
+    def __init__(self) -> None:
+        # Pools are bound to the event loop their connections were opened on (see http_session).
+        self._pools: dict[int, tuple[asyncio.AbstractEventLoop, dict[PoolKey, SMTPPool]]] = {}
+
     async def send_email(
         self,
         *,
@@ -28,21 +143,58 @@ class EmailIntegration:
         message["Subject"] = subject
         message.set_content(body)
 
-        await aiosmtplib.send(
-            message,
-            hostname=smtp_host,
-            port=int(smtp_port),
-            username=smtp_user,
-            password=smtp_password,
-            use_tls=use_tls,
-            timeout=20,
-        )
+        if not settings.smtp_pool_enabled:
+            await aiosmtplib.send(
+                message,
+                hostname=smtp_host,
+                port=int(smtp_port),
+                username=smtp_user,
+                password=smtp_password,
+                use_tls=use_tls,
+                timeout=_SMTP_TIMEOUT_S,
+            )
+            return {"ok": True}
+
+        pool = self._pool((smtp_host.strip().lower(), int(smtp_port), smtp_user, bool(use_tls)), password=smtp_password)
+        await pool.send(message)
         return {"ok": True}
 
+    def _pool(self, key: PoolKey, *, password: str) -> SMTPPool:
+        loop = asyncio.get_running_loop()
+        row = self._pools.get(id(loop))
+        if row is None or row[0] is not loop:
+            for loop_id, (other_loop, _) in list(self._pools.items()):
+                if other_loop.is_closed():
+                    self._pools.pop(loop_id, None)
+            row = (loop, {})
+            self._pools[id(loop)] = row
+        pools = row[1]
+        pool = pools.get(key)
+        if pool is None:
+            pool = pools[key] = SMTPPool(key, password=password)
+        elif pool.password != password:
+            # Rotated credentials: new connections log in with the new password, old ones drain.
+            pool.password = password
+            pool.close_idle()
+        idle_timeout_s = max(1.0, float(settings.smtp_pool_idle_timeout_s))
+        for other in pools.values():
+            other.close_idle(older_than_s=idle_timeout_s)
+        return pool
+
+    async def close(self) -> None:
+        """Close the pooled connections of the running event loop."""
+        row = self._pools.pop(id(asyncio.get_running_loop()), None)
+        if row is not None:
+            await asyncio.gather(*(pool.close() for pool in row[1].values()), return_exceptions=True)
+
     def send_email_sync(self, **kwargs) -> dict:
-        import asyncio
+        async def send_and_close() -> dict:
+            try:
+                return await self.send_email(**kwargs)
+            finally:
+                await self.close()
 
-        return asyncio.run(self.send_email(**kwargs))
+        return asyncio.run(send_and_close())
 
 
 email_integration = EmailIntegration()
@@ -5,6 +5,8 @@ from typing import Any
 
 import aiohttp
 
+from app.http_session import get_http_session
+
 
 class WebhookIntegration:
     async def send_webhook(
@@ -26,31 +28,31 @@ class WebhookIntegration:
 
         delay = 1.0
         last_error: Exception | None = None
-        async with aiohttp.ClientSession() as session:
-            for attempt in range(1, max(1, attempts) + 1):
-                try:
-                    async with session.post(
-                        target,
-                        json=payload,
-                        headers=request_headers,
-                        timeout=max(3, int(timeout_s)),
-                    ) as response:
-                        if response.status < 400:
-                            # Read text to ensure connection closes cleanly
-                            text = await response.text()
-                            return {
-                                "ok": True,
-                                "status_code": response.status,
-                                "attempt": attempt,
-                                "response_text": text[:1000],
-                            }
-                        last_error = RuntimeError(f"Webhook failed with HTTP {response.status}")
-                except Exception as exc:  # noqa: BLE001
-                    last_error = exc
-
-                if attempt < attempts:
-                    await asyncio.sleep(delay)
-                    delay = min(delay * 2, 8.0)
+        session = get_http_session()
+        for attempt in range(1, max(1, attempts) + 1):
+            try:
+                async with session.post(
+                    target,
+                    json=payload,
+                    headers=request_headers,
+                    timeout=aiohttp.ClientTimeout(total=max(3, int(timeout_s))),
+                ) as response:
+                    if response.status < 400:
+                        # Read the body so the pooled connection is released cleanly
+                        text = await response.text()
+                        return {
+                            "ok": True,
+                            "status_code": response.status,
+                            "attempt": attempt,
+                            "response_text": text[:1000],
+                        }
+                    last_error = RuntimeError(f"Webhook failed with HTTP {response.status}")
+            except Exception as exc:  # noqa: BLE001
+                last_error = exc
+
+            if attempt < attempts:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 8.0)
 
         raise RuntimeError(str(last_error) if last_error else "Webhook failed")
 
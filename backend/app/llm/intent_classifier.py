@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import re
+import threading
+from dataclasses import dataclass
+
+SEARCH_INDICATORS: tuple[str, ...] = (
+    "current",
+    "currently",
+    "latest",
+    "recent",
+    "today",
+    "this week",
+    "this month",
+    "this year",
+    "now",
+    "right now",
+    "news",
+    "breaking",
+    "announcement",
+    "update",
+    "happening",
+    "price of",
+    "stock price",
+    "market",
+    "trading at",
+    "weather",
+    "temperature",
+    "forecast",
+    "who is currently",
+    "what is the status",
+    "score",
+    "game",
+    "match",
+    "tournament",
+)
+
+SEARCH_QUESTION_PATTERNS: tuple[str, ...] = (
+    r"what'?s?\s+(?:the\s+)?(?:latest|current|recent)",
+    r"who\s+is\s+(?:the\s+)?current(?:ly)?",
+    r"when\s+(?:is|was)\s+(?:the\s+)?(?:next|last)",
+    r"how\s+much\s+(?:is|does|costs?)",
+    r"what\s+happened\s+(?:today|yesterday|recently)",
+    r"is\s+.+\s+still\b",
+)
+
+DOC_HINTS: tuple[str, ...] = (
+    "hours",
+    "pricing",
+    "price",
+    "security",
+    "privacy",
+    "policy",
+    "refund",
+    "cancel",
+    "onboarding",
+    "getting started",
+    "integration",
+    "integrations",
+    "compliance",
+    "department",
+    "agents",
+    "capabilities",
+    "support",
+)
+
+# A bare question word is not enough to hit the knowledge base; it has to be about "us".
+DOC_QUESTION_WORDS: tuple[str, ...] = ("what", "how", "when", "where")
+DOC_SUBJECT_WORDS: tuple[str, ...] = ("your", "our", "company", "account", "subscription")
+
+COMPLEX_KEYWORDS: tuple[str, ...] = (
+    "strategy",
+    "architecture",
+    "legal",
+    "medical",
+    "diagnose",
+    "financial",
+    "optimize",
+    "tradeoff",
+    "multi-step",
+    "root cause",
+)
+MEDIUM_KEYWORDS: tuple[str, ...] = ("analyze", "compare", "summarize", "plan", "evaluate", "design")
+
+DEPARTMENT_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "Customer Experience": ("support", "ticket", "complaint", "customer", "onboarding", "faq"),
+    "Sales & Business Development": ("lead", "prospect", "pipeline", "outreach", "closing", "sales"),
+    "Marketing & Creative": ("blog", "copy", "campaign", "social", "content", "brand"),
+    "Operations & Admin": ("calendar", "schedule", "priorities", "travel", "admin", "process"),
+    "Technical & IT": ("api", "code", "bug", "deploy", "infra", "security", "database", "sql"),
+    "Specialized Services": ("legal", "compliance", "finance", "audit", "contract", "policy"),
+}
+
+
+@dataclass(frozen=True)
+class IntentSignals:
+    needs_search: bool
+    needs_docs: bool
+    department: str | None
+    complex_hits: int
+    medium_hits: int
+    word_count: int
+
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+_INFLECTIONS = ("ing", "es", "ed", "s", "d")
+# Only messages containing one of these words can match SEARCH_QUESTION_PATTERNS.
+_QUESTION_TRIGGERS = frozenset({"what", "who", "when", "how", "is"})
+
+
+class IntentClassifier:
+    """
+    Single-pass keyword matcher shared by search, docs, routing and referral heuristics.
+
+    All keyword lists are compiled into one phrase table indexed by first token. A message is
+    tokenized once, each token is mapped to its keyword stem ("pricing" -> "price"), and only
+    phrases starting with that stem are compared, so the cost is linear in message length
+    instead of (keywords x message length) substring scans.
+    """
+
+    def __init__(self) -> None:
+        labels: dict[tuple[str, ...], set[str]] = {}
+
+        def add(keyword: str, label: str) -> None:
+            labels.setdefault(tuple(_TOKEN_PATTERN.findall(keyword)), set()).add(label)
+
+        for keyword in SEARCH_INDICATORS:
+            add(keyword, "search")
+        for keyword in DOC_HINTS:
+            add(keyword, "docs")
+        for keyword in DOC_QUESTION_WORDS:
+            add(keyword, "question")
+        for keyword in DOC_SUBJECT_WORDS:
+            add(keyword, "subject")
+        for keyword in COMPLEX_KEYWORDS:
+            add(keyword, f"complex:{keyword}")
+        for keyword in MEDIUM_KEYWORDS:
+            add(keyword, f"medium:{keyword}")
+        for department, keywords in DEPARTMENT_KEYWORDS.items():
+            for keyword in keywords:
+                add(keyword, f"dept:{department}")
+
+        # Phrases indexed by first token; the longest candidates are tried first.
+        self._phrases: dict[str, list[tuple[tuple[str, ...], frozenset[str]]]] = {}
+        for phrase, phrase_labels in sorted(labels.items(), key=lambda item: -len(item[0])):
+            self._phrases.setdefault(phrase[0], []).append((phrase[1:], frozenset(phrase_labels)))
+        self._vocabulary = frozenset(token for phrase in labels for token in phrase)
+        self._question_pattern = re.compile("|".join(f"(?:{p})" for p in SEARCH_QUESTION_PATTERNS))
+        self._department_order = list(DEPARTMENT_KEYWORDS.keys())
+
+        self._memo_lock = threading.Lock()
+        self._stems: dict[str, str] = {}
+        self._memo: dict[str, IntentSignals] = {}
+
+    def _stem(self, token: str) -> str:
+        stem = self._stems.get(token)
+        if stem is not None:
+            return stem
+        stem = token
+        if token not in self._vocabulary:
+            for suffix in _INFLECTIONS:
+                if token.endswith(suffix) and len(token) > len(suffix) + 2:
+                    base = token[: -len(suffix)]
+                    if base in self._vocabulary:
+                        stem = base
+                        break
+                    if base + "e" in self._vocabulary:
+                        stem = base + "e"
+                        break
+        if len(self._stems) < 50000:
+            self._stems[token] = stem
+        return stem
+
+    def classify(self, message: str) -> IntentSignals:
+        content = (message or "").lower()
+        # One turn classifies the same user message from several call sites.
+        memoize = len(content) <= 4000
+        if memoize:
+            with self._memo_lock:
+                cached = self._memo.get(content)
+            if cached is not None:
+                return cached
+
+        tokens = [self._stem(token) for token in _TOKEN_PATTERN.findall(content)]
+        found: set[str] = set()
+        phrases = self._phrases
+        for i, token in enumerate(tokens):
+            candidates = phrases.get(token)
+            if candidates is None:
+                continue
+            for rest, phrase_labels in candidates:
+                if not rest or tuple(tokens[i + 1 : i + 1 + len(rest)]) == rest:
+                    found |= phrase_labels
+        if "search" not in found and _QUESTION_TRIGGERS.intersection(tokens) and self._question_pattern.search(content):
+            found.add("search")
+
+        word_count = len(content.split())
+        department = next((d for d in self._department_order if f"dept:{d}" in found), None)
+        signals = IntentSignals(
+            needs_search="search" in found,
+            needs_docs=word_count >= 3 and ("docs" in found or ("question" in found and "subject" in found)),
+            department=department,
+            complex_hits=sum(1 for label in found if label.startswith("complex:")),
+            medium_hits=sum(1 for label in found if label.startswith("medium:")),
+            word_count=word_count,
+        )
+        if memoize:
+            with self._memo_lock:
+                if len(self._memo) >= 512:
+                    self._memo.clear()
+                self._memo[content] = signals
+        return signals
+
+
+class IntentPrecisionTracker:
+    """Counts how often a triggered tool produced context, and how often the reply used it."""
+
+    _MIN_SHARED_TOKENS = 3
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def is_referenced(self, *, response: str, context_block: str, user_message: str) -> bool:
+        # Distinctive context tokens are the ones the user didn't already say; if the reply repeats
+        # a few of them, the injected block was most likely used.
+        context_tokens = {t for t in _TOKEN_PATTERN.findall((context_block or "").lower()) if len(t) >= 5}
+        context_tokens -= set(_TOKEN_PATTERN.findall((user_message or "").lower()))
+        if not context_tokens:
+            return False
+        response_tokens = set(_TOKEN_PATTERN.findall((response or "").lower()))
+        return len(context_tokens & response_tokens) >= min(self._MIN_SHARED_TOKENS, len(context_tokens))
+
+    def record(self, intent: str, *, triggered: bool, produced_context: bool, referenced: bool) -> None:
+        if not triggered:
+            return
+        with self._lock:
+            row = self._counts.setdefault(intent, {"triggered": 0, "produced_context": 0, "referenced": 0})
+            row["triggered"] += 1
+            row["produced_context"] += int(produced_context)
+            row["referenced"] += int(referenced)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            out: dict[str, dict[str, float]] = {}
+            for intent, row in self._counts.items():
+                triggered = row["triggered"]
+                out[intent] = {
+                    **row,
+                    "wasted": triggered - row["referenced"],
+                    "precision": round(row["referenced"] / triggered * 100.0, 2) if triggered else 0.0,
+                }
+            return out
+
+
+intent_classifier = IntentClassifier()
+intent_precision = IntentPrecisionTracker()
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import logging
 import time
 import uuid
@@ -8,7 +10,12 @@ from typing import Any
 from sqlalchemy import text
 
 from app.db import SessionLocal
+from app.files.images import ImageInput, is_image, pick_variant
+from app.llm.intent_classifier import intent_classifier, intent_precision
 from app.llm.search_detector import search_detector
+from app.llm.streaming import TokenCallback, complete as complete_llm
+from app.llm.vision import build_user_content
+from app.retrieval import knowledge_index
 from app.runtime.model_policy import model_policy_service
 from app.runtime.tool_registry import ToolCallContext, tool_registry
 from app.settings import settings
@@ -106,41 +113,131 @@ def inject_memories(*, org_id: str | None, agent_code: str | None, user_message:
         return ""
 
 
-def inject_file_context(*, org_id: str | None, file_ids: list[str] | None) -> str:
+def _index_unindexed_files(db, *, org_id: str, file_ids: list[str]) -> None:
+    """Backfill passages for files uploaded before upload-time indexing existed."""
+    rows = db.execute(
+        text(
+            """
+            select f.file_id, f.filename, f.file_type,
+                   coalesce(nullif(f.extracted_text, ''), b.extracted_text, '') as extracted_text
+            from uploaded_files f
+            left join file_blobs b on b.sha256 = f.sha256
+            where f.org_id = :org_id
+              and f.is_active = true
+              and f.file_id = any(cast(:file_ids as uuid[]))
+              and coalesce(nullif(f.extracted_text, ''), b.extracted_text, '') <> ''
+              and not exists (
+                select 1 from knowledge_chunks c where c.source_type = 'file' and c.source_id = f.file_id
+              );
+            """
+        ),
+        {"org_id": org_id, "file_ids": file_ids},
+    ).mappings().all()
+    published = []
+    for row in rows:
+        # Images have no passages; legacy rows may still hold a base64 data URI as their text.
+        if is_image(str(row["file_type"] or ""), str(row["filename"] or "")):
+            continue
+        # Same cap as upload-time extraction.
+        extracted = str(row["extracted_text"] or "")[:100_000]
+        keys, vectors = knowledge_index.write_chunks(
+            db,
+            source_type="file",
+            source_id=str(row["file_id"]),
+            org_id=org_id,
+            title=str(row["filename"]),
+            content=extracted,
+            category=None,
+            source_hash=hashlib.sha256(extracted.encode("utf-8")).hexdigest(),
+        )
+        published.append((str(row["file_id"]), keys, vectors))
+    if published:
+        db.commit()
+        for file_id, keys, vectors in published:
+            knowledge_index.publish(org_id=org_id, source_type="file", source_id=file_id, keys=keys, vectors=vectors)
+
+
+def inject_file_context(*, org_id: str | None, file_ids: list[str] | None, query: str = "") -> str:
+    """
+    Attach the passages of the referenced files most relevant to `query`.
+
+    Files are chunked and indexed at upload; only the top-scoring passages that fit the
+    FILE_CONTEXT_TOKEN_BUDGET are injected. When nothing matches (e.g. "summarize this"),
+    each file's opening passages are used instead.
+    """
     scoped_org = (org_id or "").strip()
     if not scoped_org or not file_ids:
         return ""
-    clean_ids = [item.strip() for item in file_ids if item and item.strip()]
+    clean_ids = [item.strip() for item in file_ids if item and item.strip()][:8]
     if not clean_ids:
         return ""
     try:
         with SessionLocal() as db:
-            rows = db.execute(
+            files = db.execute(
                 text(
                     """
-                    select file_id, filename, file_type, extracted_text
+                    select file_id, filename, file_type
                     from uploaded_files
                     where org_id = :org_id
                       and is_active = true
-                      and file_id = any(:file_ids::uuid[])
-                    order by uploaded_at desc
-                    limit 8;
+                      and file_id = any(cast(:file_ids as uuid[]))
+                    order by uploaded_at desc;
                     """
                 ),
                 {"org_id": scoped_org, "file_ids": clean_ids},
             ).mappings().all()
-        if not rows:
+            if not files:
+                return ""
+            active_ids = [str(row["file_id"]) for row in files]
+            _index_unindexed_files(db, org_id=scoped_org, file_ids=active_ids)
+
+            budget_chars = max(500, int(settings.file_context_token_budget) * 4)
+            passages = []
+            if query.strip():
+                passages = knowledge_index.search(
+                    query,
+                    limit=12,
+                    org_id=scoped_org,
+                    source_type="file",
+                    source_ids=active_ids,
+                )
+            if not passages:
+                passages = db.execute(
+                    text(
+                        """
+                        select source_id as id, chunk_index, content
+                        from knowledge_chunks
+                        where source_type = 'file'
+                          and source_id = any(cast(:file_ids as uuid[]))
+                          and chunk_index < 2
+                        order by chunk_index, source_id;
+                        """
+                    ),
+                    {"file_ids": active_ids},
+                ).mappings().all()
+
+        # Images have no text; they reach the model as image parts (see load_image_inputs).
+        by_file = {
+            str(row["file_id"]): row for row in files if not is_image(str(row["file_type"] or ""), str(row["filename"] or ""))
+        }
+        if not by_file:
             return ""
         lines = ["[UPLOADED FILE CONTEXT]"]
-        for row in rows:
-            text_excerpt = str(row.get("extracted_text") or "").strip()
-            if len(text_excerpt) > 2000:
-                text_excerpt = text_excerpt[:2000].rstrip() + "..."
-            if not text_excerpt:
-                text_excerpt = "No extractable text content."
+        used = 0
+        with_text: set[str] = set()
+        for passage in passages:
+            file_row = by_file.get(str(passage["id"]))
+            content = str(passage["content"] or "").strip()
+            if file_row is None or not content or used + len(content) > budget_chars:
+                continue
+            used += len(content)
+            with_text.add(str(passage["id"]))
             lines.append(
-                f"- {row['filename']} ({row['file_type']}):\n{text_excerpt}"
+                f"- {file_row['filename']} ({file_row['file_type']}), passage {int(passage['chunk_index']) + 1}:\n{content}"
             )
+        for file_id, file_row in by_file.items():
+            if file_id not in with_text:
+                lines.append(f"- {file_row['filename']} ({file_row['file_type']}): No relevant text content.")
         lines.append("[END UPLOADED FILE CONTEXT]")
         return "\n\n".join(lines)
     except Exception as exc:
@@ -148,6 +245,53 @@ def inject_file_context(*, org_id: str | None, file_ids: list[str] | None) -> st
         return ""
 
 
+def load_image_inputs(*, org_id: str | None, file_ids: list[str] | None) -> list[ImageInput]:
+    """Resolve referenced image uploads to their resized variant files (no bytes are read here)."""
+    scoped_org = (org_id or "").strip()
+    if not scoped_org or not file_ids:
+        return []
+    clean_ids = [item.strip() for item in file_ids if item and item.strip()][:8]
+    if not clean_ids:
+        return []
+    max_px = max(64, int(settings.vision_image_max_px))
+    try:
+        with SessionLocal() as db:
+            rows = db.execute(
+                text(
+                    """
+                    select f.file_id, f.filename, f.file_type, f.file_path, f.sha256, b.image_meta
+                    from uploaded_files f
+                    left join file_blobs b on b.sha256 = f.sha256
+                    where f.org_id = :org_id
+                      and f.is_active = true
+                      and f.file_id = any(cast(:file_ids as uuid[]))
+                    order by f.uploaded_at;
+                    """
+                ),
+                {"org_id": scoped_org, "file_ids": clean_ids},
+            ).mappings().all()
+    except Exception as exc:
+        logger.error("Image attachment lookup failed: %s", exc)
+        return []
+
+    images: list[ImageInput] = []
+    for row in rows:
+        if not is_image(str(row["file_type"] or ""), str(row["filename"] or "")):
+            continue
+        variant = pick_variant(row["image_meta"], max_px)
+        images.append(
+            ImageInput(
+                file_id=str(row["file_id"]),
+                filename=str(row["filename"]),
+                path=str(variant["path"]) if variant else str(row["file_path"]),
+                mime_type=str((row["image_meta"] or {}).get("mime_type") or "image/jpeg"),
+                sha256=str(row["sha256"] or ""),
+                resize_px=None if variant else max_px,
+            )
+        )
+    return images[: max(0, int(settings.vision_max_images))]
+
+
 def _truncate_context(text: str, max_chars: int = 120000) -> str:
     """
     Simple character-based truncation to prevent context window overflows.
@@ -183,12 +327,18 @@ async def execute_via_litellm(
     session_id: str | None = None,
     agent_code: str | None = None,
     file_ids: list[str] | None = None,
+    on_token: TokenCallback | None = None,
 ) -> dict[str, Any]:
     trace_id = trace_id or str(uuid.uuid4())
     search_used = False
     docs_used = False
+    search_block = ""
+    docs_block = ""
     user_message = user
     additional_blocks: list[str] = []
+    signals = intent_classifier.classify(user)
+    search_triggered = bool(enable_search and settings.enable_web_search and signals.needs_search)
+    docs_triggered = bool(enable_docs and settings.enable_document_retrieval and signals.needs_docs)
 
     runtime_context = ToolCallContext(
         org_id=(org_id or "org_test"),
@@ -198,51 +348,51 @@ async def execute_via_litellm(
     memory_context = inject_memories(org_id=org_id, agent_code=agent_code, user_message=user)
     if memory_context:
         additional_blocks.append(memory_context)
-    file_context = inject_file_context(org_id=org_id, file_ids=file_ids)
+    # Hybrid search plus a possible backfill (chunk, embed, index write) must stay off the loop.
+    file_context = await asyncio.to_thread(inject_file_context, org_id=org_id, file_ids=file_ids, query=user)
     if file_context:
         additional_blocks.append(file_context)
+    images = await asyncio.to_thread(load_image_inputs, org_id=org_id, file_ids=file_ids)
 
-    if enable_search and settings.enable_web_search:
+    if search_triggered:
         try:
-            if search_detector.needs_search(user):
-                query = search_detector.extract_search_query(user)
-                call = tool_registry.run(
-                    tool_name="web_search",
-                    context=runtime_context,
-                    args={"query": query, "num_results": 5},
-                )
-                if call.get("ok"):
-                    formatted = (((call.get("data") or {}).get("formatted")) or "").strip()
-                    if formatted:
-                        additional_blocks.append(
-                            "[CURRENT WEB INFORMATION]\n"
-                            f"Search query: {query}\n"
-                            f"{formatted}\n"
-                            "[END WEB INFORMATION]"
-                        )
-                        search_used = True
+            query = search_detector.extract_search_query(user)
+            call = await tool_registry.run(
+                tool_name="web_search",
+                context=runtime_context,
+                args={"query": query, "num_results": 5},
+            )
+            if call.get("ok"):
+                formatted = (((call.get("data") or {}).get("formatted")) or "").strip()
+                if formatted:
+                    search_block = formatted
+                    additional_blocks.append(
+                        "[CURRENT WEB INFORMATION]\n"
+                        f"Search query: {query}\n"
+                        f"{formatted}\n"
+                        "[END WEB INFORMATION]"
+                    )
+                    search_used = True
         except Exception as e:
             logger.error("Web search integration failed: %s", e)
 
-    if enable_docs and settings.enable_document_retrieval:
+    if docs_triggered:
         try:
-            from app.tools.document_search import doc_search
-
-            if doc_search.needs_docs(user):
-                call = tool_registry.run(
-                    tool_name="document_search",
-                    context=runtime_context,
-                    args={"query": user, "limit": 3},
-                )
-                if call.get("ok"):
-                    formatted_docs = (((call.get("data") or {}).get("formatted")) or "").strip()
-                    if formatted_docs and "No relevant internal documents found." not in formatted_docs:
-                        additional_blocks.append(
-                            "[COMPANY KNOWLEDGE BASE]\n"
-                            f"{formatted_docs}\n"
-                            "[END KNOWLEDGE BASE]"
-                        )
-                        docs_used = True
+            call = await tool_registry.run(
+                tool_name="document_search",
+                context=runtime_context,
+                args={"query": user, "limit": 3},
+            )
+            if call.get("ok"):
+                formatted_docs = (((call.get("data") or {}).get("formatted")) or "").strip()
+                if formatted_docs and "No relevant internal documents found." not in formatted_docs:
+                    docs_block = formatted_docs
+                    additional_blocks.append(
+                        "[COMPANY KNOWLEDGE BASE]\n"
+                        f"{formatted_docs}\n"
+                        "[END KNOWLEDGE BASE]"
+                    )
+                    docs_used = True
         except Exception as e:
             logger.error("Document retrieval integration failed: %s", e)
 
@@ -256,6 +406,56 @@ async def execute_via_litellm(
     # Simple truncation to prevent context window overflow
     user_message = _truncate_context(user_message)
 
+    result = await _complete(
+        provider=provider,
+        model=model,
+        system=system,
+        user=user,
+        user_message=user_message,
+        trace_id=trace_id,
+        org_id=org_id,
+        agent_code=agent_code,
+        images=images,
+        on_token=on_token,
+    )
+    response_text = str(result.get("response") or "")
+    search_referenced = search_used and intent_precision.is_referenced(
+        response=response_text, context_block=search_block, user_message=user
+    )
+    docs_referenced = docs_used and intent_precision.is_referenced(
+        response=response_text, context_block=docs_block, user_message=user
+    )
+    intent_precision.record("search", triggered=search_triggered, produced_context=search_used, referenced=search_referenced)
+    intent_precision.record("docs", triggered=docs_triggered, produced_context=docs_used, referenced=docs_referenced)
+    result.update(
+        {
+            "search_used": search_used,
+            "docs_used": docs_used,
+            "search_triggered": search_triggered,
+            "docs_triggered": docs_triggered,
+            "search_referenced": search_referenced,
+            "docs_referenced": docs_referenced,
+            "images_attached": int(result.get("images_attached") or 0),
+            "images_dropped": len(images) - int(result.get("images_attached") or 0),
+        }
+    )
+    return result
+
+
+async def _complete(
+    *,
+    provider: str,
+    model: str,
+    system: str,
+    user: str,
+    user_message: str,
+    trace_id: str,
+    org_id: str | None,
+    agent_code: str | None,
+    images: list[ImageInput] | None = None,
+    on_token: TokenCallback | None = None,
+) -> dict[str, Any]:
+    images = images or []
     if org_id:
         preference = model_policy_service.get_preference(org_id=org_id, agent_code=agent_code)
         if preference:
@@ -278,7 +478,9 @@ async def execute_via_litellm(
                     trace_id=trace_id,
                     preferred_provider=(provider or None),
                     preferred_model=(model or None),
-                )
+                    images=tuple(images),
+                ),
+                on_token=on_token,
             )
             return {
                 "trace_id": routed.get("trace_id") or trace_id,
@@ -290,8 +492,7 @@ async def execute_via_litellm(
                 "cached": bool(routed.get("cached")),
                 "route_level": routed.get("route_level"),
                 "complexity_score": routed.get("complexity_score"),
-                "search_used": search_used,
-                "docs_used": docs_used,
+                "images_attached": int(routed.get("images_attached") or 0),
             }
         except Exception as e:
             # If request relies entirely on router (no explicit provider/model), surface router failure directly.
@@ -305,6 +506,8 @@ async def execute_via_litellm(
     if settings.llm_mock:
         start = time.perf_counter()
         reply = f"[MOCK:{model_used}] {user}"
+        if on_token is not None:
+            on_token(reply)
         latency_ms = int((time.perf_counter() - start) * 1000)
         return {
             "trace_id": trace_id,
@@ -312,10 +515,10 @@ async def execute_via_litellm(
             "latency_ms": latency_ms,
             "response": reply,
             "tokens_used": max(1, len(user.split()) * 2),
-            "search_used": search_used,
-            "docs_used": docs_used,
         }
 
+    user_content, images_attached = await build_user_content(model_used=model_used, text=user_message, images=images)
+
     try:
         from litellm import acompletion  # type: ignore[import-not-found]
     except Exception as e:  # pragma: no cover
@@ -325,15 +528,22 @@ async def execute_via_litellm(
     retries = max(0, int(settings.litellm_retries))
     resp: Any = None
     last_error: Exception | None = None
-    
+    streamed: list[str] = []
+
+    def forward_token(delta: str) -> None:
+        streamed.append(delta)
+        on_token(delta)
+
     import asyncio
     for attempt in range(retries + 1):
         try:
-            resp = await acompletion(
+            resp = await complete_llm(
+                acompletion,
+                on_token=forward_token if on_token is not None else None,
                 model=model_used,
                 messages=[
                     {"role": "system", "content": system},
-                    {"role": "user", "content": user_message},
+                    {"role": "user", "content": user_content},
                 ],
                 metadata={"trace_id": trace_id},
                 timeout=max(5, int(settings.litellm_timeout_s)),
@@ -342,7 +552,8 @@ async def execute_via_litellm(
             break
         except Exception as e:
             last_error = e
-            if attempt >= retries or not _is_retryable_error(e):
+            # A retry after tokens were streamed would repeat them to the listener.
+            if attempt >= retries or streamed or not _is_retryable_error(e):
                 break
             # Non-blocking sleep
             await asyncio.sleep(min(1.5, 0.35 * (attempt + 1)))
@@ -413,6 +624,5 @@ async def execute_via_litellm(
         "response": text,
         "tokens_used": int((data.get("usage") or {}).get("total_tokens") or 0),
         "raw": data,
-        "search_used": search_used,
-        "docs_used": docs_used,
+        "images_attached": images_attached,
     }
@@ -7,6 +7,11 @@ import uuid
 from dataclasses import dataclass
 from typing import Any
 
+from app.files.images import ImageInput
+
+from app.llm.intent_classifier import COMPLEX_KEYWORDS, MEDIUM_KEYWORDS, intent_classifier
+from app.llm.streaming import TokenCallback, complete as complete_llm
+from app.llm.vision import build_user_content
 from app.settings import settings
 
 
@@ -22,6 +27,7 @@ class LLMRequest:
     preferred_provider: str | None = None
     preferred_model: str | None = None
     route_hint: str | None = None
+    images: tuple[ImageInput, ...] = ()
 
 
 def _is_retryable_error(exc: Exception) -> bool:
@@ -95,11 +101,22 @@ class BaseProvider:
         self.provider_name = provider_name
         self.default_model = default_model
 
-    async def execute(self, *, model: str | None, system: str, user: str, trace_id: str) -> dict[str, Any]:
+    async def execute(
+        self,
+        *,
+        model: str | None,
+        system: str,
+        user: str,
+        trace_id: str,
+        images: tuple[ImageInput, ...] = (),
+        on_token: TokenCallback | None = None,
+    ) -> dict[str, Any]:
         model_used = _normalize_model(self.provider_name, (model or self.default_model))
         if settings.llm_mock:
             start = time.perf_counter()
             content = f"[MOCK:{model_used}] {user}"
+            if on_token is not None:
+                on_token(content)
             return {
                 "trace_id": trace_id,
                 "model_used": model_used,
@@ -114,17 +131,25 @@ class BaseProvider:
         except Exception as e:  # pragma: no cover
             raise MultiLLMError("litellm is not installed. Run: pip install -r requirements.txt") from e
 
+        user_content, images_attached = await build_user_content(model_used=model_used, text=user, images=images)
         start = time.perf_counter()
         retries = max(0, int(settings.litellm_retries))
         resp: Any = None
         last_error: Exception | None = None
-        
+        streamed: list[str] = []
+
+        def forward_token(delta: str) -> None:
+            streamed.append(delta)
+            on_token(delta)
+
         import asyncio
         for attempt in range(retries + 1):
             try:
-                resp = await acompletion(
+                resp = await complete_llm(
+                    acompletion,
+                    on_token=forward_token if on_token is not None else None,
                     model=model_used,
-                    messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+                    messages=[{"role": "system", "content": system}, {"role": "user", "content": user_content}],
                     metadata={"trace_id": trace_id},
                     timeout=max(5, int(settings.litellm_timeout_s)),
                 )
@@ -132,7 +157,8 @@ class BaseProvider:
                 break
             except Exception as e:
                 last_error = e
-                if attempt >= retries or not _is_retryable_error(e):
+                # A retry after tokens were streamed would repeat them to the listener.
+                if attempt >= retries or streamed or not _is_retryable_error(e):
                     break
                 # Non-blocking sleep
                 await asyncio.sleep(min(1.5, 0.35 * (attempt + 1)))
@@ -168,6 +194,7 @@ class BaseProvider:
             "response": content,
             "tokens_used": tokens,
             "raw": data,
+            "images_attached": images_attached,
         }
 
 
@@ -197,23 +224,12 @@ class GroqProvider(BaseProvider):
 
 
 class ComplexityAnalyzer:
-    COMPLEX_KEYWORDS = (
-        "strategy",
-        "architecture",
-        "legal",
-        "medical",
-        "diagnose",
-        "financial",
-        "optimize",
-        "tradeoff",
-        "multi-step",
-        "root cause",
-    )
-    MEDIUM_KEYWORDS = ("analyze", "compare", "summarize", "plan", "evaluate", "design")
+    COMPLEX_KEYWORDS = COMPLEX_KEYWORDS
+    MEDIUM_KEYWORDS = MEDIUM_KEYWORDS
 
     def score(self, text: str) -> tuple[str, float]:
-        t = (text or "").lower()
-        words = len(t.split())
+        signals = intent_classifier.classify(text)
+        words = signals.word_count
         score = 0.0
         if words > 200:
             score += 0.45
@@ -222,10 +238,8 @@ class ComplexityAnalyzer:
         else:
             score += 0.08
 
-        complex_hits = sum(1 for k in self.COMPLEX_KEYWORDS if k in t)
-        medium_hits = sum(1 for k in self.MEDIUM_KEYWORDS if k in t)
-        score += min(0.50, complex_hits * 0.14)
-        score += min(0.36, medium_hits * 0.12)
+        score += min(0.50, signals.complex_hits * 0.14)
+        score += min(0.36, signals.medium_hits * 0.12)
         score = min(1.0, score)
 
         if score >= 0.50:
@@ -250,8 +264,8 @@ class ResponseCache:
             for k in list(self._items.keys())[: len(self._items) - self.max_items]:
                 self._items.pop(k, None)
 
-    def make_key(self, *, provider: str, model: str, system: str, user: str) -> str:
-        payload = f"{provider}|{model}|{system}|{user}".encode("utf-8")
+    def make_key(self, *, provider: str, model: str, system: str, user: str, image_hashes: tuple[str, ...] = ()) -> str:
+        payload = f"{provider}|{model}|{system}|{user}|{','.join(image_hashes)}".encode("utf-8")
         return hashlib.sha256(payload).hexdigest()
 
     def get(self, key: str) -> dict[str, Any] | None:
@@ -350,14 +364,20 @@ class SmartMultiLLMRouter:
         model_used = _normalize_model(provider, model)
         return provider, model_used, level, score
 
-    async def execute(self, req: LLMRequest) -> dict[str, Any]:
+    async def execute(self, req: LLMRequest, on_token: TokenCallback | None = None) -> dict[str, Any]:
         provider_name, model_used, route_level, complexity_score = self._choose(req)
         provider = self.providers.get(provider_name)
         if provider is None:
             raise MultiLLMError(f"Unsupported provider: {provider_name}")
 
         cache_enabled = bool(getattr(settings, "multi_llm_cache_enabled", True))
-        cache_key = self.cache.make_key(provider=provider_name, model=model_used, system=req.system, user=req.user)
+        cache_key = self.cache.make_key(
+            provider=provider_name,
+            model=model_used,
+            system=req.system,
+            user=req.user,
+            image_hashes=tuple(image.sha256 for image in req.images),
+        )
         if cache_enabled:
             cached = self.cache.get(cache_key)
             if cached is not None:
@@ -366,6 +386,8 @@ class SmartMultiLLMRouter:
                 cached["route_level"] = route_level
                 cached["complexity_score"] = round(complexity_score, 3)
                 self.cost.track(model_used=model_used, tokens=int(cached.get("tokens_used") or 0), cache_hit=True)
+                if on_token is not None and cached.get("response"):
+                    on_token(str(cached["response"]))
                 return cached
 
         result = await provider.execute(
@@ -373,6 +395,8 @@ class SmartMultiLLMRouter:
             system=req.system,
             user=req.user,
             trace_id=req.trace_id or str(uuid.uuid4()),
+            images=req.images,
+            on_token=on_token,
         )
         result["cached"] = False
         result["route_level"] = route_level
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Callable
+
+TokenCallback = Callable[[str], None]
+
+
+def _as_dict(chunk: Any) -> dict[str, Any]:
+    if isinstance(chunk, dict):
+        return chunk
+    if hasattr(chunk, "model_dump"):
+        return chunk.model_dump()
+    if hasattr(chunk, "dict"):
+        return chunk.dict()
+    return {}
+
+
+async def collect_stream(stream: AsyncIterator[Any], on_token: TokenCallback) -> dict[str, Any]:
+    """
+    Drain a litellm `stream=True` response, forwarding each content delta to `on_token`.
+
+    Returns a completion-shaped dict (`choices[0].message.content`, `usage`) so callers can
+    reuse their non-streaming response handling.
+    """
+    parts: list[str] = []
+    usage: dict[str, Any] = {}
+    async for chunk in stream:
+        data = _as_dict(chunk)
+        choice = (data.get("choices") or [None])[0] or {}
+        delta = (choice.get("delta") or {}).get("content")
+        if isinstance(delta, str) and delta:
+            parts.append(delta)
+            on_token(delta)
+        if data.get("usage"):
+            usage = dict(data["usage"])
+    return {"choices": [{"message": {"content": "".join(parts)}}], "usage": usage}
+
+
+async def complete(acompletion: Callable[..., Any], *, on_token: TokenCallback | None, **kwargs: Any) -> Any:
+    """One litellm call; streamed through `on_token` when a callback is given."""
+    if on_token is None:
+        return await acompletion(**kwargs)
+    stream = await acompletion(stream=True, stream_options={"include_usage": True}, **kwargs)
+    return await collect_stream(stream, on_token)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from typing import Any, Sequence
+
+from app.files.images import ImageInput
+
+logger = logging.getLogger(__name__)
+
+# Used when litellm has no capability entry for a model (custom names, older releases).
+_VISION_MODEL_MARKERS = (
+    "gpt-4o",
+    "gpt-4.1",
+    "gpt-5",
+    "claude-3",
+    "claude-sonnet-4",
+    "claude-opus-4",
+    "claude-haiku-4",
+    "gemini",
+    "llava",
+    "vision",
+    "pixtral",
+)
+
+_capability_lock = threading.Lock()
+_capabilities: dict[str, bool] = {}
+
+
+def supports_vision(model_used: str) -> bool:
+    """Whether `provider/model` accepts image content parts; answers are memoized per model."""
+    key = (model_used or "").strip().lower()
+    if not key:
+        return False
+    with _capability_lock:
+        cached = _capabilities.get(key)
+    if cached is not None:
+        return cached
+    result: bool | None = None
+    try:
+        from litellm import supports_vision as litellm_supports_vision  # type: ignore[import-not-found]
+
+        result = bool(litellm_supports_vision(model=model_used))
+    except Exception:
+        result = None
+    if not result:
+        result = any(marker in key for marker in _VISION_MODEL_MARKERS)
+    with _capability_lock:
+        _capabilities[key] = result
+    return result
+
+
+async def build_user_content(
+    *, model_used: str, text: str, images: Sequence[ImageInput]
+) -> tuple[str | list[dict[str, Any]], int]:
+    """
+    User message content for `model_used` and how many images it carries.
+
+    Vision models get OpenAI-style content parts (text, then one labelled image part per
+    attachment); the image bytes are read from the pre-resized variants only here. Text-only
+    models get the plain text plus a note naming the images they cannot see.
+    """
+    if not images:
+        return text, 0
+    if not supports_vision(model_used):
+        names = ", ".join(image.filename for image in images)
+        return f"{text}\n\n[Attached images omitted: {model_used} does not accept image input ({names}).]", 0
+
+    def _parts() -> tuple[list[dict[str, Any]], int]:
+        parts: list[dict[str, Any]] = [{"type": "text", "text": text}]
+        attached = 0
+        for image in images:
+            try:
+                image_part = image.content_part()
+            except OSError as exc:
+                logger.warning("Skipping unreadable image %s: %s", image.file_id, exc)
+                continue
+            parts.append({"type": "text", "text": f"Attached image: {image.filename}"})
+            parts.append(image_part)
+            attached += 1
+        return parts, attached
+
+    return await asyncio.to_thread(_parts)
@@ -3,15 +3,24 @@ from __future__ import annotations
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api.routes import router
+from app.api.routes import execute_workflow_schedule, router
 from app.api.academy import router as academy_router
+from app.api.deliveries import router as deliveries_router
 from app.api.files import router as files_router
 from app.api.skills import router as skills_router
 from app.db import engine
+from app.files.executor import extraction_executor
+from app.http_session import close_http_session
+from app.integrations.delivery import delivery_worker
+from app.integrations.email import email_integration
+from app.retrieval import knowledge_index
 from app.middleware.error_handler import register_error_handlers
 from app.middleware.rate_limit import RateLimitMiddleware
+from app.middleware.upload_limit import UploadSizeLimitMiddleware
 from app.schema import ensure_schema
 from app.settings import settings
+from app.workflows.jobs import workflow_jobs
+from app.workflows.scheduler import workflow_scheduler
 
 app = FastAPI(title="CreddyPens API", version="0.1.0")
 
@@ -43,12 +52,17 @@ app.add_middleware(
     execute_limit_per_minute=settings.execute_rate_limit_per_minute,
     default_limit_per_minute=settings.default_rate_limit_per_minute,
 )
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=int(settings.upload_max_size_mb) * 1024 * 1024,
+)
 register_error_handlers(app)
 
 app.include_router(router)
 app.include_router(academy_router)
 app.include_router(files_router)
 app.include_router(skills_router)
+app.include_router(deliveries_router)
 
 
 @app.on_event("startup")
@@ -59,3 +73,31 @@ def _ensure_schema() -> None:
         # Local dev convenience: don't crash the API if the DB isn't running yet.
         # DB-backed endpoints will fail until Postgres is available.
         return
+
+
+@app.on_event("startup")
+async def _start_workflow_scheduler() -> None:
+    if settings.workflow_scheduler_enabled:
+        workflow_scheduler.start(execute_workflow_schedule)
+
+
+@app.on_event("startup")
+async def _start_delivery_worker() -> None:
+    if settings.outbound_delivery_enabled:
+        delivery_worker.start()
+
+
+@app.on_event("startup")
+async def _start_knowledge_refresh() -> None:
+    knowledge_index.start_refresh_loop()
+
+
+@app.on_event("shutdown")
+async def _close_http_session() -> None:
+    await knowledge_index.stop_refresh_loop()
+    await workflow_scheduler.stop()
+    await delivery_worker.stop()
+    await close_http_session()
+    await email_integration.close()
+    await extraction_executor.shutdown()
+    await workflow_jobs.shutdown()
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Multipart boundaries and part headers on top of the file bytes themselves.
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class _PayloadTooLarge(HTTPException):
+    # An HTTPException so FastAPI's body parsing re-raises it as-is instead of turning it into
+    # a 400 "error parsing the body"; the registered handler then renders the 413.
+    def __init__(self, limit_mb: int) -> None:
+        super().__init__(status_code=413, detail=f"File too large. Max {limit_mb}MB")
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject oversized upload bodies while they arrive instead of after they are spooled.
+
+    A declared Content-Length over the limit is refused before any body is read; chunked or
+    understated bodies are cut off as soon as the running byte count passes the limit.
+    Pure ASGI so `receive` can be wrapped without buffering the body.
+    """
+
+    def __init__(self, app: ASGIApp, *, max_bytes: int, path_prefix: str = "/v1/files/upload") -> None:
+        self.app = app
+        self.max_bytes = int(max_bytes) + _MULTIPART_OVERHEAD_BYTES
+        self.limit_mb = max(1, int(max_bytes) // (1024 * 1024))
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not str(scope.get("path", "")).startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope.get("headers") or []).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise _PayloadTooLarge(self.limit_mb)
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _PayloadTooLarge:
+            if not response_started:
+                await self._reject(scope, receive, send)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"File too large. Max {self.limit_mb}MB"},
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
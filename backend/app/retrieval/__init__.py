@@ -0,0 +1,14 @@
+from app.retrieval.chunking import chunk_text
+from app.retrieval.embeddings import HashingEmbedder
+from app.retrieval.knowledge_index import KnowledgeChunkIndex, knowledge_index
+from app.retrieval.vector_index import OrgVectorIndex, VectorIndexRegistry, vector_indexes
+
+__all__ = [
+    "HashingEmbedder",
+    "KnowledgeChunkIndex",
+    "OrgVectorIndex",
+    "VectorIndexRegistry",
+    "chunk_text",
+    "knowledge_index",
+    "vector_indexes",
+]
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import re
+
+_WHITESPACE = re.compile(r"[ \t\r\f\v]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _units(text: str, max_chars: int) -> list[str]:
+    """Paragraphs, split further into sentences (then hard slices) when a paragraph is too long."""
+    units: list[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = "\n".join(_WHITESPACE.sub(" ", line).strip() for line in paragraph.splitlines()).strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            units.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            sentence = sentence.strip()
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > max_chars // 2 else max_chars
+                units.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+            if sentence:
+                units.append(sentence)
+    return units
+
+
+def _tail(text: str, overlap_chars: int) -> str:
+    if overlap_chars <= 0 or len(text) <= overlap_chars:
+        return text if overlap_chars > 0 else ""
+    start = text.find(" ", len(text) - overlap_chars)
+    return text[start + 1 :] if start != -1 else text[-overlap_chars:]
+
+
+def chunk_text(text: str, *, chunk_chars: int = 800, overlap_chars: int = 150) -> list[str]:
+    """
+    Split text into passages of roughly `chunk_chars`, packed on paragraph/sentence boundaries.
+
+    Each passage after the first starts with the last ~`overlap_chars` of the previous one so
+    an answer straddling a boundary is still retrievable from a single passage.
+    """
+    chunk_chars = max(200, int(chunk_chars))
+    overlap_chars = max(0, min(int(overlap_chars), chunk_chars // 2))
+    chunks: list[str] = []
+    current = ""
+    for unit in _units(text or "", chunk_chars - overlap_chars):
+        candidate = f"{current}\n{unit}" if current else unit
+        if len(candidate) <= chunk_chars or not current:
+            current = candidate
+            continue
+        chunks.append(current)
+        carry = _tail(current, overlap_chars)
+        current = f"{carry}\n{unit}" if carry else unit
+    if current and (not chunks or current != _tail(chunks[-1], overlap_chars)):
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import math
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free dense embedding: signed feature hashing of unigrams and bigrams.
+
+    Deterministic across processes (crc32, not Python's salted `hash`), so vectors computed at
+    index time and query time live in the same space without storing a vocabulary.
+    """
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = max(32, int(dim))
+
+    def _features(self, text: str) -> Counter[str]:
+        tokens = _TOKEN_PATTERN.findall((text or "").lower())
+        features: Counter[str] = Counter(tokens)
+        features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in self._features(text).items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            vector[h % self.dim] += sign * (1.0 + math.log(count))
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_many(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack([self.embed(item) for item in texts])
+
+    def to_bytes(self, vector: np.ndarray) -> bytes:
+        return np.asarray(vector, dtype="<f4").tobytes()
+
+    def from_bytes(self, raw: bytes) -> np.ndarray:
+        return np.frombuffer(raw, dtype="<f4")
@@ -0,0 +1,409 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import uuid
+from typing import Any
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.retrieval.chunking import chunk_text
+from app.retrieval.embeddings import HashingEmbedder
+from app.retrieval.vector_index import vector_indexes
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_LEXICAL_CANDIDATES = 50
+_DENSE_CANDIDATES = 100
+_MAX_CHUNKS_PER_DOC = 2
+_MIN_SCORE = 0.08
+
+
+class KnowledgeChunkIndex:
+    """
+    Passage-level hybrid retrieval over `knowledge_base` (global) and per-org sources.
+
+    Documents are split into overlapping passages stored in `knowledge_chunks`, each with a
+    stored tsvector and a hashed float32 embedding. The embeddings are mirrored into a
+    memory-mapped per-org vector index; a query fuses FTS rank over passages with cosine
+    similarity from that index and takes the NumPy top-k. Re-indexing is incremental: only
+    documents whose content hash changed are re-chunked. It runs from scripts and from a
+    background loop in the API, never inside `search`.
+    """
+
+    def __init__(self) -> None:
+        self.embedder = HashingEmbedder(dim=settings.retrieval_embedding_dim)
+        self._reindex_lock = threading.Lock()
+        self._kb_signature: tuple[int, float] | None = None
+        self._refresh_task: asyncio.Task | None = None
+
+    # --- indexing ---------------------------------------------------------
+
+    def reindex(self) -> dict[str, int]:
+        """Re-chunk changed knowledge_base documents and drop chunks of deleted/inactive ones."""
+        with self._reindex_lock:
+            published: list[tuple[str, list[str], np.ndarray]] = []
+            with SessionLocal() as db:
+                # Serializes reindexers across processes; a second run then finds nothing changed
+                # instead of racing on the (source_type, source_id, chunk_index) key.
+                db.execute(text("select pg_advisory_xact_lock(hashtext('knowledge_chunks_reindex'));"))
+                removed = db.execute(
+                    text(
+                        """
+                        delete from knowledge_chunks c
+                        where c.source_type = 'kb'
+                          and not exists (
+                            select 1 from knowledge_base kb where kb.id = c.source_id and kb.is_active = true
+                          )
+                        returning c.source_id;
+                        """
+                    )
+                ).scalars().all()
+                changed = db.execute(
+                    text(
+                        """
+                        select kb.id, kb.title, kb.content, kb.category, h.source_hash
+                        from knowledge_base kb
+                        cross join lateral (
+                          select encode(
+                            sha256(convert_to(coalesce(kb.title, '') || chr(10) || coalesce(kb.content, ''), 'UTF8')),
+                            'hex'
+                          ) as source_hash
+                        ) h
+                        where kb.is_active = true
+                          and not exists (
+                            select 1 from knowledge_chunks c
+                            where c.source_type = 'kb' and c.source_id = kb.id and c.source_hash = h.source_hash
+                          );
+                        """
+                    )
+                ).mappings().all()
+                chunks_written = 0
+                for doc in changed:
+                    keys, vectors = self.write_chunks(
+                        db,
+                        source_type="kb",
+                        source_id=str(doc["id"]),
+                        org_id=None,
+                        title=str(doc["title"] or ""),
+                        content=str(doc["content"] or ""),
+                        category=doc["category"],
+                        source_hash=str(doc["source_hash"]),
+                    )
+                    published.append((str(doc["id"]), keys, vectors))
+                    chunks_written += len(keys)
+                db.commit()
+
+            # The on-disk index follows the committed rows; a crash in between is repaired by
+            # the drift check in `verify_vector_indexes`.
+            index = vector_indexes.get(None)
+            for source_id in {str(item) for item in removed}:
+                index.delete_source("kb", source_id)
+            for source_id, keys, vectors in published:
+                index.replace_source("kb", source_id, keys, vectors)
+            return {
+                "documents_reindexed": len(changed),
+                "chunks_written": chunks_written,
+                "chunks_removed": len(removed),
+            }
+
+    def write_chunks(
+        self,
+        db: Session,
+        *,
+        source_type: str,
+        source_id: str,
+        org_id: str | None,
+        title: str,
+        content: str,
+        category: str | None,
+        source_hash: str,
+    ) -> tuple[list[str], np.ndarray]:
+        """
+        Replace a source's passages inside the caller's transaction.
+
+        Returns the new chunk ids and embeddings; call `publish` with them after commit.
+        """
+        passages = chunk_text(
+            content,
+            chunk_chars=settings.retrieval_chunk_chars,
+            overlap_chars=settings.retrieval_chunk_overlap_chars,
+        )
+        db.execute(
+            text("delete from knowledge_chunks where source_type = :source_type and source_id = cast(:source_id as uuid);"),
+            {"source_type": source_type, "source_id": source_id},
+        )
+        if not passages:
+            return [], np.zeros((0, self.embedder.dim), dtype=np.float32)
+        # The title is embedded with every passage so short passages keep their topic.
+        vectors = self.embedder.embed_many([f"{title}\n{passage}" for passage in passages])
+        chunk_ids = [str(uuid.uuid4()) for _ in passages]
+        db.execute(
+            text(
+                """
+                insert into knowledge_chunks
+                  (chunk_id, source_type, source_id, org_id, chunk_index, title, content, category, source_hash, embedding)
+                values
+                  (cast(:chunk_id as uuid), :source_type, cast(:source_id as uuid), :org_id, :chunk_index,
+                   :title, :content, :category, :source_hash, :embedding);
+                """
+            ),
+            [
+                {
+                    "chunk_id": chunk_ids[index],
+                    "source_type": source_type,
+                    "source_id": source_id,
+                    "org_id": org_id,
+                    "chunk_index": index,
+                    "title": title,
+                    "content": passage,
+                    "category": category,
+                    "source_hash": source_hash,
+                    "embedding": self.embedder.to_bytes(vectors[index]),
+                }
+                for index, passage in enumerate(passages)
+            ],
+        )
+        return chunk_ids, vectors
+
+    def publish(self, *, org_id: str | None, source_type: str, source_id: str, keys: list[str], vectors: np.ndarray) -> None:
+        try:
+            vector_indexes.get(org_id).replace_source(source_type, source_id, keys, vectors)
+        except Exception as exc:
+            logger.warning("Vector index update failed for %s:%s: %s", source_type, source_id, exc)
+
+    def remove_source(self, db: Session, *, org_id: str | None, source_type: str, source_id: str) -> None:
+        """Delete a source's passages (caller commits) and tombstone them in the vector index."""
+        db.execute(
+            text("delete from knowledge_chunks where source_type = :source_type and source_id = cast(:source_id as uuid);"),
+            {"source_type": source_type, "source_id": source_id},
+        )
+        try:
+            vector_indexes.get(org_id).delete_source(source_type, source_id)
+        except Exception as exc:
+            logger.warning("Vector index delete failed for %s:%s: %s", source_type, source_id, exc)
+
+    def refresh_if_changed(self) -> dict[str, int] | None:
+        """Reindex when the active knowledge_base documents changed since the last check."""
+        with SessionLocal() as db:
+            row = db.execute(
+                text(
+                    """
+                    select count(*)::int as docs, coalesce(extract(epoch from max(updated_at)), 0) as updated
+                    from knowledge_base where is_active = true;
+                    """
+                )
+            ).mappings().first()
+        signature = (int(row["docs"] or 0), float(row["updated"] or 0))
+        if signature == self._kb_signature:
+            return None
+        result = self.reindex()
+        self._kb_signature = signature
+        if result["documents_reindexed"] or result["chunks_removed"]:
+            logger.info("Knowledge chunks reindexed: %s", result)
+        return result
+
+    def start_refresh_loop(self) -> None:
+        """
+        Every RETRIEVAL_REINDEX_CHECK_S, off the request path: pick up knowledge_base edits and
+        rebuild on-disk vector indexes that drifted from Postgres.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_refresh_loop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        interval = max(5.0, float(settings.retrieval_reindex_check_s))
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh_if_changed)
+                await asyncio.to_thread(self.verify_vector_indexes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Knowledge reindex check failed: %s", exc)
+            await asyncio.sleep(interval)
+
+    def verify_vector_indexes(self) -> list[str | None]:
+        """Rebuild every on-disk index whose passage count no longer matches Postgres; returns their orgs."""
+        with SessionLocal() as db:
+            counts = db.execute(text("select org_id, count(*)::int as chunks from knowledge_chunks group by org_id;")).all()
+        rebuilt: list[str | None] = []
+        for org_id, chunks in counts:
+            if int(chunks or 0) != vector_indexes.get(org_id).live_count():
+                self.rebuild_vector_index(org_id)
+                rebuilt.append(org_id)
+        return rebuilt
+
+    def rebuild_vector_index(self, org_id: str | None) -> int:
+        """Replace an org's on-disk index with the embeddings stored in Postgres."""
+        index = vector_indexes.get(org_id)
+        org_clause = "org_id = :org_id" if org_id else "org_id is null"
+        with SessionLocal() as db:
+            rows = db.execute(
+                text(f"select chunk_id, source_type, source_id, embedding from knowledge_chunks where {org_clause};"),
+                {"org_id": org_id},
+            ).mappings().all()
+        vectors = np.zeros((len(rows), self.embedder.dim), dtype=np.float32)
+        for position, row in enumerate(rows):
+            vector = self.embedder.from_bytes(bytes(row["embedding"]))
+            if vector.shape[0] == self.embedder.dim:
+                vectors[position] = vector
+        index.rebuild(
+            [str(row["chunk_id"]) for row in rows],
+            [index.source_key(str(row["source_type"]), str(row["source_id"])) for row in rows],
+            vectors,
+        )
+        logger.info("Rebuilt vector index %s with %d passages", vector_indexes.directory_name(org_id), len(rows))
+        return len(rows)
+
+    # --- retrieval --------------------------------------------------------
+
+    def search(
+        self,
+        query: str,
+        *,
+        limit: int = 5,
+        category: str | None = None,
+        org_id: str | None = None,
+        source_type: str = "kb",
+        source_ids: list[str] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Hybrid passage search. Returns [] when nothing is indexed so callers can fall back."""
+        index = vector_indexes.get(org_id)
+        query_vector = self.embedder.embed(query)
+        if category:
+            # The vector index knows sources, not categories: restrict dense candidates to the
+            # category's sources so out-of-category passages cannot take the top-k slots.
+            source_ids = self._category_sources(org_id, source_type, category, source_ids)
+        dense = (
+            dict(index.search(query_vector, _DENSE_CANDIDATES, source_type=source_type, source_ids=source_ids))
+            if source_ids is None or source_ids
+            else {}
+        )
+
+        params: dict[str, Any] = {"query": query, "limit": _LEXICAL_CANDIDATES, "source_type": source_type}
+        clauses = ["c.source_type = :source_type", "c.org_id = :org_id" if org_id else "c.org_id is null"]
+        if org_id:
+            params["org_id"] = org_id
+        if category:
+            clauses.append("c.category = :category")
+            params["category"] = category
+        if source_ids is not None:
+            clauses.append("c.source_id = any(cast(:source_ids as uuid[]))")
+            params["source_ids"] = list(source_ids)
+        where = " and ".join(clauses)
+        with SessionLocal() as db:
+            lexical = {
+                str(row["chunk_id"]): float(row["rank"] or 0.0)
+                for row in db.execute(
+                    text(
+                        f"""
+                        select c.chunk_id, ts_rank_cd(c.search_vector, q.tsq) as rank
+                        from knowledge_chunks c, plainto_tsquery('english', :query) as q(tsq)
+                        where {where}
+                          and c.search_vector @@ q.tsq
+                        order by rank desc
+                        limit :limit;
+                        """
+                    ),
+                    params,
+                ).mappings()
+            }
+        # Lexical-only candidates still get a dense score, read straight from the index.
+        missing = [key for key in lexical if key not in dense]
+        if missing:
+            dense.update(index.score(missing, query_vector))
+        keys = list(dense.keys() | lexical.keys())
+        if not keys:
+            return []
+
+        dense_scores = np.clip(np.array([dense.get(key, 0.0) for key in keys], dtype=np.float32), 0.0, 1.0)
+        lexical_scores = np.array([lexical.get(key, 0.0) for key in keys], dtype=np.float32)
+        if lexical_scores.max() > 0:
+            lexical_scores /= lexical_scores.max()
+        weight = min(1.0, max(0.0, float(settings.retrieval_dense_weight)))
+        scores = weight * dense_scores + (1.0 - weight) * lexical_scores
+
+        # Over-select, then cap passages per document so one long doc can't fill every slot.
+        k = min(len(scores), max(1, limit) * (_MAX_CHUNKS_PER_DOC + 1))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        picked = [(keys[i], float(scores[i])) for i in top if scores[i] >= _MIN_SCORE]
+        if not picked:
+            return []
+
+        row_params: dict[str, Any] = {"chunk_ids": [chunk_id for chunk_id, _ in picked], "org_id": org_id}
+        category_clause = ""
+        if category:
+            category_clause = "and c.category = :category"
+            row_params["category"] = category
+        with SessionLocal() as db:
+            rows = db.execute(
+                text(
+                    f"""
+                    select c.chunk_id, c.source_id as id, c.source_type, c.chunk_index, c.title, c.content,
+                           c.category, kb.tags, kb.source_url
+                    from knowledge_chunks c
+                    left join knowledge_base kb on c.source_type = 'kb' and kb.id = c.source_id
+                    where c.chunk_id = any(cast(:chunk_ids as uuid[]))
+                      and {"c.org_id = :org_id" if org_id else "c.org_id is null"}
+                      {category_clause};
+                    """
+                ),
+                row_params,
+            ).mappings().all()
+        by_id = {str(row["chunk_id"]): dict(row) for row in rows}
+
+        results: list[dict[str, Any]] = []
+        per_doc: dict[str, int] = {}
+        for chunk_id, score in picked:
+            row = by_id.get(chunk_id)
+            if row is None:
+                continue
+            doc_id = str(row["id"])
+            if per_doc.get(doc_id, 0) >= _MAX_CHUNKS_PER_DOC:
+                continue
+            per_doc[doc_id] = per_doc.get(doc_id, 0) + 1
+            row["rank"] = round(score, 4)
+            results.append(row)
+            if len(results) >= limit:
+                break
+        return results
+
+    def _category_sources(
+        self, org_id: str | None, source_type: str, category: str, source_ids: list[str] | None
+    ) -> list[str]:
+        params: dict[str, Any] = {"org_id": org_id, "source_type": source_type, "category": category}
+        source_clause = ""
+        if source_ids is not None:
+            source_clause = "and source_id = any(cast(:source_ids as uuid[]))"
+            params["source_ids"] = list(source_ids)
+        with SessionLocal() as db:
+            rows = db.execute(
+                text(
+                    f"""
+                    select distinct source_id
+                    from knowledge_chunks
+                    where source_type = :source_type
+                      and {"org_id = :org_id" if org_id else "org_id is null"}
+                      and category = :category
+                      {source_clause};
+                    """
+                ),
+                params,
+            ).scalars().all()
+        return [str(source_id) for source_id in rows]
+
+
+knowledge_index = KnowledgeChunkIndex()
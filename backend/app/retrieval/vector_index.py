@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from app.settings import settings
+
+
+class OrgVectorIndex:
+    """
+    Append-only, memory-mapped float32 matrix of passage embeddings for one org.
+
+    Layout per org directory:
+      vectors-<generation>.f32  raw little-endian rows, appended in place
+      meta.json                 row keys/sources, tombstoned rows, row count, generation
+
+    Readers map only the first `rows` rows named by meta.json, so an in-flight append is never
+    visible half-written, and every worker on the host shares the same page-cache pages.
+    Deletes only tombstone rows; once tombstones pass `compact_ratio` of the file, the live rows
+    are rewritten to a new generation. Writers serialize on an flock so several workers can
+    update the same org. Search is exact brute force (one mat-vec product), which is fast well
+    into the hundreds of thousands of passages; IVF/HNSW can replace `search` behind this API.
+    """
+
+    def __init__(self, directory: Path, dim: int, compact_ratio: float = 0.3) -> None:
+        self.directory = directory
+        self.dim = int(dim)
+        self.compact_ratio = float(compact_ratio)
+        self._lock = threading.RLock()
+        self._meta_mtime: int | None = None
+        self._generation = 0
+        self._keys: list[str] = []
+        self._sources: list[str] = []
+        self._tombstones: set[int] = set()
+        self._row_by_key: dict[str, int] = {}
+        self._matrix: np.ndarray | None = None
+        self._obsolete: list[Path] = []
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def _vectors_path(self, generation: int) -> Path:
+        return self.directory / f"vectors-{generation}.f32"
+
+    @staticmethod
+    def source_key(source_type: str, source_id: str) -> str:
+        return f"{source_type}:{source_id}"
+
+    # --- loading ----------------------------------------------------------
+
+    def _refresh(self, *, force: bool = False) -> None:
+        try:
+            mtime = self._meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if not force and mtime == self._meta_mtime:
+            return
+        if mtime is None:
+            self._generation, self._keys, self._sources, self._tombstones = 0, [], [], set()
+        else:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            self._generation = int(meta.get("generation") or 0)
+            self._keys = list(meta.get("keys") or [])
+            self._sources = list(meta.get("sources") or [])
+            self._tombstones = set(int(row) for row in meta.get("tombstones") or [])
+        self._meta_mtime = mtime
+        self._row_by_key = {key: row for row, key in enumerate(self._keys) if row not in self._tombstones}
+        rows = len(self._keys)
+        path = self._vectors_path(self._generation)
+        if rows and path.exists():
+            self._matrix = np.memmap(path, dtype="<f4", mode="r", shape=(rows, self.dim))
+        else:
+            # Missing vectors: start empty so the caller's drift check triggers a rebuild.
+            self._keys, self._sources, self._tombstones, self._row_by_key = [], [], set(), {}
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+
+    def _save_meta(self) -> None:
+        payload = {
+            "generation": self._generation,
+            "dim": self.dim,
+            "rows": len(self._keys),
+            "keys": self._keys,
+            "sources": self._sources,
+            "tombstones": sorted(self._tombstones),
+        }
+        tmp = self._meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(tmp, self._meta_path)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.directory / ".lock", "a+") as handle:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                # Another worker may have written since our last read.
+                self._refresh(force=True)
+                try:
+                    yield
+                except BaseException:
+                    self._meta_mtime = -1  # discard half-applied in-memory state on next read
+                    raise
+                self._save_meta()
+                self._refresh(force=True)
+                # Readers that already mapped a replaced generation keep their pages after unlink.
+                for path in self._obsolete:
+                    path.unlink(missing_ok=True)
+                self._obsolete = []
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    # --- writes -----------------------------------------------------------
+
+    def replace_source(self, source_type: str, source_id: str, keys: list[str], vectors: np.ndarray) -> None:
+        """Tombstone a source's previous rows and append its new ones."""
+        source = self.source_key(source_type, source_id)
+        vectors = np.ascontiguousarray(vectors, dtype="<f4").reshape(-1, self.dim)
+        with self._write_lock():
+            self._tombstone_source(source)
+            if len(keys):
+                with open(self._vectors_path(self._generation), "ab") as handle:
+                    # Rows past `rows` in meta.json are invisible to readers, so trim any tail
+                    # left behind by a writer that crashed between append and meta save.
+                    handle.truncate(len(self._keys) * self.dim * 4)
+                    handle.write(vectors.tobytes())
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                self._keys.extend(keys)
+                self._sources.extend([source] * len(keys))
+            self._maybe_compact()
+
+    def delete_source(self, source_type: str, source_id: str) -> None:
+        with self._write_lock():
+            self._tombstone_source(self.source_key(source_type, source_id))
+            self._maybe_compact()
+
+    def rebuild(self, keys: list[str], sources: list[str], vectors: np.ndarray) -> None:
+        """Replace the whole index, e.g. after a fresh deploy or when it drifted from the DB."""
+        vectors = np.ascontiguousarray(vectors, dtype="<f4").reshape(-1, self.dim)
+        with self._write_lock():
+            self._write_generation(keys, sources, vectors)
+
+    def _tombstone_source(self, source: str) -> None:
+        for row, row_source in enumerate(self._sources):
+            if row_source == source:
+                self._tombstones.add(row)
+
+    def _maybe_compact(self) -> None:
+        if not self._keys or len(self._tombstones) < self.compact_ratio * len(self._keys):
+            return
+        live = [row for row in range(len(self._keys)) if row not in self._tombstones]
+        matrix = self._matrix if self._matrix is not None and len(self._matrix) == len(self._keys) else None
+        if matrix is None:
+            matrix = np.fromfile(self._vectors_path(self._generation), dtype="<f4").reshape(-1, self.dim)
+        self._write_generation(
+            [self._keys[row] for row in live],
+            [self._sources[row] for row in live],
+            np.asarray(matrix[live], dtype="<f4") if live else np.zeros((0, self.dim), dtype="<f4"),
+        )
+
+    def _write_generation(self, keys: list[str], sources: list[str], vectors: np.ndarray) -> None:
+        old = self._vectors_path(self._generation)
+        self._generation += 1
+        path = self._vectors_path(self._generation)
+        with open(path, "wb") as handle:
+            handle.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._keys, self._sources, self._tombstones = list(keys), list(sources), set()
+        self._obsolete.append(old)
+
+    # --- reads ------------------------------------------------------------
+
+    def live_count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._keys) - len(self._tombstones)
+
+    def score(self, keys: list[str], vector: np.ndarray) -> dict[str, float]:
+        """Cosine similarity for specific keys (rows are unit-normalised)."""
+        with self._lock:
+            self._refresh()
+            rows = [(key, self._row_by_key[key]) for key in keys if key in self._row_by_key]
+            if not rows or self._matrix is None:
+                return {}
+            scores = self._matrix[[row for _, row in rows]] @ vector
+        return {key: float(value) for (key, _), value in zip(rows, scores)}
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int,
+        *,
+        source_type: str | None = None,
+        source_ids: list[str] | None = None,
+    ) -> list[tuple[str, float]]:
+        with self._lock:
+            self._refresh()
+            matrix = self._matrix
+            if matrix is None or not len(matrix):
+                return []
+            scores = np.asarray(matrix @ vector, dtype=np.float32)
+            if self._tombstones:
+                scores[list(self._tombstones)] = -np.inf
+            if source_ids is not None:
+                allowed = {self.source_key(source_type or "", item) for item in source_ids}
+                mask = np.fromiter((source in allowed for source in self._sources), dtype=bool, count=len(self._sources))
+                scores[~mask] = -np.inf
+            elif source_type:
+                prefix = f"{source_type}:"
+                mask = np.fromiter((source.startswith(prefix) for source in self._sources), dtype=bool, count=len(self._sources))
+                scores[~mask] = -np.inf
+            keys = self._keys
+        k = max(1, min(int(k), len(scores)))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(keys[row], float(scores[row])) for row in top if np.isfinite(scores[row])]
+
+
+class VectorIndexRegistry:
+    """Per-org OrgVectorIndex handles, bounded so idle orgs release their mappings."""
+
+    GLOBAL = "_global"
+
+    def __init__(self, root: str, dim: int, max_open: int = 256) -> None:
+        self.root = Path(root)
+        self.dim = int(dim)
+        self.max_open = max(8, int(max_open))
+        self._lock = threading.Lock()
+        self._items: OrderedDict[str, OrgVectorIndex] = OrderedDict()
+
+    def directory_name(self, org_id: str | None) -> str:
+        if not org_id:
+            return self.GLOBAL
+        # Hashed rather than sanitized: "acme.co" and "acme_co" must never share an index.
+        return "org_" + hashlib.sha256(org_id.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, org_id: str | None) -> OrgVectorIndex:
+        name = self.directory_name(org_id)
+        with self._lock:
+            index = self._items.get(name)
+            if index is None:
+                index = OrgVectorIndex(self.root / name, self.dim)
+                self._items[name] = index
+            self._items.move_to_end(name)
+            while len(self._items) > self.max_open:
+                self._items.popitem(last=False)
+            return index
+
+
+vector_indexes = VectorIndexRegistry(settings.vector_index_dir, settings.retrieval_embedding_dim)
@@ -5,12 +5,16 @@ import json
 from sqlalchemy import text
 
 from app.db import SessionLocal
+from app.runtime.policy_cache import policy_cache
+from app.settings import settings
 
 
 class ModelPolicyService:
     """BYOK/org model preference policy store."""
 
     def get_preference(self, *, org_id: str, agent_code: str | None = None) -> dict | None:
+        if settings.policy_cache_enabled:
+            return policy_cache.get(org_id).model_preference(agent_code=agent_code)
         with SessionLocal() as db:
             if agent_code:
                 row = db.execute(
@@ -115,7 +119,9 @@ class ModelPolicyService:
                         "metadata": payload,
                     },
                 )
+            policy_cache.bump_version(org_id, db=db)
             db.commit()
+        policy_cache.invalidate(org_id)
 
     def list_preferences(self, *, org_id: str) -> list[dict]:
         with SessionLocal() as db:
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.settings import settings
+
+
+@dataclass(frozen=True)
+class OrgPolicySnapshot:
+    """Resolved tool + model policies for one org, keyed for O(1) lookups."""
+
+    org_id: str
+    version: int
+    tools: dict[tuple[str, str], bool] = field(default_factory=dict)
+    models: dict[str, dict] = field(default_factory=dict)
+
+    def tool_allowed(self, *, tool_name: str, agent_code: str | None) -> bool | None:
+        # Agent-specific override first, then org-level policy. None means "no policy row".
+        if agent_code:
+            allow = self.tools.get((agent_code, tool_name))
+            if allow is not None:
+                return allow
+        return self.tools.get(("", tool_name))
+
+    def model_preference(self, *, agent_code: str | None) -> dict | None:
+        if agent_code:
+            pref = self.models.get(agent_code)
+            if pref is not None:
+                return dict(pref)
+        pref = self.models.get("")
+        return dict(pref) if pref is not None else None
+
+
+class OrgPolicyCache:
+    """
+    Per-org cache of tool/model policies.
+
+    Each org's policies are loaded with a single query. Writers bump
+    `org_policy_versions.version` in the same transaction as the policy upsert, so other
+    workers notice the change on their next revalidation (a one-row PK lookup) instead of
+    re-reading every policy on every tool call. The writer's own worker drops its entry
+    only after the commit, so a read racing the write cannot re-cache the old policies.
+    """
+
+    def __init__(self, revalidate_s: float = 30.0, max_orgs: int = 5000) -> None:
+        self.revalidate_s = max(0.0, float(revalidate_s))
+        self.max_orgs = max(100, int(max_orgs))
+        self._lock = threading.Lock()
+        self._items: dict[str, tuple[float, OrgPolicySnapshot]] = {}
+        # Bumped on every local invalidation; a load that straddles one is not cached.
+        self._generation = 0
+
+    def get(self, org_id: str) -> OrgPolicySnapshot:
+        now = time.monotonic()
+        with self._lock:
+            row = self._items.get(org_id)
+        if row is not None:
+            checked_at, snapshot = row
+            if now - checked_at < self.revalidate_s:
+                return snapshot
+            current_version = self._read_version(org_id)
+            if current_version == snapshot.version:
+                with self._lock:
+                    self._items[org_id] = (now, snapshot)
+                return snapshot
+
+        with self._lock:
+            generation = self._generation
+        snapshot = self._load(org_id)
+        with self._lock:
+            if generation != self._generation:
+                return snapshot
+            self._items[org_id] = (now, snapshot)
+            if len(self._items) > self.max_orgs:
+                for key in list(self._items.keys())[: len(self._items) - self.max_orgs]:
+                    self._items.pop(key, None)
+        return snapshot
+
+    def bump_version(self, org_id: str, *, db: Session) -> None:
+        """Bump the shared version in the writer's transaction; call `invalidate` after commit."""
+        db.execute(
+            text(
+                """
+                insert into org_policy_versions (org_id, version, updated_at)
+                values (:org_id, 1, now())
+                on conflict (org_id)
+                do update set version = org_policy_versions.version + 1, updated_at = now();
+                """
+            ),
+            {"org_id": org_id},
+        )
+
+    def invalidate(self, org_id: str) -> None:
+        """Drop the local entry; only once the policy write is committed."""
+        with self._lock:
+            self._generation += 1
+            self._items.pop(org_id, None)
+
+    def _read_version(self, org_id: str) -> int:
+        with SessionLocal() as db:
+            version = db.execute(
+                text("select version from org_policy_versions where org_id = :org_id;"),
+                {"org_id": org_id},
+            ).scalar()
+        return int(version or 0)
+
+    def _load(self, org_id: str) -> OrgPolicySnapshot:
+        with SessionLocal() as db:
+            rows = db.execute(
+                text(
+                    """
+                    select
+                      'tool' as kind,
+                      coalesce(agent_code, '') as agent_code,
+                      tool_name,
+                      allow,
+                      null::text as preferred_provider,
+                      null::text as preferred_model,
+                      null::text as reasoning_effort,
+                      null::jsonb as metadata,
+                      coalesce((select version from org_policy_versions where org_id = :org_id), 0) as version
+                    from org_tool_policies
+                    where org_id = :org_id
+                    union all
+                    select
+                      'model' as kind,
+                      coalesce(agent_code, '') as agent_code,
+                      null::text as tool_name,
+                      null::boolean as allow,
+                      preferred_provider,
+                      preferred_model,
+                      reasoning_effort,
+                      metadata,
+                      coalesce((select version from org_policy_versions where org_id = :org_id), 0) as version
+                    from org_model_policies
+                    where org_id = :org_id;
+                    """
+                ),
+                {"org_id": org_id},
+            ).mappings().all()
+
+        # An org with no policy rows still needs a version to revalidate against.
+        version = int(rows[0]["version"] or 0) if rows else self._read_version(org_id)
+        tools: dict[tuple[str, str], bool] = {}
+        models: dict[str, dict] = {}
+        for row in rows:
+            agent_code = str(row["agent_code"] or "")
+            if row["kind"] == "tool":
+                tools[(agent_code, str(row["tool_name"]))] = bool(row["allow"])
+            else:
+                models[agent_code] = {
+                    "preferred_provider": row["preferred_provider"],
+                    "preferred_model": row["preferred_model"],
+                    "reasoning_effort": row["reasoning_effort"],
+                    "metadata": row["metadata"],
+                }
+        return OrgPolicySnapshot(org_id=org_id, version=version, tools=tools, models=models)
+
+
+policy_cache = OrgPolicyCache(revalidate_s=settings.policy_cache_revalidate_s)
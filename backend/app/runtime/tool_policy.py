@@ -3,6 +3,8 @@ from __future__ import annotations
 from sqlalchemy import text
 
 from app.db import SessionLocal
+from app.runtime.policy_cache import policy_cache
+from app.settings import settings
 
 
 class ToolPolicyService:
@@ -14,6 +16,12 @@ class ToolPolicyService:
 
     def is_allowed(self, *, org_id: str, tool_name: str, agent_code: str | None = None) -> bool:
         # Agent-specific override first, then org-level policy, then defaults.
+        if settings.policy_cache_enabled:
+            allow = policy_cache.get(org_id).tool_allowed(tool_name=tool_name, agent_code=agent_code)
+            if allow is not None:
+                return allow
+            return bool(self.DEFAULTS.get(tool_name, False))
+
         with SessionLocal() as db:
             if agent_code:
                 row = db.execute(
@@ -114,7 +122,9 @@ class ToolPolicyService:
                         "config": payload,
                     },
                 )
+            policy_cache.bump_version(org_id, db=db)
             db.commit()
+        policy_cache.invalidate(org_id)
 
     def list_policies(self, *, org_id: str) -> list[dict]:
         with SessionLocal() as db:
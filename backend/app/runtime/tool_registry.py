@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
-from typing import Any, Callable
+from typing import Any, Awaitable, Callable
 
 from app.runtime.hooks import RuntimeEvent, hook_bus
 from app.runtime.tool_policy import tool_policy_service
+from app.settings import settings
 from app.tools.document_search import doc_search
 from app.tools.web_search import web_search
 from app.tools.scheduling import scheduling_tool
@@ -17,80 +19,114 @@ class ToolCallContext:
     agent_code: str | None
 
 
+@dataclass(frozen=True)
+class ToolSpec:
+    handler: Callable[..., Awaitable[Any]]
+    timeout_s: float
+    max_concurrency: int
+
+
 class ToolRegistry:
-    """Reusable custom tool runner with permissions + hooks."""
+    """Reusable async custom tool runner with permissions + hooks."""
 
     def __init__(self) -> None:
-        self._tools: dict[str, Callable[..., Any]] = {
-            "web_search": self._run_web_search,
-            "document_search": self._run_document_search,
-            "check_availability": self._run_check_availability,
-            "book_meeting": self._run_book_meeting,
+        self._tools: dict[str, ToolSpec] = {
+            "web_search": ToolSpec(
+                handler=self._run_web_search,
+                # Serper has its own HTTP timeout; leave headroom for formatting.
+                timeout_s=float(settings.web_search_timeout_s) + 2.0,
+                max_concurrency=int(settings.web_search_max_concurrency),
+            ),
+            "document_search": ToolSpec(handler=self._run_document_search, timeout_s=8.0, max_concurrency=16),
+            "check_availability": ToolSpec(handler=self._run_check_availability, timeout_s=5.0, max_concurrency=32),
+            "book_meeting": ToolSpec(handler=self._run_book_meeting, timeout_s=5.0, max_concurrency=32),
         }
+        self._semaphores: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = {}
 
     def list_tools(self) -> list[str]:
         return sorted(self._tools.keys())
 
-    def run(self, *, tool_name: str, context: ToolCallContext, args: dict | None = None) -> dict[str, Any]:
+    def _semaphore(self, tool_name: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        row = self._semaphores.get(tool_name)
+        if row is None or row[0] is not loop:
+            row = (loop, asyncio.Semaphore(max(1, self._tools[tool_name].max_concurrency)))
+            self._semaphores[tool_name] = row
+        return row[1]
+
+    async def run(self, *, tool_name: str, context: ToolCallContext, args: dict | None = None) -> dict[str, Any]:
         if tool_name not in self._tools:
             return {"ok": False, "error": f"Unknown tool: {tool_name}"}
         args = args or {}
-        allowed = tool_policy_service.is_allowed(
+        spec = self._tools[tool_name]
+        # Policy lookups and hook writes hit the DB; keep them off the event loop.
+        allowed = await asyncio.to_thread(
+            tool_policy_service.is_allowed,
             org_id=context.org_id,
             agent_code=context.agent_code,
             tool_name=tool_name,
         )
-        hook_bus.emit(
+        await asyncio.to_thread(
+            hook_bus.emit,
             RuntimeEvent(
                 event_type="tool.pre_call",
                 org_id=context.org_id,
                 session_id=context.session_id,
                 agent_code=context.agent_code,
                 payload={"tool": tool_name, "allowed": allowed, "args": args},
-            )
+            ),
         )
         if not allowed:
             result = {"ok": False, "error": f"Tool blocked by policy: {tool_name}"}
-            hook_bus.emit(
-                RuntimeEvent(
-                    event_type="tool.post_call",
-                    org_id=context.org_id,
-                    session_id=context.session_id,
-                    agent_code=context.agent_code,
-                    payload={"tool": tool_name, "result": result},
-                )
-            )
-            return result
-        try:
-            payload = self._tools[tool_name](**args)
-            result = {"ok": True, "data": payload}
-        except Exception as e:
-            result = {"ok": False, "error": str(e)}
-        hook_bus.emit(
+        else:
+            try:
+                async with self._semaphore(tool_name):
+                    payload = await asyncio.wait_for(spec.handler(**args), timeout=spec.timeout_s)
+                result = {"ok": True, "data": payload}
+            except asyncio.TimeoutError:
+                result = {"ok": False, "error": f"Tool timed out after {spec.timeout_s:g}s: {tool_name}"}
+            except Exception as e:
+                result = {"ok": False, "error": str(e)}
+        await asyncio.to_thread(
+            hook_bus.emit,
             RuntimeEvent(
                 event_type="tool.post_call",
                 org_id=context.org_id,
                 session_id=context.session_id,
                 agent_code=context.agent_code,
                 payload={"tool": tool_name, "result": result},
-            )
+            ),
         )
         return result
 
-    def _run_web_search(self, query: str, num_results: int = 5) -> dict[str, Any]:
-        raw = web_search.search_sync(query=query, num_results=num_results, search_type="search")
-        return {"raw": raw, "formatted": web_search.format_results(raw, max_results=3)}
+    def run_sync(self, *, tool_name: str, context: ToolCallContext, args: dict | None = None) -> dict[str, Any]:
+        """
+        Sync adapter for threadpool routes and scripts.
+
+        Inside a FastAPI worker thread the call is scheduled on the app's event loop so the
+        pooled HTTP session and concurrency limits are shared; elsewhere a private loop is used.
+        """
+        from anyio import from_thread
 
-    def _run_document_search(self, query: str, limit: int = 3) -> dict[str, Any]:
-        rows = doc_search.search(query=query, limit=limit)
-        return {"rows": rows, "formatted": doc_search.format_results(rows, max_content_length=350)}
+        # Decide up front: a RuntimeError raised by the tool itself must propagate, never trigger a
+        # second run on a private loop (side-effecting tools would execute twice).
+        if getattr(from_thread.threadlocals, "current_token", None) is not None:
+            return from_thread.run(lambda: self.run(tool_name=tool_name, context=context, args=args))
+        return asyncio.run(self.run(tool_name=tool_name, context=context, args=args))
 
-    def _run_check_availability(self, date_str: str | None = None) -> dict[str, Any]:
+    async def _run_web_search(self, query: str, num_results: int = 5) -> dict[str, Any]:
+        raw, formatted = await web_search.search_formatted(query=query, num_results=num_results, max_results=3)
+        return {"raw": raw, "formatted": formatted}
+
+    async def _run_document_search(self, query: str, limit: int = 3) -> dict[str, Any]:
+        rows = await asyncio.to_thread(doc_search.search, query=query, limit=limit)
+        return {"rows": rows, "formatted": doc_search.format_results(rows, max_content_length=int(settings.retrieval_chunk_chars))}
+
+    async def _run_check_availability(self, date_str: str | None = None) -> dict[str, Any]:
         return scheduling_tool.check_availability(date_str=date_str)
 
-    def _run_book_meeting(self, name: str, email: str, slot: str, date_str: str) -> dict[str, Any]:
+    async def _run_book_meeting(self, name: str, email: str, slot: str, date_str: str) -> dict[str, Any]:
         return scheduling_tool.book_meeting(name=name, email=email, slot=slot, date_str=date_str)
 
 
 tool_registry = ToolRegistry()
-
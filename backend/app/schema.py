@@ -12,6 +12,7 @@ def ensure_schema(engine: Engine) -> None:
     """
     ddl = """
     create extension if not exists "pgcrypto";
+    create extension if not exists "pg_trgm";
     alter table if exists agent_catalog add column if not exists human_name text;
     alter table if exists agent_catalog add column if not exists tagline text;
     alter table if exists agent_catalog add column if not exists profile text not null default '';
@@ -124,6 +125,10 @@ def ensure_schema(engine: Engine) -> None:
     );
     create index if not exists idx_training_sessions_agent on training_sessions(agent_code);
     create index if not exists idx_training_sessions_status on training_sessions(status);
+    -- Live progress of a running synthetic session, flushed with each batch of results
+    alter table if exists training_sessions add column if not exists completed_interactions integer not null default 0;
+    alter table if exists training_sessions add column if not exists failed_interactions integer not null default 0;
+    alter table if exists training_sessions add column if not exists progress_updated_at timestamptz;
 
     create table if not exists agent_performance_metrics (
       id uuid primary key default gen_random_uuid(),
@@ -186,6 +191,18 @@ def ensure_schema(engine: Engine) -> None:
     create index if not exists idx_evaluation_session on evaluation_results(training_session_id);
     create index if not exists idx_evaluation_agent on evaluation_results(agent_code, evaluated_at desc);
 
+    -- LLM-as-judge subscores keyed by judge, rubric version and the judged response
+    create table if not exists academy_judge_cache (
+      cache_key text primary key,
+      judge_provider text not null,
+      judge_model text not null,
+      rubric_version integer not null,
+      subscores jsonb not null,
+      hits integer not null default 0,
+      created_at timestamptz not null default now(),
+      last_hit_at timestamptz
+    );
+
     -- Workflow templates + recurring schedules (cron-ready model)
     create table if not exists workflow_templates (
       template_id uuid primary key default gen_random_uuid(),
@@ -220,6 +237,10 @@ def ensure_schema(engine: Engine) -> None:
     alter table if exists workflow_schedules add column if not exists initial_message text not null default '';
     create index if not exists idx_workflow_schedules_org on workflow_schedules(org_id, is_active, next_run_at);
     create index if not exists idx_workflow_schedules_template on workflow_schedules(template_id);
+    -- Scheduler leases: a claimed schedule is skipped by other workers until its lease expires
+    alter table if exists workflow_schedules add column if not exists lease_owner text;
+    alter table if exists workflow_schedules add column if not exists lease_expires_at timestamptz;
+    create index if not exists idx_workflow_schedules_due on workflow_schedules(next_run_at) where is_active = true;
 
     create table if not exists workflow_runs (
       run_id uuid primary key default gen_random_uuid(),
@@ -238,6 +259,47 @@ def ensure_schema(engine: Engine) -> None:
     );
     create index if not exists idx_workflow_runs_org on workflow_runs(org_id, started_at desc);
     create index if not exists idx_workflow_runs_template on workflow_runs(template_id, started_at desc);
+    -- Checkpointed runs: definition, context and variable state are saved as the run progresses
+    alter table if exists workflow_runs add column if not exists context jsonb not null default '{}'::jsonb;
+    alter table if exists workflow_runs add column if not exists workflow_definition jsonb;
+    alter table if exists workflow_runs add column if not exists variables jsonb not null default '{}'::jsonb;
+    alter table if exists workflow_runs add column if not exists current_step_id text;
+    alter table if exists workflow_runs add column if not exists updated_at timestamptz not null default now();
+    alter table if exists workflow_runs add column if not exists cancel_requested boolean not null default false;
+    create unique index if not exists idx_workflow_runs_workflow_id on workflow_runs(workflow_id);
+
+    create table if not exists workflow_run_steps (
+      run_step_id uuid primary key default gen_random_uuid(),
+      workflow_id text not null references workflow_runs(workflow_id) on delete cascade,
+      step_index integer not null,
+      step_id text not null,
+      agent_code text not null default '',
+      status text not null,
+      attempts integer not null default 1,
+      input_message text not null default '',
+      response text not null default '',
+      model_used text not null default '',
+      latency_ms integer not null default 0,
+      trace_id text not null default '',
+      result jsonb not null default '{}'::jsonb,
+      error_message text,
+      started_at timestamptz not null default now(),
+      completed_at timestamptz,
+      unique (workflow_id, step_index)
+    );
+
+    -- Memoized workflow step outputs, for workflows that opt in with memoize_ttl_s
+    create table if not exists workflow_step_memo (
+      cache_key text primary key,
+      org_id text not null references organizations(org_id) on delete cascade,
+      agent_code text not null,
+      payload jsonb not null default '{}'::jsonb,
+      hits integer not null default 0,
+      created_at timestamptz not null default now(),
+      last_hit_at timestamptz,
+      expires_at timestamptz not null
+    );
+    create index if not exists idx_workflow_step_memo_expires on workflow_step_memo(expires_at);
 
     -- Durable org/agent memory layer
     create table if not exists agent_memories (
@@ -272,8 +334,24 @@ def ensure_schema(engine: Engine) -> None:
       uploaded_at timestamptz not null default now(),
       is_active boolean not null default true
     );
+    alter table if exists uploaded_files add column if not exists sha256 text;
     create index if not exists idx_uploaded_files_org on uploaded_files(org_id, uploaded_at desc);
     create index if not exists idx_uploaded_files_active on uploaded_files(org_id, is_active);
+    create index if not exists idx_uploaded_files_sha256 on uploaded_files(sha256) where sha256 is not null;
+
+    -- Content-addressed upload blobs; referenced (and reference-counted) by uploaded_files.sha256
+    create table if not exists file_blobs (
+      sha256 text primary key,
+      blob_path text not null,
+      file_size bigint not null default 0,
+      extracted_text text not null default '',
+      created_at timestamptz not null default now()
+    );
+    alter table if exists file_blobs add column if not exists extraction_status text not null default 'completed';
+    alter table if exists file_blobs add column if not exists extraction_error text;
+    alter table if exists file_blobs add column if not exists extraction_started_at timestamptz;
+    alter table if exists file_blobs add column if not exists extraction_heartbeat_at timestamptz;
+    alter table if exists file_blobs add column if not exists image_meta jsonb;
 
     -- External integration configs per organization
     create table if not exists integration_configs (
@@ -288,6 +366,47 @@ def ensure_schema(engine: Engine) -> None:
     create index if not exists idx_integration_configs_org on integration_configs(org_id, created_at desc);
     create index if not exists idx_integration_configs_type on integration_configs(org_id, integration_type, is_active);
 
+    -- Durable queue for workflow Slack / email / webhook actions, drained by DeliveryWorker
+    create table if not exists outbound_deliveries (
+      delivery_id uuid primary key default gen_random_uuid(),
+      org_id text not null references organizations(org_id) on delete cascade,
+      channel text not null,
+      integration_id uuid not null,
+      destination text not null default '',
+      payload jsonb not null default '{}'::jsonb,
+      workflow_id text,
+      step_id text,
+      idempotency_key text,
+      status text not null default 'pending',
+      attempts integer not null default 0,
+      max_attempts integer not null default 6,
+      next_attempt_at timestamptz not null default now(),
+      lease_owner text,
+      lease_expires_at timestamptz,
+      last_error text,
+      result jsonb,
+      created_at timestamptz not null default now(),
+      updated_at timestamptz not null default now(),
+      delivered_at timestamptz
+    );
+    create index if not exists idx_outbound_deliveries_due on outbound_deliveries(next_attempt_at)
+      where status in ('pending', 'retrying', 'sending');
+    create index if not exists idx_outbound_deliveries_org on outbound_deliveries(org_id, created_at desc);
+    create unique index if not exists uq_outbound_deliveries_idempotency on outbound_deliveries(idempotency_key)
+      where idempotency_key is not null;
+
+    create table if not exists outbound_dead_letters (
+      delivery_id uuid primary key references outbound_deliveries(delivery_id) on delete cascade,
+      org_id text not null references organizations(org_id) on delete cascade,
+      channel text not null,
+      destination text not null default '',
+      payload jsonb not null default '{}'::jsonb,
+      attempts integer not null default 0,
+      last_error text,
+      dead_at timestamptz not null default now()
+    );
+    create index if not exists idx_outbound_dead_letters_org on outbound_dead_letters(org_id, dead_at desc);
+
     -- Organization-wide task inbox for team collaboration
     create table if not exists task_inbox (
       task_id uuid primary key default gen_random_uuid(),
@@ -322,11 +441,55 @@ def ensure_schema(engine: Engine) -> None:
       created_by varchar(100) not null default 'system',
       is_active boolean not null default true
     );
-    create index if not exists idx_knowledge_base_content_fts
-      on knowledge_base using gin(to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, '')));
+    -- Title terms weigh A, body terms B, so ts_rank scores title matches higher.
+    alter table if exists knowledge_base add column if not exists search_vector tsvector
+      generated always as (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(content, '')), 'B')
+      ) stored;
+    drop index if exists idx_knowledge_base_content_fts;
+    create index if not exists idx_knowledge_base_search_vector on knowledge_base using gin(search_vector);
+    -- Back the fuzzy `lower(...) like '%tok%'` fallback
+    create index if not exists idx_knowledge_base_title_trgm on knowledge_base using gin(lower(title) gin_trgm_ops);
+    create index if not exists idx_knowledge_base_content_trgm on knowledge_base using gin(lower(content) gin_trgm_ops);
     create index if not exists idx_knowledge_base_category on knowledge_base(category);
     create index if not exists idx_knowledge_base_active on knowledge_base(is_active);
 
+    -- Overlapping passages of indexed documents (lexical vector + hashed dense embedding)
+    create table if not exists knowledge_chunks (
+      chunk_id uuid primary key default gen_random_uuid(),
+      source_type text not null default 'kb',
+      source_id uuid not null,
+      org_id text,
+      chunk_index integer not null,
+      title text not null default '',
+      content text not null,
+      category varchar(100),
+      source_hash text not null,
+      search_vector tsvector generated always as (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(content, '')), 'B')
+      ) stored,
+      embedding bytea not null,
+      created_at timestamptz not null default now(),
+      unique (source_type, source_id, chunk_index)
+    );
+    create index if not exists idx_knowledge_chunks_search_vector on knowledge_chunks using gin(search_vector);
+    create index if not exists idx_knowledge_chunks_source on knowledge_chunks(source_type, source_id);
+
+    -- Shared tier of the web search result cache (in-process LRU sits in front of it)
+    create table if not exists web_search_cache (
+      cache_key text primary key,
+      normalized_query text not null,
+      search_type text not null default 'search',
+      payload jsonb not null default '{}'::jsonb,
+      formatted jsonb not null default '{}'::jsonb,
+      is_error boolean not null default false,
+      created_at timestamptz not null default now(),
+      expires_at timestamptz not null
+    );
+    create index if not exists idx_web_search_cache_expires on web_search_cache(expires_at);
+
     -- Session management at scale
     create table if not exists chat_sessions (
       session_id text primary key,
@@ -399,6 +562,13 @@ def ensure_schema(engine: Engine) -> None:
       on org_model_policies(org_id, coalesce(agent_code, ''));
     create index if not exists idx_org_model_policy_org on org_model_policies(org_id);
 
+    -- Bumped on every tool/model policy write so per-worker policy caches can revalidate cheaply.
+    create table if not exists org_policy_versions (
+      org_id text primary key references organizations(org_id) on delete cascade,
+      version bigint not null default 0,
+      updated_at timestamptz not null default now()
+    );
+
     -- Skill marketplace
     create table if not exists skill_catalog (
       skill_id text primary key,
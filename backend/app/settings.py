@@ -39,8 +39,36 @@ class Settings(BaseSettings):
     multi_turn_memory_enabled: bool = Field(default=True, validation_alias="MULTI_TURN_MEMORY_ENABLED")
     multi_turn_memory_turns: int = Field(default=6, validation_alias="MULTI_TURN_MEMORY_TURNS")
     workflow_max_steps: int = Field(default=8, validation_alias="WORKFLOW_MAX_STEPS")
+    workflow_max_concurrency: int = Field(default=4, validation_alias="WORKFLOW_MAX_CONCURRENCY")
+    workflow_max_map_items: int = Field(default=200, validation_alias="WORKFLOW_MAX_MAP_ITEMS")
+    workflow_map_max_concurrency: int = Field(default=8, validation_alias="WORKFLOW_MAP_MAX_CONCURRENCY")
+    workflow_job_max_concurrency: int = Field(default=8, validation_alias="WORKFLOW_JOB_MAX_CONCURRENCY")
+    workflow_job_cancel_poll_s: float = Field(default=2.0, validation_alias="WORKFLOW_JOB_CANCEL_POLL_S")
+    workflow_step_memo_enabled: bool = Field(default=True, validation_alias="WORKFLOW_STEP_MEMO_ENABLED")
+    workflow_step_memo_max_ttl_s: int = Field(default=604800, validation_alias="WORKFLOW_STEP_MEMO_MAX_TTL_S")
+    workflow_scheduler_enabled: bool = Field(default=True, validation_alias="WORKFLOW_SCHEDULER_ENABLED")
+    workflow_scheduler_poll_s: float = Field(default=15.0, validation_alias="WORKFLOW_SCHEDULER_POLL_S")
+    workflow_scheduler_lease_s: float = Field(default=300.0, validation_alias="WORKFLOW_SCHEDULER_LEASE_S")
+    workflow_scheduler_max_concurrency: int = Field(default=4, validation_alias="WORKFLOW_SCHEDULER_MAX_CONCURRENCY")
+    workflow_scheduler_global_max_concurrency: int = Field(
+        default=32, validation_alias="WORKFLOW_SCHEDULER_GLOBAL_MAX_CONCURRENCY"
+    )
+    outbound_delivery_enabled: bool = Field(default=True, validation_alias="OUTBOUND_DELIVERY_ENABLED")
+    outbound_delivery_concurrency: int = Field(default=16, validation_alias="OUTBOUND_DELIVERY_CONCURRENCY")
+    outbound_delivery_per_destination: int = Field(default=4, validation_alias="OUTBOUND_DELIVERY_PER_DESTINATION")
+    outbound_delivery_max_attempts: int = Field(default=6, validation_alias="OUTBOUND_DELIVERY_MAX_ATTEMPTS")
+    outbound_delivery_backoff_s: float = Field(default=2.0, validation_alias="OUTBOUND_DELIVERY_BACKOFF_S")
+    outbound_delivery_max_backoff_s: float = Field(default=300.0, validation_alias="OUTBOUND_DELIVERY_MAX_BACKOFF_S")
+    outbound_delivery_poll_s: float = Field(default=5.0, validation_alias="OUTBOUND_DELIVERY_POLL_S")
+    outbound_delivery_lease_s: float = Field(default=120.0, validation_alias="OUTBOUND_DELIVERY_LEASE_S")
+    outbound_delivery_ack_timeout_s: float = Field(default=60.0, validation_alias="OUTBOUND_DELIVERY_ACK_TIMEOUT_S")
     academy_judge_provider: str | None = Field(default="groq", validation_alias="ACADEMY_JUDGE_PROVIDER")
     academy_judge_model: str | None = Field(default="llama-3.3-70b-versatile", validation_alias="ACADEMY_JUDGE_MODEL")
+    academy_agent_concurrency: int = Field(default=8, validation_alias="ACADEMY_AGENT_CONCURRENCY")
+    academy_judge_concurrency: int = Field(default=4, validation_alias="ACADEMY_JUDGE_CONCURRENCY")
+    academy_judge_batch_size: int = Field(default=5, validation_alias="ACADEMY_JUDGE_BATCH_SIZE")
+    academy_judge_cache_enabled: bool = Field(default=True, validation_alias="ACADEMY_JUDGE_CACHE_ENABLED")
+    academy_results_flush_every: int = Field(default=20, validation_alias="ACADEMY_RESULTS_FLUSH_EVERY")
 
     # Supabase Auth (frontend uses anon key; backend uses it to validate access tokens)
     supabase_url: str | None = Field(default=None, validation_alias="SUPABASE_URL")
@@ -53,16 +81,46 @@ class Settings(BaseSettings):
     serper_api_key: str | None = Field(default=None, validation_alias="SERPER_API_KEY")
     enable_web_search: bool = Field(default=True, validation_alias="ENABLE_WEB_SEARCH")
     enable_document_retrieval: bool = Field(default=True, validation_alias="ENABLE_DOCUMENT_RETRIEVAL")
+    web_search_timeout_s: float = Field(default=10.0, validation_alias="WEB_SEARCH_TIMEOUT_S")
+    web_search_max_concurrency: int = Field(default=8, validation_alias="WEB_SEARCH_MAX_CONCURRENCY")
+    web_search_cache_enabled: bool = Field(default=True, validation_alias="WEB_SEARCH_CACHE_ENABLED")
+    web_search_cache_volatile_ttl_s: int = Field(default=900, validation_alias="WEB_SEARCH_CACHE_VOLATILE_TTL_S")
+    web_search_cache_evergreen_ttl_s: int = Field(default=86400, validation_alias="WEB_SEARCH_CACHE_EVERGREEN_TTL_S")
+    web_search_cache_error_ttl_s: int = Field(default=60, validation_alias="WEB_SEARCH_CACHE_ERROR_TTL_S")
+    retrieval_chunk_chars: int = Field(default=800, validation_alias="RETRIEVAL_CHUNK_CHARS")
+    retrieval_chunk_overlap_chars: int = Field(default=150, validation_alias="RETRIEVAL_CHUNK_OVERLAP_CHARS")
+    retrieval_embedding_dim: int = Field(default=384, validation_alias="RETRIEVAL_EMBEDDING_DIM")
+    retrieval_dense_weight: float = Field(default=0.4, validation_alias="RETRIEVAL_DENSE_WEIGHT")
+    vector_index_dir: str = Field(default="vector_index", validation_alias="VECTOR_INDEX_DIR")
+    retrieval_reindex_check_s: float = Field(default=60.0, validation_alias="RETRIEVAL_REINDEX_CHECK_S")
+    http_pool_size: int = Field(default=100, validation_alias="HTTP_POOL_SIZE")
+    http_pool_per_host: int = Field(default=20, validation_alias="HTTP_POOL_PER_HOST")
+    smtp_pool_enabled: bool = Field(default=True, validation_alias="SMTP_POOL_ENABLED")
+    smtp_pool_per_server: int = Field(default=4, validation_alias="SMTP_POOL_PER_SERVER")
+    smtp_pool_idle_timeout_s: float = Field(default=60.0, validation_alias="SMTP_POOL_IDLE_TIMEOUT_S")
+    smtp_pool_max_messages_per_connection: int = Field(
+        default=100, validation_alias="SMTP_POOL_MAX_MESSAGES_PER_CONNECTION"
+    )
     session_compaction_enabled: bool = Field(default=True, validation_alias="SESSION_COMPACTION_ENABLED")
     session_compaction_turns: int = Field(default=24, validation_alias="SESSION_COMPACTION_TURNS")
     session_context_recent_turns: int = Field(default=8, validation_alias="SESSION_CONTEXT_RECENT_TURNS")
     session_max_parallel_per_org: int = Field(default=50, validation_alias="SESSION_MAX_PARALLEL_PER_ORG")
     upload_dir: str = Field(default="uploads", validation_alias="UPLOAD_DIR")
     upload_max_size_mb: int = Field(default=10, validation_alias="UPLOAD_MAX_SIZE_MB")
+    extraction_max_workers: int = Field(default=2, validation_alias="EXTRACTION_MAX_WORKERS")
+    extraction_max_concurrency: int = Field(default=4, validation_alias="EXTRACTION_MAX_CONCURRENCY")
+    extraction_timeout_s: float = Field(default=60.0, validation_alias="EXTRACTION_TIMEOUT_S")
+    extraction_max_pdf_pages: int = Field(default=300, validation_alias="EXTRACTION_MAX_PDF_PAGES")
+    extraction_pdf_pages_per_task: int = Field(default=25, validation_alias="EXTRACTION_PDF_PAGES_PER_TASK")
+    file_context_token_budget: int = Field(default=1500, validation_alias="FILE_CONTEXT_TOKEN_BUDGET")
+    vision_image_max_px: int = Field(default=1024, validation_alias="VISION_IMAGE_MAX_PX")
+    vision_max_images: int = Field(default=4, validation_alias="VISION_MAX_IMAGES")
     environment: str = Field(default="development", validation_alias="ENVIRONMENT")
     rate_limit_enabled: bool = Field(default=True, validation_alias="RATE_LIMIT_ENABLED")
     execute_rate_limit_per_minute: int = Field(default=20, validation_alias="EXECUTE_RATE_LIMIT_PER_MINUTE")
     default_rate_limit_per_minute: int = Field(default=200, validation_alias="DEFAULT_RATE_LIMIT_PER_MINUTE")
+    policy_cache_enabled: bool = Field(default=True, validation_alias="POLICY_CACHE_ENABLED")
+    policy_cache_revalidate_s: float = Field(default=30.0, validation_alias="POLICY_CACHE_REVALIDATE_S")
 
 
 settings = Settings()
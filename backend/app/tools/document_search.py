@@ -7,42 +7,17 @@ from typing import Any
 from sqlalchemy import text
 
 from app.db import SessionLocal
+from app.llm.intent_classifier import intent_classifier
+from app.retrieval import knowledge_index
 
 logger = logging.getLogger(__name__)
 
 
 class DocumentSearchTool:
-    """Search internal knowledge base using Postgres full-text search."""
-
-    _DOC_HINTS = (
-        "hours",
-        "pricing",
-        "price",
-        "security",
-        "privacy",
-        "policy",
-        "refund",
-        "cancel",
-        "onboarding",
-        "getting started",
-        "integration",
-        "integrations",
-        "compliance",
-        "department",
-        "agents",
-        "capabilities",
-        "support",
-    )
+    """Search internal knowledge base: hybrid passage retrieval, then document-level FTS as fallback."""
 
     def needs_docs(self, message: str) -> bool:
-        content = (message or "").strip().lower()
-        if not content:
-            return False
-        if len(content.split()) < 3:
-            return False
-        if any(hint in content for hint in self._DOC_HINTS):
-            return True
-        return bool(re.search(r"\b(what|how|when|where)\b", content))
+        return intent_classifier.classify(message).needs_docs
 
     def search(
         self,
@@ -54,93 +29,80 @@ class DocumentSearchTool:
         if not q:
             return []
         cap = max(1, min(int(limit), 10))
+        try:
+            passages = knowledge_index.search(q, limit=cap, category=category)
+            if passages:
+                return passages
+        except Exception as e:
+            logger.warning("Passage search unavailable, using document search: %s", e)
         try:
             with SessionLocal() as db:
-                if category:
-                    rows = db.execute(
-                        text(
-                            """
-                            select
-                              id,
-                              title,
-                              content,
-                              category,
-                              tags,
-                              source_url,
-                              ts_rank(
-                                to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, '')),
-                                plainto_tsquery('english', :query)
-                              ) as rank
-                            from knowledge_base
-                            where is_active = true
-                              and category = :category
-                              and to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, ''))
-                                  @@ plainto_tsquery('english', :query)
-                            order by rank desc
-                            limit :limit;
-                            """
-                        ),
-                        {"query": q, "category": category, "limit": cap},
-                    ).mappings().all()
-                else:
-                    rows = db.execute(
-                        text(
-                            """
-                            select
-                              id,
-                              title,
-                              content,
-                              category,
-                              tags,
-                              source_url,
-                              ts_rank(
-                                to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, '')),
-                                plainto_tsquery('english', :query)
-                              ) as rank
-                            from knowledge_base
-                            where is_active = true
-                              and to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, ''))
-                                  @@ plainto_tsquery('english', :query)
-                            order by rank desc
-                            limit :limit;
-                            """
-                        ),
-                        {"query": q, "limit": cap},
-                    ).mappings().all()
-
+                sql, params = self.fts_statement(q, limit=cap, category=category)
+                rows = db.execute(text(sql), params).mappings().all()
                 results = [dict(row) for row in rows]
                 if results:
                     return results
 
                 # Fallback for natural-language queries that don't match FTS well.
-                tokens = [token for token in re.findall(r"[a-zA-Z0-9]+", q.lower()) if len(token) >= 4][:6]
-                if not tokens:
+                fallback = self.fuzzy_statement(q, limit=cap)
+                if fallback is None:
                     return []
-                or_clauses = []
-                params: dict[str, Any] = {"limit": cap}
-                for idx, token in enumerate(tokens, start=1):
-                    key = f"t{idx}"
-                    params[key] = f"%{token}%"
-                    or_clauses.append(f"(lower(title) like :{key} or lower(content) like :{key})")
-                where = " or ".join(or_clauses)
-                fallback_rows = db.execute(
-                    text(
-                        f"""
-                        select id, title, content, category, tags, source_url, 0.01 as rank
-                        from knowledge_base
-                        where is_active = true
-                          and ({where})
-                        order by updated_at desc
-                        limit :limit;
-                        """
-                    ),
-                    params,
-                ).mappings().all()
+                sql, params = fallback
+                fallback_rows = db.execute(text(sql), params).mappings().all()
                 return [dict(row) for row in fallback_rows]
         except Exception as e:
             logger.error("Document search error: %s", e)
             return []
 
+    def fts_statement(self, query: str, *, limit: int, category: str | None = None) -> tuple[str, dict[str, Any]]:
+        """Full-text query over the stored, title-weighted `search_vector` column."""
+        params: dict[str, Any] = {"query": query, "limit": limit}
+        category_clause = ""
+        if category:
+            category_clause = "and kb.category = :category"
+            params["category"] = category
+        sql = f"""
+            select
+              kb.id,
+              kb.title,
+              kb.content,
+              kb.category,
+              kb.tags,
+              kb.source_url,
+              ts_rank(kb.search_vector, q.tsq) as rank
+            from knowledge_base kb, plainto_tsquery('english', :query) as q(tsq)
+            where kb.is_active = true
+              {category_clause}
+              and kb.search_vector @@ q.tsq
+            order by rank desc
+            limit :limit;
+            """
+        return sql, params
+
+    def fuzzy_statement(self, query: str, *, limit: int) -> tuple[str, dict[str, Any]] | None:
+        """Substring fallback; `lower(...) like` is served by the pg_trgm GIN indexes."""
+        tokens = [token for token in re.findall(r"[a-zA-Z0-9]+", query.lower()) if len(token) >= 4][:6]
+        if not tokens:
+            return None
+        or_clauses = []
+        params: dict[str, Any] = {"limit": limit, "fuzzy": " ".join(tokens)}
+        for idx, token in enumerate(tokens, start=1):
+            key = f"t{idx}"
+            params[key] = f"%{token}%"
+            or_clauses.append(f"lower(title) like :{key} or lower(content) like :{key}")
+        where = " or ".join(or_clauses)
+        sql = f"""
+            select
+              id, title, content, category, tags, source_url,
+              0.01 * similarity(lower(title), :fuzzy) as rank
+            from knowledge_base
+            where is_active = true
+              and ({where})
+            order by similarity(lower(title), :fuzzy) desc, updated_at desc
+            limit :limit;
+            """
+        return sql, params
+
     def format_results(self, results: list[dict[str, Any]], max_content_length: int = 300) -> str:
         if not results:
             return "No relevant internal documents found."
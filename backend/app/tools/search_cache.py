@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import text
+
+from app.db import SessionLocal
+from app.llm.search_detector import SearchDetector
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Unicode word characters, so non-Latin queries keep their terms ("東京の天気", "café").
+_TOKEN_PATTERN = re.compile(r"[\w$%.+#-]+")
+
+_STOP_WORDS = frozenset(
+    {
+        "a", "an", "the", "of", "for", "to", "in", "on", "at", "by", "with", "about",
+        "is", "are", "was", "were", "be", "do", "does", "did", "me", "my", "i", "you",
+        "your", "please", "tell", "show", "give", "what", "whats", "who", "whos",
+        "when", "where", "how", "which", "and", "or", "can", "could", "would", "there",
+    }
+)
+
+# Queries whose answers go stale within minutes/hours.
+_VOLATILE_MARKERS = frozenset(
+    {
+        "news", "latest", "breaking", "today", "tonight", "yesterday", "now", "current",
+        "currently", "recent", "price", "prices", "stock", "stocks", "market", "trading",
+        "weather", "temperature", "forecast", "score", "scores", "game", "match", "live",
+        "week", "announcement", "update",
+    }
+)
+
+
+@dataclass
+class SearchCacheEntry:
+    raw: dict[str, Any]
+    is_error: bool
+    expires_at: float
+    formatted: dict[int, str] = field(default_factory=dict)
+
+
+class SearchResultCache:
+    """Two-tier (in-process LRU + Postgres) cache in front of the Serper API."""
+
+    def __init__(self, max_items: int = 2000) -> None:
+        self.max_items = max(100, int(max_items))
+        self._lock = threading.Lock()
+        self._items: OrderedDict[str, SearchCacheEntry] = OrderedDict()
+        self._puts = 0
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def normalize(self, query: str) -> str:
+        """Cache key text of a query; empty when nothing identifying is left (never cache those)."""
+        cleaned = (query or "").strip().casefold()
+        for prefix in SearchDetector.QUERY_PREFIXES:
+            if cleaned.startswith(prefix):
+                cleaned = cleaned[len(prefix) :]
+                break
+        tokens = [t.strip(".-") for t in _TOKEN_PATTERN.findall(cleaned.replace("'", ""))]
+        kept = [t for t in tokens if t and t not in _STOP_WORDS]
+        return " ".join(kept or [t for t in tokens if t])
+
+    def classify(self, normalized: str) -> str:
+        return "volatile" if any(token in _VOLATILE_MARKERS for token in normalized.split()) else "evergreen"
+
+    def ttl_for(self, query_class: str, *, is_error: bool) -> int:
+        if is_error:
+            return max(1, int(settings.web_search_cache_error_ttl_s))
+        if query_class == "volatile":
+            return max(1, int(settings.web_search_cache_volatile_ttl_s))
+        return max(1, int(settings.web_search_cache_evergreen_ttl_s))
+
+    def make_key(self, *, normalized: str, search_type: str, num_results: int) -> str:
+        payload = f"{search_type}|{int(num_results)}|{normalized}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: str) -> SearchCacheEntry | None:
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._items.move_to_end(key)
+                    self.memory_hits += 1
+                    if entry.is_error:
+                        self.negative_hits += 1
+                    return entry
+                self._items.pop(key, None)
+
+        entry = self._get_shared(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            if entry.is_error:
+                self.negative_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, *, normalized: str, search_type: str, raw: dict[str, Any], formatted: dict[int, str] | None = None) -> SearchCacheEntry:
+        is_error = "error" in raw
+        ttl = self.ttl_for(self.classify(normalized), is_error=is_error)
+        entry = SearchCacheEntry(raw=raw, is_error=is_error, expires_at=time.time() + ttl, formatted=dict(formatted or {}))
+        with self._lock:
+            self._remember(key, entry)
+            self._puts += 1
+            sweep = self._puts % 200 == 0
+        self._put_shared(key, normalized=normalized, search_type=search_type, entry=entry, ttl=ttl, sweep=sweep)
+        return entry
+
+    def remember_formatted(self, key: str, entry: SearchCacheEntry, max_results: int, formatted: str) -> None:
+        with self._lock:
+            entry.formatted[int(max_results)] = formatted
+        self._update_shared_formatted(key, entry)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.shared_hits
+            lookups = hits + self.misses
+            return {
+                "items": len(self._items),
+                "memory_hits": self.memory_hits,
+                "shared_hits": self.shared_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups * 100.0, 2) if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, entry: SearchCacheEntry) -> None:
+        self._items[key] = entry
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def _get_shared(self, key: str, now: float) -> SearchCacheEntry | None:
+        try:
+            with SessionLocal() as db:
+                row = db.execute(
+                    text(
+                        """
+                        select payload, formatted, is_error, extract(epoch from expires_at) as expires_at
+                        from web_search_cache
+                        where cache_key = :cache_key and expires_at > now()
+                        limit 1;
+                        """
+                    ),
+                    {"cache_key": key},
+                ).mappings().first()
+        except Exception as exc:
+            logger.debug("Shared search cache read failed: %s", exc)
+            return None
+        if not row:
+            return None
+        formatted = {int(k): str(v) for k, v in dict(row["formatted"] or {}).items()}
+        return SearchCacheEntry(
+            raw=dict(row["payload"] or {}),
+            is_error=bool(row["is_error"]),
+            expires_at=float(row["expires_at"] or now),
+            formatted=formatted,
+        )
+
+    def _put_shared(self, key: str, *, normalized: str, search_type: str, entry: SearchCacheEntry, ttl: int, sweep: bool) -> None:
+        try:
+            with SessionLocal() as db:
+                db.execute(
+                    text(
+                        """
+                        insert into web_search_cache
+                          (cache_key, normalized_query, search_type, payload, formatted, is_error, created_at, expires_at)
+                        values
+                          (:cache_key, :normalized_query, :search_type, cast(:payload as jsonb), cast(:formatted as jsonb),
+                           :is_error, now(), now() + make_interval(secs => :ttl))
+                        on conflict (cache_key) do update set
+                          payload = excluded.payload,
+                          formatted = excluded.formatted,
+                          is_error = excluded.is_error,
+                          created_at = excluded.created_at,
+                          expires_at = excluded.expires_at;
+                        """
+                    ),
+                    {
+                        "cache_key": key,
+                        "normalized_query": normalized,
+                        "search_type": search_type,
+                        "payload": json.dumps(entry.raw),
+                        "formatted": json.dumps({str(k): v for k, v in entry.formatted.items()}),
+                        "is_error": entry.is_error,
+                        "ttl": ttl,
+                    },
+                )
+                if sweep:
+                    db.execute(text("delete from web_search_cache where expires_at < now();"))
+                db.commit()
+        except Exception as exc:
+            logger.debug("Shared search cache write failed: %s", exc)
+
+    def _update_shared_formatted(self, key: str, entry: SearchCacheEntry) -> None:
+        try:
+            with SessionLocal() as db:
+                db.execute(
+                    text("update web_search_cache set formatted = cast(:formatted as jsonb) where cache_key = :cache_key;"),
+                    {"cache_key": key, "formatted": json.dumps({str(k): v for k, v in entry.formatted.items()})},
+                )
+                db.commit()
+        except Exception as exc:
+            logger.debug("Shared search cache update failed: %s", exc)
+
+
+search_cache = SearchResultCache()
@@ -6,7 +6,9 @@ from typing import Any
 
 import aiohttp
 
+from app.http_session import get_http_session
 from app.settings import settings
+from app.tools.search_cache import SearchCacheEntry, search_cache
 
 logger = logging.getLogger(__name__)
 
@@ -37,25 +39,71 @@ class WebSearchTool:
             num_results: number of results (1-10)
             search_type: 'search' | 'news' | 'images'
         """
-        if not self.api_key:
-            return {"error": "Web search not configured"}
+        raw, _, _ = await self._cached_search(query=query, num_results=num_results, search_type=search_type)
+        return raw
 
+    async def search_formatted(
+        self,
+        query: str,
+        num_results: int = 5,
+        max_results: int = 3,
+        search_type: str = "search",
+    ) -> tuple[dict[str, Any], str]:
+        """Search and return `(raw, formatted)`, reusing the cached formatted block when present."""
+        raw, key, entry = await self._cached_search(query=query, num_results=num_results, search_type=search_type)
+        if entry is not None and int(max_results) in entry.formatted:
+            return raw, entry.formatted[int(max_results)]
+        formatted = self.format_results(raw, max_results=max_results)
+        if entry is not None and key:
+            await asyncio.to_thread(search_cache.remember_formatted, key, entry, max_results, formatted)
+        return raw, formatted
+
+    async def _cached_search(
+        self,
+        *,
+        query: str,
+        num_results: int,
+        search_type: str,
+    ) -> tuple[dict[str, Any], str, SearchCacheEntry | None]:
+        if not self.api_key:
+            return {"error": "Web search not configured"}, "", None
+        num = max(1, min(int(num_results), 10))
+        if not settings.web_search_cache_enabled:
+            return await self._fetch(query=query, num_results=num, search_type=search_type), "", None
+
+        normalized = search_cache.normalize(query)
+        if not normalized:
+            # Queries made only of punctuation would all share one key.
+            return await self._fetch(query=query, num_results=num, search_type=search_type), "", None
+        key = search_cache.make_key(normalized=normalized, search_type=search_type, num_results=num)
+        entry = await asyncio.to_thread(search_cache.get, key)
+        if entry is None:
+            raw = await self._fetch(query=query, num_results=num, search_type=search_type)
+            entry = await asyncio.to_thread(
+                search_cache.put,
+                key,
+                normalized=normalized,
+                search_type=search_type,
+                raw=raw,
+            )
+        return entry.raw, key, entry
+
+    async def _fetch(self, *, query: str, num_results: int, search_type: str) -> dict[str, Any]:
         headers = {"X-API-KEY": self.api_key, "Content-Type": "application/json"}
-        payload = {"q": query, "num": max(1, min(int(num_results), 10))}
+        payload = {"q": query, "num": num_results}
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/{search_type}",
-                    headers=headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=10),
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error("Serper API error: %s - %s", response.status, error_text)
-                        return {"error": f"Search failed: {response.status}"}
-                    return await response.json()
+            async with get_http_session().post(
+                f"{self.base_url}/{search_type}",
+                headers=headers,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=max(1.0, float(settings.web_search_timeout_s))),
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error("Serper API error: %s - %s", response.status, error_text)
+                    return {"error": f"Search failed: {response.status}"}
+                return await response.json()
         except asyncio.TimeoutError:
             logger.error("Serper API timeout")
             return {"error": "Search timeout"}
@@ -64,7 +112,7 @@ class WebSearchTool:
             return {"error": str(e)}
 
     def search_sync(self, query: str, num_results: int = 5, search_type: str = "search") -> dict[str, Any]:
-        """Sync wrapper for route/client code that isn't async."""
+        """Sync wrapper for scripts. Never call this from code running inside an event loop."""
         return asyncio.run(self.search(query=query, num_results=num_results, search_type=search_type))
 
     def format_results(self, results: dict[str, Any], max_results: int = 3) -> str:
@@ -1,3 +1,4 @@
 from app.workflows.engine import EngineStepResult, WorkflowEngine
+from app.workflows.runs import WorkflowRunStore
 
-__all__ = ["WorkflowEngine", "EngineStepResult"]
+__all__ = ["WorkflowEngine", "EngineStepResult", "WorkflowRunStore"]
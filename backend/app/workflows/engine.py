@@ -1,24 +1,54 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import re
 import uuid
-from dataclasses import dataclass
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Any, Callable, Sequence
 
 from fastapi import HTTPException
 from sqlalchemy import select, text
 from sqlalchemy.orm import Session
 
 from app.agents.prompts import inject_domain_block, system_prompt_for_agent
-from app.integrations.email import email_integration
-from app.integrations.slack import slack_integration
-from app.integrations.webhook import webhook_integration
+from app.integrations.delivery import (
+    DELIVERY_CHANNELS,
+    OutboundDeliveryStore,
+    delivery_destination,
+    delivery_worker,
+    send_delivery,
+)
 from app.llm.litellm_client import LLMError, execute_via_litellm
 from app.models import AgentCatalog, HiredAgent
 from app.schemas_execute import ExecuteContext
 from app.settings import settings
-
-_VAR_PATTERN = re.compile(r"\{\{([a-zA-Z_][a-zA-Z0-9_]*)\}\}")
+from app.workflows.memo import StepMemoStore, step_memo_key
+from app.workflows.plans import (
+    VAR_PATTERN,
+    CompiledCondition,
+    CompiledStep,
+    WorkflowPlan,
+    build_plan,
+    execution_mode,
+    is_map_step,
+)
+from app.workflows.runs import RunCheckpoint, WorkflowRunStore
+
+EventCallback = Callable[[str, dict[str, Any]], None]
+
+
+def _has_cycle(dependencies: dict[str, list[str]]) -> bool:
+    remaining = {step_id: set(deps) for step_id, deps in dependencies.items()}
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            return True
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return False
 
 
 @dataclass
@@ -31,11 +61,59 @@ class EngineStepResult:
     model_used: str
     latency_ms: int
     trace_id: str
+    items_total: int | None = None
+    items_failed: int | None = None
+    item_errors: list[dict[str, Any]] = field(default_factory=list)
+    cached: bool = False
+
+
+def parse_map_items(value: Any) -> list[str]:
+    """A map step's list: a Python list, a JSON array, or one item per non-empty line."""
+    if isinstance(value, str):
+        raw = value.strip()
+        if raw.startswith("["):
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                pass
+        if isinstance(value, str):
+            return [line.strip() for line in raw.splitlines() if line.strip()]
+    if not isinstance(value, list):
+        return []
+    return [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in value]
+
+
+def _step_from_row(row: dict[str, Any]) -> EngineStepResult:
+    result = dict(row.get("result") or {})
+    return EngineStepResult(
+        step_index=int(row["step_index"]),
+        step_id=str(row["step_id"]),
+        agent_code=str(row["agent_code"] or ""),
+        input_message=str(row["input_message"] or ""),
+        response=str(row["response"] or ""),
+        model_used=str(row["model_used"] or ""),
+        latency_ms=int(row["latency_ms"] or 0),
+        trace_id=str(row["trace_id"] or ""),
+        items_total=result.get("items_total"),
+        items_failed=result.get("items_failed"),
+        item_errors=list(result.get("item_errors") or []),
+        cached=bool(result.get("cached")),
+    )
 
 
 class WorkflowEngine:
     def __init__(self, db: Session) -> None:
         self.db = db
+        self._map_items_used = 0
+        self._run_store: WorkflowRunStore | None = None
+        self._workflow_id: str | None = None
+        self._step_retries = 0
+        self._retry_backoff_s = 1.0
+        self._on_event: EventCallback | None = None
+        self._agents: dict[str, AgentCatalog] = {}
+        self._hired_codes: set[str] = set()
+        self._system_prompts: dict[str, str] = {}
+        self._memo_ttl_s = 0
 
     def validate_definition(self, definition: dict[str, Any]) -> list[str]:
         errors: list[str] = []
@@ -56,6 +134,11 @@ class WorkflowEngine:
                 ids.add(step_id)
             if not str(step.get("agent_code") or "").strip():
                 errors.append(f"steps[{idx}].agent_code is required")
+            if is_map_step(step):
+                if not str(step.get("map_over") or "").strip():
+                    errors.append(f"steps[{idx}].map_over is required for map steps")
+                if str(step.get("action") or "").strip():
+                    errors.append(f"steps[{idx}]: map steps run agents and cannot use an integration action")
         # Validate references
         for idx, step in enumerate(steps):
             condition = step.get("conditions") or {}
@@ -67,6 +150,32 @@ class WorkflowEngine:
             next_id = str(step.get("next") or "").strip()
             if next_id and next_id not in ids:
                 errors.append(f"steps[{idx}].next references unknown step id '{next_id}'")
+            depends_on = step.get("depends_on")
+            if depends_on is not None:
+                if not isinstance(depends_on, (list, str)):
+                    errors.append(f"steps[{idx}].depends_on must be a list of step ids")
+                else:
+                    for target in [depends_on] if isinstance(depends_on, str) else depends_on:
+                        if str(target).strip() not in ids:
+                            errors.append(f"steps[{idx}].depends_on references unknown step id '{target}'")
+
+        memoize_ttl_s = definition.get("memoize_ttl_s")
+        if memoize_ttl_s is not None:
+            max_ttl_s = int(settings.workflow_step_memo_max_ttl_s)
+            if not isinstance(memoize_ttl_s, int) or isinstance(memoize_ttl_s, bool) or not 0 <= memoize_ttl_s <= max_ttl_s:
+                errors.append(f"memoize_ttl_s must be an integer between 0 and {max_ttl_s}")
+        mode = execution_mode(definition)
+        if mode not in {"sequential", "parallel"}:
+            errors.append("execution_mode must be 'sequential' or 'parallel'")
+        elif mode == "parallel" and not errors:
+            for idx, step in enumerate(steps):
+                conditions = step.get("conditions") if isinstance(step.get("conditions"), dict) else {}
+                if step.get("next") or any(conditions.get(key) for key in ("if", "true", "false", "next")):
+                    errors.append(f"steps[{idx}]: next/conditions are not supported in parallel mode; use depends_on")
+            if len(steps) > max(1, int(settings.workflow_max_steps)):
+                errors.append(f"Workflow exceeded max step limit ({settings.workflow_max_steps})")
+            if not errors and _has_cycle(self.step_dependencies(steps)):
+                errors.append("depends_on contains a cycle")
         return errors
 
     def resolve_variables(self, text_value: str, variables: dict[str, Any]) -> str:
@@ -78,81 +187,22 @@ class WorkflowEngine:
             value = variables.get(key, "")
             return str(value)
 
-        return _VAR_PATTERN.sub(repl, text_value)
+        return VAR_PATTERN.sub(repl, text_value)
 
     def evaluate_condition(self, expr: str, variables: dict[str, Any]) -> bool:
-        expression = (expr or "").strip()
-        if not expression:
-            return True
-        hydrated = self.resolve_variables(expression, variables)
-        
-        # Security: Use AST parsing to strictly limit allowed operations
-        # No function calls, no attribute access, no imports.
-        import ast
-        import operator
-
-        # Supported operators
-        ops = {
-            ast.Eq: operator.eq,
-            ast.NotEq: operator.ne,
-            ast.Lt: operator.lt,
-            ast.LtE: operator.le,
-            ast.Gt: operator.gt,
-            ast.GtE: operator.ge,
-            ast.In: lambda x, y: x in y,
-            ast.NotIn: lambda x, y: x not in y,
-            ast.And: lambda x, y: x and y,
-            ast.Or: lambda x, y: x or y,
-            ast.Not: operator.not_,
-        }
+        """Evaluate a `conditions.if` expression; see CompiledCondition for the allowed syntax."""
+        return CompiledCondition.parse(expr).evaluate(variables)
 
-        def _eval_node(node):
-            if isinstance(node, ast.Expression):
-                return _eval_node(node.body)
-            elif isinstance(node, ast.Constant): # Python 3.8+
-                return node.value
-            elif isinstance(node, ast.NameConstant): # Python < 3.8
-                return node.value
-            elif isinstance(node, ast.Str): # Python < 3.8
-                return node.s
-            elif isinstance(node, ast.Num): # Python < 3.8
-                return node.n
-            elif isinstance(node, ast.Compare):
-                left = _eval_node(node.left)
-                for op, right_node in zip(node.ops, node.comparators):
-                    right = _eval_node(right_node)
-                    if not ops.get(type(op))(left, right):
-                        return False
-                    left = right
-                return True
-            elif isinstance(node, ast.BoolOp):
-                values = [_eval_node(v) for v in node.values]
-                if isinstance(node.op, ast.And):
-                    return all(values)
-                elif isinstance(node.op, ast.Or):
-                    return any(values)
-            elif isinstance(node, ast.UnaryOp):
-                return ops[type(node.op)](_eval_node(node.operand))
-            elif isinstance(node, ast.Name):
-                # Allow basic True/False/None
-                if node.id == "True": return True
-                if node.id == "False": return False
-                if node.id == "None": return None
-                # Variables should be resolved by resolve_variables string replacement before this
-                # But if we want to support unquoted vars, we could look them up here. 
-                # For now, sticking to the existing pattern where resolve_variables handles data.
-                return node.id 
-            
-            raise ValueError(f"Unsafe or unsupported operation: {type(node)}")
-
-        try:
-            tree = ast.parse(hydrated, mode='eval')
-            return bool(_eval_node(tree))
-        except Exception:
-            # Fallback to False on any error or security violation
-            return False
+    def compile_plan(self, definition: dict[str, Any]) -> WorkflowPlan:
+        """Validate a definition and compile it into a reusable WorkflowPlan (400 if invalid)."""
+        errors = self.validate_definition(definition)
+        if errors:
+            raise HTTPException(status_code=400, detail="; ".join(errors))
+        return build_plan(definition, dependencies=self.step_dependencies(definition["steps"]))
 
-    def get_next_step(self, *, current_step: dict[str, Any], condition_result: bool, order: list[str], current_index: int) -> str | None:
+    def get_next_step(
+        self, *, current_step: Any, condition_result: bool, order: Sequence[str], current_index: int
+    ) -> str | None:
         conditions = current_step.get("conditions") or {}
         if isinstance(conditions, dict):
             if condition_result:
@@ -177,146 +227,624 @@ class WorkflowEngine:
         session_id: str,
         initial_message: str,
         context: ExecuteContext,
-        workflow_definition: dict[str, Any],
+        workflow_definition: dict[str, Any] | None = None,
+        plan: WorkflowPlan | None = None,
+        workflow_id: str | None = None,
+        resume: bool = False,
+        step_retries: int = 0,
+        retry_backoff_s: float = 1.0,
+        on_event: EventCallback | None = None,
+    ) -> tuple[str, list[EngineStepResult]]:
+        """
+        Run a workflow definition, or a `plan` already compiled from one (see compile_plan).
+
+        With `workflow_id`, the run is checkpointed through WorkflowRunStore: every finished step
+        and the variable state are saved, the run row ends as completed/failed/cancelled, and
+        `resume=True` continues from the first unfinished step. A step that fails with a 5xx is
+        retried on its own up to `step_retries` times with exponential backoff. `on_event`
+        receives step_started / step_completed / step_failed / token events as they happen.
+        Definitions with `memoize_ttl_s` reuse stored outputs of agent steps whose agent, system
+        prompt and resolved input are unchanged; such steps come back with `cached=True`.
+        """
+        self._run_store = WorkflowRunStore(self.db) if workflow_id else None
+        self._workflow_id = workflow_id
+        self._step_retries = max(0, int(step_retries))
+        self._retry_backoff_s = max(0.0, float(retry_backoff_s))
+        self._on_event = on_event
+        self._map_items_used = 0
+        try:
+            if plan is None:
+                plan = self.compile_plan(workflow_definition or {})
+            self._resolve_agents(plan, org_id=org_id)
+            self._memo_ttl_s = plan.memoize_ttl_s if settings.workflow_step_memo_enabled else 0
+            checkpoint = self._run_store.load_checkpoint(workflow_id) if self._run_store and resume else None
+            run = self._execute_parallel if plan.execution_mode == "parallel" else self._execute_sequential
+            final_response, results = await run(
+                org_id=org_id,
+                session_id=session_id,
+                initial_message=initial_message,
+                context=context,
+                plan=plan,
+                checkpoint=checkpoint,
+            )
+        except asyncio.CancelledError:
+            self._finish_run(status="cancelled", error="Workflow cancelled")
+            raise
+        except HTTPException as exc:
+            self._finish_run(status="failed", error=str(exc.detail))
+            raise
+        except Exception as exc:
+            self._finish_run(status="failed", error=str(exc))
+            raise
+        self._finish_run(status="completed", final_response=final_response)
+        return final_response, results
+
+    def _finish_run(self, *, status: str, final_response: str = "", error: str | None = None) -> None:
+        if self._run_store is not None and self._workflow_id:
+            self._run_store.finish_run(self._workflow_id, status=status, final_response=final_response, error=error)
+
+    async def _execute_sequential(
+        self,
+        *,
+        org_id: str,
+        session_id: str,
+        initial_message: str,
+        context: ExecuteContext,
+        plan: WorkflowPlan,
+        checkpoint: RunCheckpoint | None = None,
     ) -> tuple[str, list[EngineStepResult]]:
-        errors = self.validate_definition(workflow_definition)
-        if errors:
-            raise HTTPException(status_code=400, detail="; ".join(errors))
-
-        steps = workflow_definition["steps"]
-        step_by_id = {str(step["id"]): step for step in steps}
-        order = [str(step["id"]) for step in steps]
         max_steps = max(1, int(settings.workflow_max_steps))
         variables: dict[str, Any] = {"initial_message": initial_message, "previous_response": initial_message}
-        current_id = str(workflow_definition.get("start_step_id") or order[0])
+        current_id: str | None = plan.start_step_id
         results: list[EngineStepResult] = []
-        safety_counter = 0
+        if checkpoint is not None:
+            variables.update(checkpoint.variables)
+            results = [_step_from_row(row) for row in checkpoint.completed_steps]
+            if checkpoint.current_step_id or results:
+                current_id = checkpoint.current_step_id
+        safety_counter = len(results)
 
         while current_id:
             safety_counter += 1
             if safety_counter > max_steps:
                 raise HTTPException(status_code=400, detail=f"Workflow exceeded max step limit ({max_steps})")
 
-            step = step_by_id.get(current_id)
-            if not step:
+            step = plan.step(current_id)
+            if step is None:
                 break
-            step_index = len(results) + 1
-            agent_code = str(step.get("agent_code") or "").strip()
-            action = str(step.get("action") or "").strip().lower()
-            action_config = dict(step.get("action_config") or {})
-            integration_id = str(step.get("integration_id") or "").strip()
-            agent = self.db.execute(select(AgentCatalog).where(AgentCatalog.code == agent_code)).scalars().first()
-            if not agent:
-                raise HTTPException(status_code=404, detail=f"Agent not found in workflow step {step_index}: {agent_code}")
-
-            hired = (
-                self.db.execute(
-                    select(HiredAgent)
-                    .where(HiredAgent.org_id == org_id)
-                    .where(HiredAgent.agent_code == agent_code)
-                    .where(HiredAgent.status == "active")
+            step_result, attempts = await self._run_step_with_retry(
+                step=step,
+                step_index=len(results) + 1,
+                variables=variables,
+                org_id=org_id,
+                session_id=session_id,
+                initial_message=initial_message,
+                context=context,
+            )
+            variables["previous_response"] = step_result.response
+            if step.set_var:
+                variables[step.set_var] = step_result.response
+            results.append(step_result)
+
+            current_id = self.get_next_step(
+                current_step=step.config,
+                condition_result=step.condition.evaluate(variables),
+                order=plan.order,
+                current_index=step.index,
+            )
+            self._checkpoint(step_result, attempts=attempts, variables=variables, next_step_id=current_id)
+
+        return str(variables.get("previous_response") or initial_message), results
+
+    def _checkpoint(self, step: EngineStepResult, *, attempts: int, variables: dict[str, Any], next_step_id: str | None) -> None:
+        if self._run_store is not None and self._workflow_id:
+            self._run_store.record_step(
+                workflow_id=self._workflow_id,
+                step=step,
+                attempts=attempts,
+                variables=variables,
+                next_step_id=next_step_id,
+            )
+
+    async def _run_step_with_retry(self, *, step: CompiledStep, step_index: int, **kwargs: Any) -> tuple[EngineStepResult, int]:
+        attempts = 0
+        event_base = {"step_id": step.step_id, "step_index": step_index, "agent_code": step.agent_code}
+        while True:
+            attempts += 1
+            self._emit("step_started", {**event_base, "attempt": attempts})
+            try:
+                result = await self._run_step(step=step, step_index=step_index, **kwargs)
+            except HTTPException as exc:
+                retryable = exc.status_code >= 500 and attempts <= self._step_retries
+                if not retryable:
+                    self._record_failure(step, step_index=step_index, attempts=attempts, error=str(exc.detail))
+                    self._emit("step_failed", {**event_base, "attempt": attempts, "error": str(exc.detail)})
+                    raise
+                delay_s = min(60.0, self._retry_backoff_s * (2 ** (attempts - 1)))
+                self._emit("step_retry", {**event_base, "attempt": attempts, "error": str(exc.detail), "delay_s": delay_s})
+                await asyncio.sleep(delay_s)
+                continue
+            except Exception as exc:
+                self._record_failure(step, step_index=step_index, attempts=attempts, error=str(exc))
+                self._emit("step_failed", {**event_base, "attempt": attempts, "error": str(exc)})
+                raise
+            self._emit(
+                "step_completed",
+                {
+                    **event_base,
+                    "attempt": attempts,
+                    "response": result.response,
+                    "model_used": result.model_used,
+                    "latency_ms": result.latency_ms,
+                    "items_total": result.items_total,
+                    "items_failed": result.items_failed,
+                    "cached": result.cached,
+                },
+            )
+            return result, attempts
+
+    def _emit(self, event: str, data: dict[str, Any]) -> None:
+        if self._on_event is None:
+            return
+        try:
+            self._on_event(event, data)
+        except Exception:
+            pass  # a listener must never fail the run
+
+    def _record_failure(self, step: CompiledStep, *, step_index: int, attempts: int, error: str) -> None:
+        if self._run_store is not None and self._workflow_id:
+            self._run_store.record_step_failure(
+                workflow_id=self._workflow_id,
+                step_index=step_index,
+                step_id=step.step_id,
+                agent_code=step.agent_code,
+                attempts=attempts,
+                error=error,
+            )
+
+    def step_dependencies(self, steps: list[dict[str, Any]]) -> dict[str, list[str]]:
+        """
+        Upstream step ids per step for parallel mode.
+
+        An explicit `depends_on` wins. Otherwise dependencies are inferred from the `{{var}}`
+        references in the step input: `{{previous_response}}` (also the implicit input) means
+        the step listed just before, `{{name}}` means the latest earlier step with
+        `set_var: name`, and `{{initial_message}}` or unknown names add no dependency.
+        """
+        order = [str(step.get("id") or "").strip() for step in steps]
+        dependencies: dict[str, list[str]] = {}
+        producers: dict[str, str] = {}
+        for index, step in enumerate(steps):
+            step_id = order[index]
+            declared = step.get("depends_on")
+            if declared is not None:
+                items = [declared] if isinstance(declared, str) else list(declared or [])
+                deps = [str(item).strip() for item in items if str(item).strip()]
+            else:
+                default_input = "{{item}}" if is_map_step(step) else "{{previous_response}}"
+                template = str(step.get("input") or step.get("message") or "").strip() or default_input
+                names = VAR_PATTERN.findall(template)
+                if is_map_step(step):
+                    names.append(str(step.get("map_over") or "").strip())
+                deps = []
+                for name in names:
+                    if name == "previous_response":
+                        upstream = order[index - 1] if index > 0 else ""
+                    else:
+                        upstream = producers.get(name, "")
+                    if upstream and upstream not in deps:
+                        deps.append(upstream)
+            dependencies[step_id] = deps
+            set_var = str(step.get("set_var") or "").strip()
+            if set_var:
+                producers[set_var] = step_id
+        return dependencies
+
+    async def _execute_parallel(
+        self,
+        *,
+        org_id: str,
+        session_id: str,
+        initial_message: str,
+        context: ExecuteContext,
+        plan: WorkflowPlan,
+        checkpoint: RunCheckpoint | None = None,
+    ) -> tuple[str, list[EngineStepResult]]:
+        """
+        Run steps as a DAG: each step starts as soon as its dependencies finish, up to the
+        workflow's concurrency cap. A step's `previous_response` is its dependencies' outputs
+        joined in definition order; the final response joins the outputs of the sink steps.
+        """
+        order = plan.order
+        dependencies = plan.dependencies
+        requested = int(plan.max_concurrency or settings.workflow_max_concurrency)
+        semaphore = asyncio.Semaphore(max(1, min(requested, int(settings.workflow_max_concurrency))))
+        variables: dict[str, Any] = {"initial_message": initial_message, "previous_response": initial_message}
+        waiting = {step_id: set(dependencies[step_id]) for step_id in order}
+        outputs: dict[str, str] = {}
+        finished: dict[str, EngineStepResult] = {}
+        running: dict[asyncio.Task, str] = {}
+        if checkpoint is not None:
+            variables.update(checkpoint.variables)
+            for row in checkpoint.completed_steps:
+                if str(row["step_id"]) in waiting:
+                    finished[str(row["step_id"])] = _step_from_row(row)
+                    outputs[str(row["step_id"])] = str(row["response"] or "")
+                    del waiting[str(row["step_id"])]
+            for pending in waiting.values():
+                pending.difference_update(finished)
+
+        async def run(step: CompiledStep, step_variables: dict[str, Any]) -> tuple[EngineStepResult, int]:
+            async with semaphore:
+                return await self._run_step_with_retry(
+                    step=step,
+                    step_index=step.index + 1,
+                    variables=step_variables,
+                    org_id=org_id,
+                    session_id=session_id,
+                    initial_message=initial_message,
+                    context=context,
                 )
-                .scalars()
-                .first()
+
+        try:
+            while waiting or running:
+                for step_id in [item for item in order if item in waiting and not waiting[item]]:
+                    del waiting[step_id]
+                    upstream = [outputs[dep] for dep in dependencies[step_id] if outputs.get(dep)]
+                    step_variables = {**variables, "previous_response": "\n\n".join(upstream) or initial_message}
+                    running[asyncio.create_task(run(plan.steps[plan.positions[step_id]], step_variables))] = step_id
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step_id = running.pop(task)
+                    step_result, attempts = task.result()
+                    finished[step_id] = step_result
+                    outputs[step_id] = step_result.response
+                    set_var = plan.steps[plan.positions[step_id]].set_var
+                    if set_var:
+                        variables[set_var] = step_result.response
+                    self._checkpoint(step_result, attempts=attempts, variables=variables, next_step_id=None)
+                    for pending in waiting.values():
+                        pending.discard(step_id)
+        except BaseException:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
+
+        sinks = [outputs[step_id] for step_id in plan.sinks if outputs.get(step_id)]
+        final_response = "\n\n".join(sinks) or initial_message
+        return final_response, [finished[step_id] for step_id in order if step_id in finished]
+
+    async def _run_step(
+        self,
+        *,
+        step: CompiledStep,
+        step_index: int,
+        variables: dict[str, Any],
+        org_id: str,
+        session_id: str,
+        initial_message: str,
+        context: ExecuteContext,
+    ) -> EngineStepResult:
+        step_id = step.step_id
+        agent_code = step.agent_code
+        action = str(step.config.get("action") or "").strip().lower()
+        action_config = dict(step.config.get("action_config") or {})
+        integration_id = str(step.config.get("integration_id") or "").strip()
+        agent = self._agents.get(agent_code)
+        if not agent:
+            raise HTTPException(status_code=404, detail=f"Agent not found in workflow step {step_index}: {agent_code}")
+        if agent_code not in self._hired_codes:
+            raise HTTPException(status_code=403, detail=f"Agent not hired for step {step_index}: {agent_code}")
+        if step.is_map:
+            return await self._run_map_step(
+                step=step,
+                step_index=step_index,
+                agent=agent,
+                variables=variables,
+                org_id=org_id,
+                session_id=session_id,
+                context=context,
+            )
+
+        input_message = step.input.render(variables).strip()
+        if not input_message:
+            input_message = str(variables.get("previous_response") or initial_message)
+
+        trace_id = str(uuid.uuid4())
+        if action in {"slack", "email", "webhook"}:
+            response_text = await self._execute_integration_action(
+                action=action,
+                integration_id=integration_id,
+                input_message=input_message,
+                action_config=action_config,
+                org_id=org_id,
+                step_id=step_id,
+                wait_for_ack=bool(step.config.get("wait_for_ack")),
             )
-            if not hired:
-                raise HTTPException(status_code=403, detail=f"Agent not hired for step {step_index}: {agent_code}")
-
-            input_template = str(step.get("input") or step.get("message") or "").strip()
-            if not input_template:
-                input_template = "{{previous_response}}"
-            input_message = self.resolve_variables(input_template, variables).strip()
-            if not input_message:
-                input_message = str(variables.get("previous_response") or initial_message)
-
-            trace_id = str(uuid.uuid4())
-            if action in {"slack", "email", "webhook"}:
-                response_text = await self._execute_integration_action(
-                    action=action,
-                    integration_id=integration_id,
-                    input_message=input_message,
-                    action_config=action_config,
+            result = {
+                "response": response_text,
+                "model_used": f"workflow/{action}",
+                "latency_ms": 0,
+                "tokens_used": 0,
+                "trace_id": trace_id,
+            }
+        else:
+            memo_key = self._memo_key(step, agent, org_id=org_id, context=context, user_input=input_message)
+            memoized = self._memo_get(memo_key)
+            if memoized is not None:
+                return self._memoized_result(step, step_index, input_message, memoized)
+            try:
+                result = await execute_via_litellm(
+                    provider=agent.llm_provider or "",
+                    model=agent.llm_model or "",
+                    system=self._system_prompt(agent),
+                    user=input_message,
+                    trace_id=trace_id,
+                    enable_search=bool(context.web_search),
+                    enable_docs=bool(context.doc_retrieval),
+                    org_id=org_id,
+                    session_id=session_id,
+                    agent_code=agent_code,
+                    on_token=self._token_forwarder(step_id, step_index),
                 )
-                result = {
+            except LLMError as exc:
+                raise HTTPException(status_code=503, detail=f"Workflow step {step_index} failed: {exc}") from exc
+            response_text = result.get("response") or result.get("content") or result.get("text") or ""
+            self._memo_put(
+                memo_key,
+                org_id=org_id,
+                agent_code=agent_code,
+                payload={
+                    "response": response_text,
+                    "model_used": result.get("model_used") or "",
+                    "trace_id": result.get("trace_id") or trace_id,
+                },
+            )
+
+        self._log_interactions(
+            [
+                {
+                    "org_id": org_id,
+                    "agent_code": agent_code,
+                    "session_id": session_id,
+                    "message": input_message,
                     "response": response_text,
-                    "model_used": f"workflow/{action}",
-                    "latency_ms": 0,
-                    "tokens_used": 0,
-                    "trace_id": trace_id,
+                    "model_used": result.get("model_used") or "",
+                    "latency_ms": int(result.get("latency_ms") or 0),
+                    "tokens_used": int(result.get("tokens_used") or 0),
+                    "quality_score": 0.85,
+                    "trace_id": result.get("trace_id") or trace_id,
                 }
-            else:
-                system_prompt = (agent.system_prompt or "").strip() or system_prompt_for_agent(agent_code)
-                system_prompt = inject_domain_block(system_prompt, agent)
+            ]
+        )
+        return EngineStepResult(
+            step_index=step_index,
+            step_id=step_id,
+            agent_code=agent_code,
+            input_message=input_message,
+            response=response_text,
+            model_used=result.get("model_used") or "",
+            latency_ms=int(result.get("latency_ms") or 0),
+            trace_id=result.get("trace_id") or trace_id,
+        )
+
+    def _resolve_agents(self, plan: WorkflowPlan, *, org_id: str) -> None:
+        """Load every agent the plan uses and the org's active hires in two queries, once per run."""
+        codes = [code for code in plan.agent_codes if code]
+        self._agents = {
+            agent.code: agent
+            for agent in self.db.execute(select(AgentCatalog).where(AgentCatalog.code.in_(codes))).scalars()
+        }
+        self._hired_codes = set(
+            self.db.execute(
+                select(HiredAgent.agent_code)
+                .where(HiredAgent.org_id == org_id)
+                .where(HiredAgent.agent_code.in_(codes))
+                .where(HiredAgent.status == "active")
+            ).scalars()
+        )
+        self._system_prompts = {}
+
+    def _system_prompt(self, agent: AgentCatalog) -> str:
+        prompt = self._system_prompts.get(agent.code)
+        if prompt is None:
+            prompt = (agent.system_prompt or "").strip() or system_prompt_for_agent(agent.code)
+            prompt = inject_domain_block(prompt, agent)
+            self._system_prompts[agent.code] = prompt
+        return prompt
+
+    def _memo_key(
+        self,
+        step: CompiledStep,
+        agent: AgentCatalog,
+        *,
+        org_id: str,
+        context: ExecuteContext,
+        user_input: str | list[str],
+    ) -> str | None:
+        if not step.memoize or self._memo_ttl_s <= 0:
+            return None
+        return step_memo_key(
+            org_id=org_id,
+            agent_code=step.agent_code,
+            provider=agent.llm_provider or "",
+            model=agent.llm_model or "",
+            system_prompt=self._system_prompt(agent),
+            user_input=user_input,
+            web_search=bool(context.web_search),
+            doc_retrieval=bool(context.doc_retrieval),
+        )
+
+    def _memo_get(self, memo_key: str | None) -> dict[str, Any] | None:
+        return StepMemoStore(self.db).get(memo_key) if memo_key else None
+
+    def _memo_put(self, memo_key: str | None, *, org_id: str, agent_code: str, payload: dict[str, Any]) -> None:
+        if memo_key:
+            StepMemoStore(self.db).put(memo_key, org_id=org_id, agent_code=agent_code, ttl_s=self._memo_ttl_s, payload=payload)
+
+    def _memoized_result(
+        self, step: CompiledStep, step_index: int, input_message: str, memoized: dict[str, Any]
+    ) -> EngineStepResult:
+        # No LLM call and no interaction log; live listeners get the output as one token.
+        response_text = str(memoized.get("response") or "")
+        forward = self._token_forwarder(step.step_id, step_index)
+        if forward is not None and response_text:
+            forward(response_text)
+        return EngineStepResult(
+            step_index=step_index,
+            step_id=step.step_id,
+            agent_code=step.agent_code,
+            input_message=input_message,
+            response=response_text,
+            model_used=str(memoized.get("model_used") or ""),
+            latency_ms=0,
+            trace_id=str(memoized.get("trace_id") or ""),
+            items_total=memoized.get("items_total"),
+            items_failed=memoized.get("items_failed"),
+            item_errors=list(memoized.get("item_errors") or []),
+            cached=True,
+        )
+
+    def _token_forwarder(self, step_id: str, step_index: int) -> Callable[[str], None] | None:
+        if self._on_event is None:
+            return None
+        return lambda token: self._emit("token", {"step_id": step_id, "step_index": step_index, "token": token})
+
+    async def _run_map_step(
+        self,
+        *,
+        step: CompiledStep,
+        step_index: int,
+        agent: AgentCatalog,
+        variables: dict[str, Any],
+        org_id: str,
+        session_id: str,
+        context: ExecuteContext,
+    ) -> EngineStepResult:
+        """
+        Apply the step's agent to every item of `map_over`, `{{item}}`/`{{item_index}}` in the input.
+
+        Items run concurrently under the step's cap and count against WORKFLOW_MAX_MAP_ITEMS,
+        not the step limit. A failed item leaves null at its position in the JSON array of
+        outputs; the step fails only when every item failed. Logs are written in one batch.
+        """
+        step_id = step.step_id
+        agent_code = step.agent_code
+        map_over = str(step.config.get("map_over") or "").strip()
+        items = parse_map_items(variables.get(map_over))
+        budget = max(0, int(settings.workflow_max_map_items))
+        if self._map_items_used + len(items) > budget:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Workflow step {step_index} maps {len(items)} items; exceeds map item budget ({budget})",
+            )
+        self._map_items_used += len(items)
+        system_prompt = self._system_prompt(agent)
+        messages = [
+            step.input.render({**variables, "item": item, "item_index": index}).strip() or item
+            for index, item in enumerate(items)
+        ]
+        map_label = f"map over {{{{{map_over}}}}} ({len(items)} items)"
+        memo_key = self._memo_key(step, agent, org_id=org_id, context=context, user_input=messages)
+        memoized = self._memo_get(memo_key)
+        if memoized is not None:
+            return self._memoized_result(step, step_index, map_label, memoized)
+        requested = int(step.config.get("max_concurrency") or settings.workflow_map_max_concurrency)
+        semaphore = asyncio.Semaphore(max(1, min(requested, int(settings.workflow_map_max_concurrency))))
+
+        async def run_item(message: str) -> tuple[str, dict[str, Any] | None, str | None]:
+            async with semaphore:
                 try:
                     result = await execute_via_litellm(
                         provider=agent.llm_provider or "",
                         model=agent.llm_model or "",
                         system=system_prompt,
-                        user=input_message,
-                        trace_id=trace_id,
+                        user=message,
+                        trace_id=str(uuid.uuid4()),
                         enable_search=bool(context.web_search),
                         enable_docs=bool(context.doc_retrieval),
                         org_id=org_id,
                         session_id=session_id,
                         agent_code=agent_code,
                     )
-                except LLMError as exc:
-                    raise HTTPException(status_code=503, detail=f"Workflow step {step_index} failed: {exc}") from exc
-                response_text = result.get("response") or result.get("content") or result.get("text") or ""
-            variables["previous_response"] = response_text
-            set_var = str(step.get("set_var") or "").strip()
-            if set_var:
-                variables[set_var] = response_text
-
-            self.db.execute(
-                text(
-                    """
-                    insert into interaction_logs
-                      (org_id, agent_code, session_id, message, response, model_used, latency_ms, tokens_used, quality_score, trace_id)
-                    values
-                      (:org_id, :agent_code, :session_id, :message, :response, :model_used, :latency_ms, :tokens_used, :quality_score, :trace_id);
-                    """
-                ),
+                except Exception as exc:
+                    return message, None, str(exc)[:500]
+            return message, result, None
+
+        outcomes = await asyncio.gather(*(run_item(message) for message in messages))
+        outputs: list[str | None] = []
+        errors: list[dict[str, Any]] = []
+        logs: list[dict[str, Any]] = []
+        model_used = ""
+        latency_ms = 0
+        for index, (message, result, error) in enumerate(outcomes):
+            if result is None:
+                outputs.append(None)
+                errors.append({"index": index, "item": items[index][:200], "error": error})
+                continue
+            response_text = result.get("response") or result.get("content") or result.get("text") or ""
+            outputs.append(response_text)
+            model_used = model_used or str(result.get("model_used") or "")
+            latency_ms = max(latency_ms, int(result.get("latency_ms") or 0))
+            logs.append(
                 {
                     "org_id": org_id,
                     "agent_code": agent_code,
                     "session_id": session_id,
-                    "message": input_message,
+                    "message": message,
                     "response": response_text,
                     "model_used": result.get("model_used") or "",
                     "latency_ms": int(result.get("latency_ms") or 0),
                     "tokens_used": int(result.get("tokens_used") or 0),
                     "quality_score": 0.85,
-                    "trace_id": result.get("trace_id") or trace_id,
-                },
-            )
-            self.db.commit()
-            results.append(
-                EngineStepResult(
-                    step_index=step_index,
-                    step_id=current_id,
-                    agent_code=agent_code,
-                    input_message=input_message,
-                    response=response_text,
-                    model_used=result.get("model_used") or "",
-                    latency_ms=int(result.get("latency_ms") or 0),
-                    trace_id=result.get("trace_id") or trace_id,
-                )
+                    "trace_id": result.get("trace_id") or "",
+                }
             )
-
-            conditions = step.get("conditions") or {}
-            cond_expr = ""
-            if isinstance(conditions, dict):
-                cond_expr = str(conditions.get("if") or "").strip()
-            condition_result = self.evaluate_condition(cond_expr, variables)
-            current_id = self.get_next_step(
-                current_step=step,
-                condition_result=condition_result,
-                order=order,
-                current_index=order.index(str(step["id"])),
+        if items and len(errors) == len(items):
+            raise HTTPException(status_code=503, detail=f"Workflow step {step_index} failed for all {len(items)} items: {errors[0]['error']}")
+        self._log_interactions(logs)
+        response_text = json.dumps(outputs, ensure_ascii=False)
+        if not errors:
+            # Partial failures are not memoized, so a later run retries the failed items.
+            self._memo_put(
+                memo_key,
+                org_id=org_id,
+                agent_code=agent_code,
+                payload={"response": response_text, "model_used": model_used, "items_total": len(items), "items_failed": 0},
             )
-
-        return str(variables.get("previous_response") or initial_message), results
+        return EngineStepResult(
+            step_index=step_index,
+            step_id=step_id,
+            agent_code=agent_code,
+            input_message=map_label,
+            response=response_text,
+            model_used=model_used,
+            latency_ms=latency_ms,
+            trace_id=str(uuid.uuid4()),
+            items_total=len(items),
+            items_failed=len(errors),
+            item_errors=errors,
+        )
+
+    def _log_interactions(self, rows: list[dict[str, Any]]) -> None:
+        if not rows:
+            return
+        # A list of parameter sets runs as one executemany batch.
+        self.db.execute(
+            text(
+                """
+                insert into interaction_logs
+                  (org_id, agent_code, session_id, message, response, model_used, latency_ms, tokens_used, quality_score, trace_id)
+                values
+                  (:org_id, :agent_code, :session_id, :message, :response, :model_used, :latency_ms, :tokens_used, :quality_score, :trace_id);
+                """
+            ),
+            rows,
+        )
+        self.db.commit()
 
     async def _execute_integration_action(
         self,
@@ -325,7 +853,14 @@ class WorkflowEngine:
         integration_id: str,
         input_message: str,
         action_config: dict[str, Any],
+        org_id: str,
+        step_id: str,
+        wait_for_ack: bool = False,
     ) -> str:
+        """
+        Validate the action and queue it on `outbound_deliveries`; the step moves on without
+        waiting for the third party unless it sets `wait_for_ack`.
+        """
         if not integration_id:
             raise HTTPException(status_code=400, detail=f"Workflow action '{action}' requires integration_id")
         row = self.db.execute(
@@ -345,50 +880,59 @@ class WorkflowEngine:
             raise HTTPException(status_code=409, detail=f"Integration inactive: {integration_id}")
         config = dict(row["config"] or {})
         integration_type = str(row["integration_type"]).strip().lower()
+        if action not in DELIVERY_CHANNELS:
+            raise HTTPException(status_code=400, detail=f"Unsupported workflow action: {action}")
+        if integration_type != action:
+            raise HTTPException(status_code=400, detail=f"Integration {integration_id} is not {action}")
 
+        # Only the message goes on the queue; credentials are read from the integration at send time.
         if action == "slack":
-            if integration_type != "slack":
-                raise HTTPException(status_code=400, detail=f"Integration {integration_id} is not slack")
-            webhook_url = str(config.get("webhook_url") or "")
             text_value = str(action_config.get("text") or input_message)
-            await slack_integration.post_message(webhook_url=webhook_url, text=text_value)
-            return f"Slack message sent ({len(text_value)} chars)"
-
-        if action == "email":
-            if integration_type != "email":
-                raise HTTPException(status_code=400, detail=f"Integration {integration_id} is not email")
-            smtp_host = str(config.get("smtp_host") or "")
-            smtp_port = int(config.get("smtp_port") or 587)
-            smtp_user = str(config.get("smtp_user") or "")
-            smtp_password = str(config.get("smtp_password") or "")
-            from_email = str(config.get("from_email") or smtp_user)
+            payload: dict[str, Any] = {"text": text_value}
+            sent = f"Slack message sent ({len(text_value)} chars)"
+        elif action == "email":
             to_email = str(action_config.get("to_email") or config.get("default_to") or "")
             if not to_email:
                 raise HTTPException(status_code=400, detail="Email workflow action requires to_email")
-            subject = str(action_config.get("subject") or "CreddyPens workflow notification")
-            body = str(action_config.get("body") or input_message)
-            await email_integration.send_email(
-                smtp_host=smtp_host,
-                smtp_port=smtp_port,
-                smtp_user=smtp_user,
-                smtp_password=smtp_password,
-                from_email=from_email,
-                to_email=to_email,
-                subject=subject,
-                body=body,
-                use_tls=bool(config.get("use_tls", True)),
-            )
-            return f"Email sent to {to_email}"
-
-        if action == "webhook":
-            if integration_type != "webhook":
-                raise HTTPException(status_code=400, detail=f"Integration {integration_id} is not webhook")
-            url = str(config.get("url") or "")
-            headers = dict(config.get("headers") or {})
+            payload = {
+                "to_email": to_email,
+                "subject": str(action_config.get("subject") or "CreddyPens workflow notification"),
+                "body": str(action_config.get("body") or input_message),
+            }
+            sent = f"Email sent to {to_email}"
+        else:
             body = action_config.get("payload")
             if not isinstance(body, dict):
                 body = {"message": input_message}
-            await webhook_integration.send_webhook(url=url, payload=body, headers={str(k): str(v) for k, v in headers.items()})
-            return f"Webhook posted to {url}"
-
-        raise HTTPException(status_code=400, detail=f"Unsupported workflow action: {action}")
+            payload = {"body": body}
+            sent = f"Webhook posted to {config.get('url') or ''}"
+
+        if not settings.outbound_delivery_enabled:
+            await send_delivery(action, config, payload, attempts=3)
+            return sent
+
+        delivery_id = OutboundDeliveryStore(self.db).enqueue(
+            org_id=org_id,
+            channel=action,
+            integration_id=integration_id,
+            destination=delivery_destination(action, config),
+            payload=payload,
+            workflow_id=self._workflow_id,
+            step_id=step_id,
+            # A retried or resumed step reuses its delivery instead of sending twice; a dead-lettered
+            # one is queued again.
+            idempotency_key=f"{self._workflow_id}:{step_id}" if self._workflow_id else None,
+        )
+        delivery_worker.wake()
+        if not wait_for_ack:
+            return f"{action.capitalize()} delivery queued ({delivery_id})"
+
+        delivery = await delivery_worker.wait_for(delivery_id, timeout_s=float(settings.outbound_delivery_ack_timeout_s))
+        status = str((delivery or {}).get("status") or "")
+        if status == "delivered":
+            return sent
+        if status == "dead":
+            raise HTTPException(
+                status_code=502, detail=f"Delivery {delivery_id} failed: {(delivery or {}).get('last_error') or 'unknown error'}"
+            )
+        raise HTTPException(status_code=504, detail=f"Delivery {delivery_id} not acknowledged in time (status: {status or 'unknown'})")
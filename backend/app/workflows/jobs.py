@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any
+
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app.db import SessionLocal
+from app.schemas_execute import ExecuteContext
+from app.settings import settings
+from app.workflows.engine import WorkflowEngine
+from app.workflows.plans import WorkflowPlan
+from app.workflows.runs import WorkflowRunStore
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = frozenset({"run_completed", "run_failed", "run_cancelled"})
+# How long a finished job's event history stays replayable for late SSE subscribers.
+_CHANNEL_RETENTION_S = 300.0
+_MAX_HISTORY_EVENTS = 2000
+
+
+class JobChannel:
+    """Fan-out of one job's events to SSE subscribers, with a bounded replay history."""
+
+    def __init__(self) -> None:
+        self.history: deque[dict[str, Any]] = deque(maxlen=_MAX_HISTORY_EVENTS)
+        self.subscribers: set[asyncio.Queue] = set()
+        self.seq = 0
+        self.closed = False
+
+    def publish(self, event: str, data: dict[str, Any]) -> None:
+        self.seq += 1
+        item = {"event": event, "seq": self.seq, "data": data}
+        self.history.append(item)
+        for queue in list(self.subscribers):
+            queue.put_nowait(item)
+        if event in TERMINAL_EVENTS:
+            self.closed = True
+
+    def subscribe(self) -> tuple[list[dict[str, Any]], asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self.subscribers.add(queue)
+        return list(self.history), queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+
+class WorkflowJobManager:
+    """
+    Runs workflows in the background so the HTTP request can return 202 immediately.
+
+    Jobs share a global concurrency cap (WORKFLOW_JOB_MAX_CONCURRENCY) and each uses its own
+    DB session. Progress is durable in workflow_runs / workflow_run_steps, so any worker can
+    answer status polls. Live events (step_started, step_completed, token, run_*) are published
+    on an in-process channel. Cancellation is local (task.cancel), or cross-worker through
+    `workflow_runs.cancel_requested`, which the owning worker polls.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._channels: dict[str, JobChannel] = {}
+        self._semaphore: tuple[asyncio.AbstractEventLoop, asyncio.Semaphore] | None = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore[0] is not loop:
+            self._semaphore = (loop, asyncio.Semaphore(max(1, int(settings.workflow_job_max_concurrency))))
+        return self._semaphore[1]
+
+    def channel(self, workflow_id: str) -> JobChannel | None:
+        return self._channels.get(workflow_id)
+
+    def is_running(self, workflow_id: str) -> bool:
+        task = self._tasks.get(workflow_id)
+        return task is not None and not task.done()
+
+    def submit(
+        self,
+        *,
+        workflow_id: str,
+        org_id: str,
+        session_id: str,
+        initial_message: str,
+        context: ExecuteContext,
+        workflow_definition: dict[str, Any],
+        plan: WorkflowPlan | None = None,
+        step_retries: int = 0,
+        retry_backoff_s: float = 1.0,
+        resume: bool = False,
+    ) -> None:
+        channel = JobChannel()
+        self._channels[workflow_id] = channel
+        channel.publish("run_queued", {"workflow_id": workflow_id})
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(
+            self._run(
+                workflow_id=workflow_id,
+                channel=channel,
+                org_id=org_id,
+                session_id=session_id,
+                initial_message=initial_message,
+                context=context,
+                workflow_definition=workflow_definition,
+                plan=plan,
+                step_retries=step_retries,
+                retry_backoff_s=retry_backoff_s,
+                resume=resume,
+            )
+        )
+        self._tasks[workflow_id] = task
+        watcher = loop.create_task(self._watch_cancel(workflow_id, task))
+
+        def _done(_: asyncio.Task) -> None:
+            watcher.cancel()
+            self._tasks.pop(workflow_id, None)
+            loop.call_later(_CHANNEL_RETENTION_S, self._drop_channel, workflow_id, channel)
+
+        task.add_done_callback(_done)
+
+    def _drop_channel(self, workflow_id: str, channel: JobChannel) -> None:
+        if self._channels.get(workflow_id) is channel:
+            self._channels.pop(workflow_id, None)
+
+    def cancel(self, workflow_id: str) -> bool:
+        """Cancel a job owned by this worker; safe to call from threadpool routes."""
+        task = self._tasks.get(workflow_id)
+        if task is None or task.done():
+            return False
+        task.get_loop().call_soon_threadsafe(task.cancel)
+        return True
+
+    async def shutdown(self) -> None:
+        # Cancelled runs stay resumable from their last checkpoint.
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _watch_cancel(self, workflow_id: str, task: asyncio.Task) -> None:
+        interval = max(0.5, float(settings.workflow_job_cancel_poll_s))
+        while not task.done():
+            await asyncio.sleep(interval)
+            try:
+                requested = await asyncio.to_thread(_cancel_requested, workflow_id)
+            except Exception as exc:
+                logger.warning("Cancel poll failed for workflow %s: %s", workflow_id, exc)
+                continue
+            if requested:
+                task.cancel()
+                return
+
+    async def _run(
+        self,
+        *,
+        workflow_id: str,
+        channel: JobChannel,
+        org_id: str,
+        session_id: str,
+        initial_message: str,
+        context: ExecuteContext,
+        workflow_definition: dict[str, Any],
+        plan: WorkflowPlan | None,
+        step_retries: int,
+        retry_backoff_s: float,
+        resume: bool,
+    ) -> None:
+        started = False
+        try:
+            async with self._get_semaphore():
+                with SessionLocal() as db:
+                    if not WorkflowRunStore(db).start_queued(workflow_id):
+                        channel.publish("run_cancelled", {"workflow_id": workflow_id})
+                        return
+                    started = True
+                    channel.publish("run_started", {"workflow_id": workflow_id})
+                    final_response, results = await WorkflowEngine(db).execute_workflow(
+                        org_id=org_id,
+                        session_id=session_id,
+                        initial_message=initial_message,
+                        context=context,
+                        workflow_definition=workflow_definition,
+                        plan=plan,
+                        workflow_id=workflow_id,
+                        resume=resume,
+                        step_retries=step_retries,
+                        retry_backoff_s=retry_backoff_s,
+                        on_event=channel.publish,
+                    )
+            channel.publish(
+                "run_completed",
+                {"workflow_id": workflow_id, "final_response": final_response, "steps_count": len(results)},
+            )
+        except asyncio.CancelledError:
+            if not started:
+                # Still queued: the engine never ran, so record the cancellation here.
+                await asyncio.to_thread(_finish_cancelled, workflow_id)
+            channel.publish("run_cancelled", {"workflow_id": workflow_id})
+        except HTTPException as exc:
+            channel.publish("run_failed", {"workflow_id": workflow_id, "status_code": exc.status_code, "error": str(exc.detail)})
+        except Exception as exc:
+            logger.error("Workflow job %s failed: %s", workflow_id, exc)
+            channel.publish("run_failed", {"workflow_id": workflow_id, "status_code": 500, "error": str(exc)})
+
+
+def _cancel_requested(workflow_id: str) -> bool:
+    with SessionLocal() as db:
+        value = db.execute(
+            text("select cancel_requested from workflow_runs where workflow_id = :workflow_id;"),
+            {"workflow_id": workflow_id},
+        ).scalar()
+    return bool(value)
+
+
+def _finish_cancelled(workflow_id: str) -> None:
+    with SessionLocal() as db:
+        WorkflowRunStore(db).finish_run(workflow_id, status="cancelled", error="Workflow cancelled")
+
+
+workflow_jobs = WorkflowJobManager()
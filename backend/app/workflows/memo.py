@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Expired rows are deleted on every Nth write instead of by a separate job.
+_SWEEP_EVERY = 200
+
+
+def step_memo_key(
+    *,
+    org_id: str,
+    agent_code: str,
+    provider: str,
+    model: str,
+    system_prompt: str,
+    user_input: str | list[str],
+    web_search: bool,
+    doc_retrieval: bool,
+) -> str:
+    """
+    Memo key of a workflow step: who runs it (org, agent, model), the compiled system prompt
+    and the fully resolved input. Tool flags are part of the key since they change the answer.
+    """
+    payload = json.dumps(
+        [org_id, agent_code, provider, model, system_prompt, user_input, bool(web_search), bool(doc_retrieval)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StepMemoStore:
+    """
+    Memoized workflow step outputs in `workflow_step_memo`.
+
+    Only agent steps of workflows that opt in (`memoize_ttl_s` on the definition) are stored;
+    integration actions always run. Entries expire after the workflow's TTL.
+    """
+
+    _writes = 0
+
+    def __init__(self, db: Session) -> None:
+        self.db = db
+
+    def get(self, cache_key: str) -> dict[str, Any] | None:
+        row = self.db.execute(
+            text(
+                """
+                update workflow_step_memo
+                set hits = hits + 1, last_hit_at = now()
+                where cache_key = :cache_key and expires_at > now()
+                returning payload;
+                """
+            ),
+            {"cache_key": cache_key},
+        ).first()
+        self.db.commit()
+        return dict(row[0] or {}) if row else None
+
+    def put(self, cache_key: str, *, org_id: str, agent_code: str, ttl_s: int, payload: dict[str, Any]) -> None:
+        self.db.execute(
+            text(
+                """
+                insert into workflow_step_memo (cache_key, org_id, agent_code, payload, created_at, expires_at)
+                values (:cache_key, :org_id, :agent_code, cast(:payload as jsonb), now(), now() + make_interval(secs => :ttl_s))
+                on conflict (cache_key) do update set
+                  payload = excluded.payload,
+                  created_at = excluded.created_at,
+                  expires_at = excluded.expires_at;
+                """
+            ),
+            {
+                "cache_key": cache_key,
+                "org_id": org_id,
+                "agent_code": agent_code,
+                "payload": json.dumps(payload, ensure_ascii=False),
+                "ttl_s": int(ttl_s),
+            },
+        )
+        StepMemoStore._writes += 1
+        if StepMemoStore._writes % _SWEEP_EVERY == 0:
+            self.db.execute(text("delete from workflow_step_memo where expires_at < now();"))
+        self.db.commit()
@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import ast
+import copy
+import json
+import operator
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Mapping
+
+VAR_PATTERN = re.compile(r"\{\{([a-zA-Z_][a-zA-Z0-9_]*)\}\}")
+# `{{var}}` references are swapped for these identifiers before a condition is parsed once.
+_PLACEHOLDER = "__wfvar{}__"
+_PLACEHOLDER_PATTERN = re.compile(r"__wfvar(\d+)__")
+# Substituted text that would change how the enclosing string literal parses.
+_UNSAFE_IN_STRING = re.compile(r"[\"'\\\n\r]")
+_MAX_PLANS = 512
+
+_OPS: dict[type, Callable[..., Any]] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda x, y: x in y,
+    ast.NotIn: lambda x, y: x not in y,
+    ast.Not: operator.not_,
+}
+
+
+def execution_mode(definition: Mapping[str, Any]) -> str:
+    return str(definition.get("execution_mode") or "sequential").strip().lower()
+
+
+def is_map_step(step: Mapping[str, Any]) -> bool:
+    return str(step.get("type") or "").strip().lower() == "map"
+
+
+class _NeedsTextualEvaluation(Exception):
+    """A variable's value cannot be bound into the pre-parsed tree without changing its meaning."""
+
+
+@lru_cache(maxsize=2048)
+def _parse_expression(source: str) -> ast.Expression:
+    return ast.parse(source, mode="eval")
+
+
+def _eval_node(node: ast.AST, bind: Callable[[str], Any] | None = None) -> Any:
+    """
+    Evaluate a condition tree restricted to literals, comparisons and boolean logic.
+
+    No calls, attribute access or subscripts; bare names evaluate to their own text (after
+    True/False/None). `bind` resolves variable placeholders in pre-parsed conditions.
+    """
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body, bind)
+    if isinstance(node, ast.Constant):
+        if bind is not None and isinstance(node.value, str) and _PLACEHOLDER_PATTERN.search(node.value):
+            return _PLACEHOLDER_PATTERN.sub(lambda match: bind(match.group(0)), node.value)
+        return node.value
+    if isinstance(node, ast.Compare):
+        left = _eval_node(node.left, bind)
+        for op, right_node in zip(node.ops, node.comparators):
+            right = _eval_node(right_node, bind)
+            if not _OPS[type(op)](left, right):
+                return False
+            left = right
+        return True
+    if isinstance(node, ast.BoolOp):
+        values = [_eval_node(value, bind) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return all(values)
+        return any(values)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPS:
+        return _OPS[type(node.op)](_eval_node(node.operand, bind))
+    if isinstance(node, ast.Name):
+        if bind is not None and _PLACEHOLDER_PATTERN.fullmatch(node.id):
+            return _bare_value(bind(node.id))
+        if node.id == "True":
+            return True
+        if node.id == "False":
+            return False
+        if node.id == "None":
+            return None
+        return node.id
+    raise ValueError(f"Unsafe or unsupported operation: {type(node)}")
+
+
+def _bare_value(text_value: str) -> Any:
+    # An unquoted `{{var}}` is spliced in as source text, so `7` compares as a number and
+    # `approved` as a name. Anything beyond a single atom re-parses the whole condition.
+    try:
+        body = _parse_expression(text_value).body
+    except SyntaxError:
+        raise _NeedsTextualEvaluation from None
+    if isinstance(body, (ast.Constant, ast.Name)) or (
+        isinstance(body, ast.UnaryOp) and isinstance(body.operand, ast.Constant)
+    ):
+        return _eval_node(body)
+    raise _NeedsTextualEvaluation
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """A `{{var}}` template split once into literal text and variable names."""
+
+    source: str
+    parts: tuple[tuple[str, str | None], ...]
+
+    @classmethod
+    def parse(cls, source: str) -> "CompiledTemplate":
+        parts: list[tuple[str, str | None]] = []
+        position = 0
+        for match in VAR_PATTERN.finditer(source):
+            parts.append((source[position : match.start()], match.group(1)))
+            position = match.end()
+        parts.append((source[position:], None))
+        return cls(source=source, parts=tuple(parts))
+
+    @property
+    def names(self) -> tuple[str, ...]:
+        return tuple(name for _, name in self.parts if name)
+
+    def render(self, variables: Mapping[str, Any]) -> str:
+        return "".join(literal + (str(variables.get(name, "")) if name else "") for literal, name in self.parts)
+
+
+@dataclass(frozen=True)
+class CompiledCondition:
+    """
+    A step's `conditions.if` expression, parsed once with its `{{var}}` references as placeholders.
+
+    Evaluation gives the same result as substituting the variables into the text and parsing
+    it: values are bound into the cached tree when that is equivalent, and the rare value that
+    would change the parse (quotes inside a string literal, an operator in a bare reference)
+    falls back to parsing the substituted text. Unsupported or invalid expressions are False.
+    """
+
+    source: str
+    template: CompiledTemplate
+    tree: ast.Expression | None
+    names: tuple[str, ...]
+
+    @classmethod
+    def parse(cls, source: str) -> "CompiledCondition":
+        expression = (source or "").strip()
+        template = CompiledTemplate.parse(expression)
+        names: list[str] = []
+
+        def placeholder(match: re.Match[str]) -> str:
+            names.append(match.group(1))
+            return _PLACEHOLDER.format(len(names) - 1)
+
+        tree: ast.Expression | None
+        try:
+            tree = ast.parse(VAR_PATTERN.sub(placeholder, expression), mode="eval") if expression else None
+        except SyntaxError:
+            tree = None
+        if tree is not None and not _placeholders_bindable(tree):
+            tree = None
+        return cls(source=expression, template=template, tree=tree, names=tuple(names))
+
+    def evaluate(self, variables: Mapping[str, Any]) -> bool:
+        if not self.source:
+            return True
+        try:
+            if self.tree is not None:
+                try:
+                    return bool(_eval_node(self.tree, self._binder(variables)))
+                except _NeedsTextualEvaluation:
+                    pass
+            return bool(_eval_node(_parse_expression(self.template.render(variables))))
+        except Exception:
+            return False
+
+    def _binder(self, variables: Mapping[str, Any]) -> Callable[[str], str]:
+        def bind(token: str) -> str:
+            match = _PLACEHOLDER_PATTERN.fullmatch(token)
+            value = str(variables.get(self.names[int(match.group(1))], "")) if match else ""
+            if _UNSAFE_IN_STRING.search(value):
+                raise _NeedsTextualEvaluation
+            return value
+
+        return bind
+
+
+def _placeholders_bindable(tree: ast.AST) -> bool:
+    # Placeholders must stand alone as a name or sit inside a string literal; anywhere else
+    # (glued to other identifiers, in attributes, ...) only textual substitution is faithful.
+    allowed: set[int] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and _PLACEHOLDER_PATTERN.fullmatch(node.id):
+            allowed.add(id(node))
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            allowed.add(id(node))
+    for node in ast.walk(tree):
+        if id(node) in allowed:
+            continue
+        for value in vars(node).values():
+            if isinstance(value, str) and _PLACEHOLDER_PATTERN.search(value):
+                return False
+    return True
+
+
+@dataclass(frozen=True)
+class CompiledStep:
+    index: int
+    step_id: str
+    agent_code: str
+    is_map: bool
+    set_var: str
+    input: CompiledTemplate
+    condition: CompiledCondition
+    # Agent steps of a workflow with memoize_ttl_s, unless the step sets `memoize: false`.
+    memoize: bool
+    # The step as defined, read-only; action/map settings are read from here.
+    config: Mapping[str, Any]
+
+
+@dataclass(frozen=True)
+class WorkflowPlan:
+    """
+    A validated workflow definition compiled for execution.
+
+    Holds everything the engine otherwise re-derives per step: the id → position map, parsed
+    conditions, tokenized input templates, the dependency graph and the agents the run needs.
+    Plans are immutable, so one plan is shared by every run of a template version.
+    """
+
+    execution_mode: str
+    start_step_id: str
+    order: tuple[str, ...]
+    steps: tuple[CompiledStep, ...]
+    positions: Mapping[str, int]
+    dependencies: Mapping[str, tuple[str, ...]]
+    sinks: tuple[str, ...]
+    agent_codes: tuple[str, ...]
+    max_concurrency: int | None
+    memoize_ttl_s: int
+    definition_json: str
+
+    def step(self, step_id: str | None) -> CompiledStep | None:
+        position = self.positions.get(step_id or "")
+        return self.steps[position] if position is not None else None
+
+    def definition(self) -> dict[str, Any]:
+        return json.loads(self.definition_json)
+
+
+def build_plan(definition: dict[str, Any], *, dependencies: dict[str, list[str]]) -> WorkflowPlan:
+    """Compile an already validated definition; see `WorkflowEngine.compile_plan`."""
+    memoize_ttl_s = max(0, int(definition.get("memoize_ttl_s") or 0))
+    steps: list[CompiledStep] = []
+    for index, raw in enumerate(definition["steps"]):
+        config = copy.deepcopy(raw)
+        is_map = is_map_step(config)
+        default_input = "{{item}}" if is_map else "{{previous_response}}"
+        conditions = config.get("conditions") if isinstance(config.get("conditions"), dict) else {}
+        steps.append(
+            CompiledStep(
+                index=index,
+                step_id=str(config["id"]),
+                agent_code=str(config.get("agent_code") or "").strip(),
+                is_map=is_map,
+                set_var=str(config.get("set_var") or "").strip(),
+                input=CompiledTemplate.parse(str(config.get("input") or config.get("message") or "").strip() or default_input),
+                condition=CompiledCondition.parse(str(conditions.get("if") or "")),
+                memoize=bool(memoize_ttl_s and config.get("memoize", True) and not str(config.get("action") or "").strip()),
+                config=MappingProxyType(config),
+            )
+        )
+    order = tuple(step.step_id for step in steps)
+    upstream = {dep for deps in dependencies.values() for dep in deps}
+    max_concurrency = definition.get("max_concurrency")
+    return WorkflowPlan(
+        execution_mode=execution_mode(definition),
+        start_step_id=str(definition.get("start_step_id") or order[0]),
+        order=order,
+        steps=tuple(steps),
+        positions=MappingProxyType({step_id: index for index, step_id in enumerate(order)}),
+        dependencies=MappingProxyType({step_id: tuple(deps) for step_id, deps in dependencies.items()}),
+        sinks=tuple(step_id for step_id in order if step_id not in upstream),
+        agent_codes=tuple(dict.fromkeys(step.agent_code for step in steps)),
+        max_concurrency=int(max_concurrency) if max_concurrency else None,
+        memoize_ttl_s=memoize_ttl_s,
+        definition_json=json.dumps(definition),
+    )
+
+
+class WorkflowPlanCache:
+    """Compiled plans per template, replaced when the template's `updated_at` changes."""
+
+    def __init__(self, max_entries: int = _MAX_PLANS) -> None:
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._plans: dict[str, tuple[str, WorkflowPlan]] = {}
+
+    def get_or_compile(
+        self, template_id: str, updated_at: datetime | str | None, compile_plan: Callable[[], WorkflowPlan]
+    ) -> WorkflowPlan:
+        version = updated_at.isoformat() if isinstance(updated_at, datetime) else str(updated_at or "")
+        with self._lock:
+            cached = self._plans.get(template_id)
+            if cached is not None and cached[0] == version:
+                self._plans[template_id] = self._plans.pop(template_id)  # most recently used last
+                return cached[1]
+        # Compiled outside the lock; a racing compile of the same version is harmless.
+        plan = compile_plan()
+        with self._lock:
+            self._plans.pop(template_id, None)
+            self._plans[template_id] = (version, plan)
+            while len(self._plans) > self._max_entries:
+                self._plans.pop(next(iter(self._plans)))
+        return plan
+
+    def invalidate(self, template_id: str) -> None:
+        with self._lock:
+            self._plans.pop(template_id, None)
+
+
+workflow_plan_cache = WorkflowPlanCache()
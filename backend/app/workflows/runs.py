@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+@dataclass
+class RunCheckpoint:
+    """Saved progress of a run: variables, the next sequential step and finished step rows."""
+
+    variables: dict[str, Any]
+    current_step_id: str | None
+    completed_steps: list[dict[str, Any]] = field(default_factory=list)
+
+
+def _step_extras(step: Any) -> dict[str, Any]:
+    extras: dict[str, Any] = {}
+    if step.items_total is not None:
+        extras.update(items_total=step.items_total, items_failed=step.items_failed, item_errors=step.item_errors)
+    if step.cached:
+        extras["cached"] = True
+    return extras
+
+
+class WorkflowRunStore:
+    """
+    Durable state of workflow runs in `workflow_runs` / `workflow_run_steps`.
+
+    The run row is written before the first step and updated after every step with the
+    variable state and the next step to run, so a failed or interrupted run can resume from
+    its first unfinished step instead of paying for the finished ones again.
+    """
+
+    def __init__(self, db: Session) -> None:
+        self.db = db
+
+    def create_run(
+        self,
+        *,
+        workflow_id: str,
+        org_id: str,
+        session_id: str,
+        initial_message: str,
+        context: dict[str, Any],
+        workflow_definition: dict[str, Any],
+        template_id: str | None = None,
+        schedule_id: str | None = None,
+        status: str = "running",
+    ) -> None:
+        self.db.execute(
+            text(
+                """
+                insert into workflow_runs
+                  (workflow_id, org_id, template_id, schedule_id, session_id, status, initial_message,
+                   context, workflow_definition, variables, started_at, updated_at)
+                values
+                  (:workflow_id, :org_id, cast(:template_id as uuid), cast(:schedule_id as uuid), :session_id, :status,
+                   :initial_message, cast(:context as jsonb), cast(:workflow_definition as jsonb), '{}'::jsonb, now(), now());
+                """
+            ),
+            {
+                "workflow_id": workflow_id,
+                "org_id": org_id,
+                "template_id": template_id,
+                "schedule_id": schedule_id,
+                "session_id": session_id,
+                "initial_message": initial_message,
+                "context": json.dumps(context),
+                "workflow_definition": json.dumps(workflow_definition),
+                "status": status,
+            },
+        )
+        self.db.commit()
+
+    def get_run(self, workflow_id: str, *, org_id: str | None = None) -> dict[str, Any] | None:
+        row = self.db.execute(
+            text(
+                """
+                select workflow_id, org_id, template_id, schedule_id, session_id, status, initial_message, final_response,
+                       context, workflow_definition, variables, current_step_id, steps_count, error_message,
+                       started_at, updated_at, completed_at
+                from workflow_runs
+                where workflow_id = :workflow_id
+                  and (cast(:org_id as text) is null or org_id = :org_id)
+                limit 1;
+                """
+            ),
+            {"workflow_id": workflow_id, "org_id": org_id},
+        ).mappings().first()
+        return dict(row) if row else None
+
+    def list_steps(self, workflow_id: str) -> list[dict[str, Any]]:
+        rows = self.db.execute(
+            text(
+                """
+                select step_index, step_id, agent_code, status, attempts, input_message, response, model_used,
+                       latency_ms, trace_id, result, error_message, started_at, completed_at
+                from workflow_run_steps
+                where workflow_id = :workflow_id
+                order by step_index;
+                """
+            ),
+            {"workflow_id": workflow_id},
+        ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def load_checkpoint(self, workflow_id: str) -> RunCheckpoint | None:
+        run = self.get_run(workflow_id)
+        if run is None:
+            return None
+        return RunCheckpoint(
+            variables=dict(run["variables"] or {}),
+            current_step_id=run["current_step_id"],
+            completed_steps=[row for row in self.list_steps(workflow_id) if row["status"] == "completed"],
+        )
+
+    def mark_running(self, workflow_id: str, *, status: str = "running") -> bool:
+        """Claim a failed/cancelled run for resumption; False if it is running or already done."""
+        row = self.db.execute(
+            text(
+                """
+                update workflow_runs
+                set status = :status, error_message = null, cancel_requested = false, updated_at = now()
+                where workflow_id = :workflow_id and status in ('failed', 'cancelled')
+                returning workflow_id;
+                """
+            ),
+            {"workflow_id": workflow_id, "status": status},
+        ).first()
+        self.db.commit()
+        return row is not None
+
+    def start_queued(self, workflow_id: str) -> bool:
+        """Move a queued background run to running; False if it was cancelled while queued."""
+        row = self.db.execute(
+            text(
+                """
+                update workflow_runs
+                set status = 'running', updated_at = now()
+                where workflow_id = :workflow_id and status = 'queued' and not cancel_requested
+                returning workflow_id;
+                """
+            ),
+            {"workflow_id": workflow_id},
+        ).first()
+        self.db.commit()
+        return row is not None
+
+    def request_cancel(self, workflow_id: str) -> str | None:
+        """Flag a queued/running run for cancellation by whichever worker owns it; returns its status."""
+        row = self.db.execute(
+            text(
+                """
+                update workflow_runs
+                set cancel_requested = true, updated_at = now()
+                where workflow_id = :workflow_id and status in ('queued', 'running')
+                returning status;
+                """
+            ),
+            {"workflow_id": workflow_id},
+        ).first()
+        self.db.commit()
+        return str(row[0]) if row else None
+
+    def record_step(
+        self,
+        *,
+        workflow_id: str,
+        step: Any,
+        attempts: int,
+        variables: dict[str, Any],
+        next_step_id: str | None,
+    ) -> None:
+        """Persist a finished step together with the run's variables and next step, in one commit."""
+        self._upsert_step(
+            workflow_id=workflow_id,
+            step_index=step.step_index,
+            step_id=step.step_id,
+            agent_code=step.agent_code,
+            status="completed",
+            attempts=attempts,
+            values={
+                "input_message": step.input_message,
+                "response": step.response,
+                "model_used": step.model_used,
+                "latency_ms": step.latency_ms,
+                "trace_id": step.trace_id,
+                "result": json.dumps(_step_extras(step)),
+                "error_message": None,
+            },
+        )
+        self.db.execute(
+            text(
+                """
+                update workflow_runs
+                set variables = cast(:variables as jsonb),
+                    current_step_id = :next_step_id,
+                    steps_count = (select count(*) from workflow_run_steps where workflow_id = :workflow_id and status = 'completed'),
+                    updated_at = now()
+                where workflow_id = :workflow_id;
+                """
+            ),
+            {"workflow_id": workflow_id, "variables": json.dumps(variables, default=str), "next_step_id": next_step_id},
+        )
+        self.db.commit()
+
+    def record_step_failure(
+        self,
+        *,
+        workflow_id: str,
+        step_index: int,
+        step_id: str,
+        agent_code: str,
+        attempts: int,
+        error: str,
+    ) -> None:
+        self._upsert_step(
+            workflow_id=workflow_id,
+            step_index=step_index,
+            step_id=step_id,
+            agent_code=agent_code,
+            status="failed",
+            attempts=attempts,
+            values={
+                "input_message": "",
+                "response": "",
+                "model_used": "",
+                "latency_ms": 0,
+                "trace_id": "",
+                "result": "{}",
+                "error_message": error[:2000],
+            },
+        )
+        self.db.commit()
+
+    def finish_run(self, workflow_id: str, *, status: str, final_response: str = "", error: str | None = None) -> None:
+        self.db.execute(
+            text(
+                """
+                update workflow_runs
+                set status = :status,
+                    final_response = :final_response,
+                    error_message = :error,
+                    current_step_id = case when :status = 'completed' then null else current_step_id end,
+                    completed_at = case when :status = 'completed' then now() else completed_at end,
+                    updated_at = now()
+                where workflow_id = :workflow_id;
+                """
+            ),
+            {"workflow_id": workflow_id, "status": status, "final_response": final_response, "error": (error or None) and error[:2000]},
+        )
+        self.db.commit()
+
+    def _upsert_step(
+        self,
+        *,
+        workflow_id: str,
+        step_index: int,
+        step_id: str,
+        agent_code: str,
+        status: str,
+        attempts: int,
+        values: dict[str, Any],
+    ) -> None:
+        self.db.execute(
+            text(
+                """
+                insert into workflow_run_steps
+                  (workflow_id, step_index, step_id, agent_code, status, attempts, input_message, response, model_used,
+                   latency_ms, trace_id, result, error_message, started_at, completed_at)
+                values
+                  (:workflow_id, :step_index, :step_id, :agent_code, :status, :attempts, :input_message, :response, :model_used,
+                   :latency_ms, :trace_id, cast(:result as jsonb), :error_message, now(),
+                   case when :status = 'completed' then now() else null end)
+                on conflict (workflow_id, step_index) do update set
+                  step_id = excluded.step_id,
+                  agent_code = excluded.agent_code,
+                  status = excluded.status,
+                  attempts = workflow_run_steps.attempts + excluded.attempts,
+                  input_message = excluded.input_message,
+                  response = excluded.response,
+                  model_used = excluded.model_used,
+                  latency_ms = excluded.latency_ms,
+                  trace_id = excluded.trace_id,
+                  result = excluded.result,
+                  error_message = excluded.error_message,
+                  completed_at = excluded.completed_at;
+                """
+            ),
+            {
+                "workflow_id": workflow_id,
+                "step_index": int(step_index),
+                "step_id": step_id,
+                "agent_code": agent_code,
+                "status": status,
+                "attempts": int(attempts),
+                **values,
+            },
+        )
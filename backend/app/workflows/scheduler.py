@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.settings import settings
+
+try:
+    from croniter import croniter
+except Exception:  # pragma: no cover
+    croniter = None
+
+logger = logging.getLogger(__name__)
+
+# Runs still going at shutdown get this long before they are cancelled and handed back.
+_SHUTDOWN_GRACE_S = 30.0
+
+ScheduleRunner = Callable[..., Awaitable[Any]]
+
+
+def schedule_zone(tz_name: str | None) -> ZoneInfo | None:
+    try:
+        return ZoneInfo((tz_name or "UTC").strip() or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def next_run_at(cron_expression: str, tz_name: str = "UTC", *, base: datetime | None = None) -> datetime | None:
+    """
+    Next fire time of `cron_expression` evaluated in the schedule's timezone, returned in UTC.
+
+    "0 9 * * *" in Europe/Paris fires at 09:00 Paris time across DST changes; unknown zones
+    fall back to UTC.
+    """
+    if not croniter:
+        return None
+    zone = schedule_zone(tz_name) or timezone.utc
+    base_utc = (base or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    # croniter steps aware datetimes in absolute time, which drifts by the DST offset; walk the
+    # naive wall clock instead and attach the zone to each candidate.
+    try:
+        it = croniter(cron_expression, base_utc.astimezone(zone).replace(tzinfo=None))
+        for _ in range(4):
+            wall = it.get_next(datetime)
+            # A wall time repeated when clocks go back: take the first occurrence still ahead.
+            for fold in (0, 1):
+                candidate = wall.replace(tzinfo=zone, fold=fold).astimezone(timezone.utc)
+                if candidate > base_utc:
+                    return candidate
+    except Exception:
+        return None
+    return None
+
+
+class ScheduleLeases:
+    """
+    Leases on `workflow_schedules` rows so each due schedule is run by exactly one caller.
+
+    A claim stamps `lease_owner` / `lease_expires_at`; rows with a live lease are invisible to
+    other claimers. The owner renews the lease while the run is in progress and releases it
+    when done, advancing `next_run_at`. If the owner dies, the lease expires and another
+    worker picks the schedule up again.
+    """
+
+    def __init__(self, db: Session) -> None:
+        self.db = db
+
+    def claim_due(
+        self,
+        *,
+        owner: str,
+        limit: int,
+        lease_s: float,
+        global_cap: int,
+        org_id: str | None = None,
+    ) -> list[dict[str, Any]]:
+        # The advisory lock serializes claimers for the duration of this transaction only, so
+        # counting live leases against the cluster-wide cap is race-free; SKIP LOCKED keeps
+        # claims from blocking on rows a manual run is updating.
+        self.db.execute(text("select pg_advisory_xact_lock(hashtext('workflow_schedules_claim'));"))
+        active = int(
+            self.db.execute(
+                text("select count(*) from workflow_schedules where lease_expires_at > now();")
+            ).scalar()
+            or 0
+        )
+        available = min(int(limit), int(global_cap) - active)
+        if available <= 0:
+            self.db.commit()
+            return []
+        rows = self.db.execute(
+            text(
+                """
+                with due as (
+                  select schedule_id
+                  from workflow_schedules
+                  where is_active = true
+                    and next_run_at is not null
+                    and next_run_at <= now()
+                    and (lease_expires_at is null or lease_expires_at <= now())
+                    and (cast(:org_id as text) is null or org_id = :org_id)
+                  order by next_run_at asc
+                  limit :limit
+                  for update skip locked
+                )
+                update workflow_schedules ws
+                set lease_owner = :owner,
+                    lease_expires_at = now() + make_interval(secs => :lease_s),
+                    updated_at = now()
+                from due
+                where ws.schedule_id = due.schedule_id
+                returning ws.schedule_id, ws.org_id, ws.next_run_at;
+                """
+            ),
+            {"owner": owner, "lease_s": float(lease_s), "limit": available, "org_id": org_id},
+        ).mappings().all()
+        self.db.commit()
+        return [dict(row) for row in rows]
+
+    def claim(self, schedule_id: str, *, org_id: str, owner: str, lease_s: float) -> bool:
+        """Lease one schedule regardless of its due time (manual runs); False if it is already leased."""
+        row = self.db.execute(
+            text(
+                """
+                update workflow_schedules
+                set lease_owner = :owner,
+                    lease_expires_at = now() + make_interval(secs => :lease_s),
+                    updated_at = now()
+                where schedule_id = cast(:schedule_id as uuid)
+                  and org_id = :org_id
+                  and (lease_expires_at is null or lease_expires_at <= now())
+                returning schedule_id;
+                """
+            ),
+            {"schedule_id": schedule_id, "org_id": org_id, "owner": owner, "lease_s": float(lease_s)},
+        ).first()
+        self.db.commit()
+        return row is not None
+
+    def hold(self, schedule_id: str, *, owner: str, lease_s: float) -> bool:
+        """Extend a live lease `owner` still holds; False if it expired or another caller took it."""
+        row = self.db.execute(
+            text(
+                """
+                update workflow_schedules
+                set lease_expires_at = now() + make_interval(secs => :lease_s)
+                where schedule_id = cast(:schedule_id as uuid)
+                  and lease_owner = :owner
+                  and lease_expires_at > now()
+                returning schedule_id;
+                """
+            ),
+            {"schedule_id": schedule_id, "owner": owner, "lease_s": float(lease_s)},
+        ).first()
+        self.db.commit()
+        return row is not None
+
+    def renew(self, schedule_ids: list[str], *, owner: str, lease_s: float) -> None:
+        if not schedule_ids:
+            return
+        self.db.execute(
+            text(
+                """
+                update workflow_schedules
+                set lease_expires_at = now() + make_interval(secs => :lease_s)
+                where schedule_id = any(cast(:schedule_ids as uuid[])) and lease_owner = :owner;
+                """
+            ),
+            {"schedule_ids": schedule_ids, "owner": owner, "lease_s": float(lease_s)},
+        )
+        self.db.commit()
+
+    def release(
+        self,
+        schedule_id: str,
+        *,
+        owner: str,
+        last_run_at: datetime | None = None,
+        next_run_at: datetime | None = None,
+        advance: bool = True,
+    ) -> None:
+        """Drop the lease; with `advance`, record the run and move `next_run_at` forward."""
+        self.db.execute(
+            text(
+                """
+                update workflow_schedules
+                set last_run_at = case when :advance then :last_run_at else last_run_at end,
+                    next_run_at = case when :advance then :next_run_at else next_run_at end,
+                    lease_owner = null,
+                    lease_expires_at = null,
+                    updated_at = now()
+                where schedule_id = cast(:schedule_id as uuid) and lease_owner = :owner;
+                """
+            ),
+            {
+                "schedule_id": schedule_id,
+                "owner": owner,
+                "advance": advance,
+                "last_run_at": last_run_at,
+                "next_run_at": next_run_at,
+            },
+        )
+        self.db.commit()
+
+
+def lease_seconds() -> float:
+    return max(30.0, float(settings.workflow_scheduler_lease_s))
+
+
+def _renew_leases(schedule_ids: list[str], owner: str, lease_s: float) -> None:
+    with SessionLocal() as db:
+        ScheduleLeases(db).renew(schedule_ids, owner=owner, lease_s=lease_s)
+
+
+@asynccontextmanager
+async def renewing_leases(schedule_ids: list[str], *, owner: str) -> AsyncIterator[None]:
+    """
+    Keep `owner`'s leases on `schedule_ids` alive while the block runs, for runs started
+    outside the scheduler loop. Released leases are no longer `owner`'s, so renewing them is a no-op.
+    """
+    lease_s = lease_seconds()
+
+    async def heartbeat() -> None:
+        while True:
+            await asyncio.sleep(lease_s / 3)
+            try:
+                await asyncio.to_thread(_renew_leases, schedule_ids, owner, lease_s)
+            except Exception as exc:
+                logger.warning("Workflow schedule lease renewal failed: %s", exc)
+
+    task = asyncio.create_task(heartbeat())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+class WorkflowScheduler:
+    """
+    Background loop that runs due workflow schedules from every org.
+
+    Each API worker runs one loop. Every WORKFLOW_SCHEDULER_POLL_S it claims up to its free
+    slots (WORKFLOW_SCHEDULER_MAX_CONCURRENCY), while WORKFLOW_SCHEDULER_GLOBAL_MAX_CONCURRENCY
+    bounds runs across all workers. Claimed schedules run concurrently; a heartbeat renews
+    their leases until they finish.
+    """
+
+    def __init__(self) -> None:
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._runner: ScheduleRunner | None = None
+        self._loop_task: asyncio.Task | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @property
+    def lease_s(self) -> float:
+        return lease_seconds()
+
+    def start(self, runner: ScheduleRunner) -> None:
+        """Start polling; `runner(db, org_id=..., schedule_id=..., lease_owner=...)` executes one schedule."""
+        if self._loop_task is not None and not self._loop_task.done():
+            return
+        self._runner = runner
+        self._loop_task = asyncio.create_task(self._poll_loop())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self) -> None:
+        for task in (self._loop_task, self._heartbeat_task):
+            if task is not None:
+                task.cancel()
+        running = list(self._inflight.values())
+        if running:
+            _, pending = await asyncio.wait(running, timeout=_SHUTDOWN_GRACE_S)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _poll_loop(self) -> None:
+        interval = max(1.0, float(settings.workflow_scheduler_poll_s))
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Workflow scheduler poll failed: %s", exc)
+            await asyncio.sleep(interval)
+
+    async def tick(self) -> int:
+        """Claim and start due schedules up to the free local slots; returns how many started."""
+        free = max(1, int(settings.workflow_scheduler_max_concurrency)) - len(self._inflight)
+        if free <= 0 or self._runner is None:
+            return 0
+        claimed = await asyncio.to_thread(self._claim_due, free)
+        for row in claimed:
+            schedule_id = str(row["schedule_id"])
+            task = asyncio.create_task(self._run_one(schedule_id, str(row["org_id"])))
+            self._inflight[schedule_id] = task
+            task.add_done_callback(lambda _, key=schedule_id: self._inflight.pop(key, None))
+        return len(claimed)
+
+    def _claim_due(self, limit: int) -> list[dict[str, Any]]:
+        with SessionLocal() as db:
+            return ScheduleLeases(db).claim_due(
+                owner=self.owner,
+                limit=limit,
+                lease_s=self.lease_s,
+                global_cap=max(1, int(settings.workflow_scheduler_global_max_concurrency)),
+            )
+
+    async def _run_one(self, schedule_id: str, org_id: str) -> None:
+        assert self._runner is not None
+        try:
+            with SessionLocal() as db:
+                await self._runner(db, org_id=org_id, schedule_id=schedule_id, lease_owner=self.owner)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            detail = getattr(exc, "detail", None) or exc
+            logger.warning("Scheduled workflow %s (org %s) failed: %s", schedule_id, org_id, detail)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            schedule_ids = list(self._inflight)
+            if not schedule_ids:
+                continue
+            try:
+                await asyncio.to_thread(_renew_leases, schedule_ids, self.owner, self.lease_s)
+            except Exception as exc:
+                logger.warning("Workflow schedule lease renewal failed: %s", exc)
+
+
+workflow_scheduler = WorkflowScheduler()
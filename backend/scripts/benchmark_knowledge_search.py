@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from sqlalchemy import text
+
+# Allow running as `python scripts/benchmark_knowledge_search.py`.
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from app.db import SessionLocal
+from app.schema import ensure_schema
+from app.tools.document_search import doc_search
+
+# Query plans are collected against a session-local temp copy of knowledge_base (same columns,
+# generated search_vector and indexes), which shadows the real table via search_path. The
+# transaction is rolled back, so the real knowledge base is never touched.
+
+VOCABULARY = [
+    "pricing", "refund", "security", "privacy", "onboarding", "integration", "compliance",
+    "support", "billing", "invoice", "agent", "department", "schedule", "calendar", "contract",
+    "policy", "account", "subscription", "enterprise", "workflow", "analytics", "dashboard",
+    "export", "report", "training", "escalation", "ticket", "customer", "renewal", "discount",
+]
+
+LEGACY_FTS_SQL = """
+    select id, title, content, category, tags, source_url,
+      ts_rank(
+        to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, '')),
+        plainto_tsquery('english', :query)
+      ) as rank
+    from knowledge_base
+    where is_active = true
+      and to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, ''))
+          @@ plainto_tsquery('english', :query)
+    order by rank desc
+    limit :limit;
+"""
+
+QUERIES = {
+    "fts": "refund policy for enterprise subscription",
+    "fuzzy": "how do I reconfigure integrations",
+}
+
+
+def _populate(db, size: int) -> None:
+    db.execute(text("create temp table knowledge_base (like public.knowledge_base including all) on commit drop;"))
+    # The pre-change expression index, so the legacy query is measured as it used to run.
+    db.execute(
+        text(
+            """
+            create index on knowledge_base
+              using gin(to_tsvector('english', coalesce(title, '') || ' ' || coalesce(content, '')));
+            """
+        )
+    )
+    db.execute(
+        text(
+            """
+            insert into knowledge_base (title, content, category, created_by)
+            select
+              'Doc ' || g || ' ' || (:vocab)[1 + (g % cardinality(:vocab))],
+              array_to_string(
+                array(
+                  select (:vocab)[1 + floor(random() * cardinality(:vocab))::int]
+                  from generate_series(1, 80 + (g % 40))
+                ),
+                ' '
+              ),
+              (:vocab)[1 + ((g * 7) % cardinality(:vocab))],
+              'benchmark'
+            from generate_series(1, :size) as g;
+            """
+        ),
+        {"vocab": VOCABULARY, "size": size},
+    )
+    db.execute(text("analyze knowledge_base;"))
+
+
+def _explain(db, sql: str, params: dict, *, seqscan_only: bool = False) -> dict:
+    if seqscan_only:
+        db.execute(text("set local enable_bitmapscan = off;"))
+        db.execute(text("set local enable_indexscan = off;"))
+    try:
+        raw = db.execute(text("explain (analyze, buffers, format json) " + sql.strip()), params).scalar_one()
+    finally:
+        if seqscan_only:
+            db.execute(text("reset enable_bitmapscan;"))
+            db.execute(text("reset enable_indexscan;"))
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+    nodes: list[str] = []
+
+    def walk(node: dict) -> None:
+        label = node.get("Node Type", "")
+        if node.get("Index Name"):
+            label += f" ({node['Index Name']})"
+        nodes.append(label)
+        for child in node.get("Plans") or []:
+            walk(child)
+
+    walk(plan["Plan"])
+    return {
+        "execution_ms": round(float(plan.get("Execution Time") or 0.0), 2),
+        "scan": next((n for n in nodes if "Scan" in n), nodes[0] if nodes else ""),
+        "shared_hit": int(plan["Plan"].get("Shared Hit Blocks") or 0),
+    }
+
+
+def benchmark(sizes: list[int], limit: int) -> list[dict]:
+    rows: list[dict] = []
+    for size in sizes:
+        with SessionLocal() as db:
+            _populate(db, size)
+            fts_sql, fts_params = doc_search.fts_statement(QUERIES["fts"], limit=limit)
+            fuzzy = doc_search.fuzzy_statement(QUERIES["fuzzy"], limit=limit)
+            assert fuzzy is not None
+            fuzzy_sql, fuzzy_params = fuzzy
+            cases = {
+                "fts_legacy_recompute": _explain(db, LEGACY_FTS_SQL, {"query": QUERIES["fts"], "limit": limit}),
+                "fts_stored_vector": _explain(db, fts_sql, fts_params),
+                "fuzzy_seqscan": _explain(db, fuzzy_sql, fuzzy_params, seqscan_only=True),
+                "fuzzy_trigram": _explain(db, fuzzy_sql, fuzzy_params),
+            }
+            db.rollback()
+        for name, result in cases.items():
+            rows.append({"size": size, "query": name, **result})
+            print(f"{size:>8}  {name:<22} {result['execution_ms']:>10.2f} ms  {result['scan']}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare knowledge_base search query plans across table sizes.")
+    parser.add_argument("--sizes", type=str, default="1000,10000,50000", help="Comma-separated row counts")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--json", type=str, default="", help="Optional path to write results as JSON")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        ensure_schema(db.get_bind())
+
+    sizes = [int(part) for part in args.sizes.split(",") if part.strip()]
+    results = benchmark(sizes, args.limit)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nJSON written: {args.json}")
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.db import engine
+from app.files.images import is_image
+from app.retrieval import knowledge_index
+from app.schema import ensure_schema
+
+# One-off migration: images used to be stored as base64 data URIs in extracted_text and
+# indexed as knowledge chunks; they are binary blobs with resized variants now.
+
+
+def clear_image_text(conn: Connection) -> tuple[int, int]:
+    blobs = conn.execute(text("update file_blobs set extracted_text = '' where extracted_text like 'data:image/%';")).rowcount
+    uploads = conn.execute(
+        text("update uploaded_files set extracted_text = '' where extracted_text like 'data:image/%';")
+    ).rowcount
+    return blobs, uploads
+
+
+def remove_image_chunks(conn: Connection) -> tuple[int, set[str | None]]:
+    """
+    Delete every passage of image uploads; returns the count and the orgs whose index changed.
+
+    Matched by upload rather than by content: a data URI was chunked like any text, so only its
+    first passage starts with `data:image/`.
+    """
+    uploads = conn.execute(
+        text(
+            """
+            select f.file_id, f.filename, f.file_type
+            from uploaded_files f
+            where exists (
+              select 1 from knowledge_chunks c where c.source_type = 'file' and c.source_id = f.file_id
+            );
+            """
+        )
+    ).mappings().all()
+    image_ids = [
+        str(row["file_id"]) for row in uploads if is_image(str(row["file_type"] or ""), str(row["filename"] or ""))
+    ]
+    if not image_ids:
+        return 0, set()
+    orgs = conn.execute(
+        text(
+            """
+            delete from knowledge_chunks
+            where source_type = 'file' and source_id = any(cast(:file_ids as uuid[]))
+            returning org_id;
+            """
+        ),
+        {"file_ids": image_ids},
+    ).scalars().all()
+    return len(orgs), set(orgs)
+
+
+def main() -> None:
+    ensure_schema(engine)
+    with engine.begin() as conn:
+        blobs, uploads = clear_image_text(conn)
+        chunks, orgs = remove_image_chunks(conn)
+    # The on-disk vector indexes still hold the deleted passages; rebuild them from Postgres.
+    for org_id in orgs:
+        knowledge_index.rebuild_vector_index(org_id)
+    print(
+        f"Cleared {blobs} blob(s) and {uploads} upload(s); removed {chunks} chunk(s) "
+        f"and rebuilt {len(orgs)} vector index(es)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.db import engine
+from app.retrieval import knowledge_index
+from app.schema import ensure_schema
+
+
+def main() -> None:
+    ensure_schema(engine)
+    result = knowledge_index.reindex()
+    print(
+        f"Reindexed {result['documents_reindexed']} document(s): "
+        f"{result['chunks_written']} chunk(s) written, {result['chunks_removed']} removed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ if str(ROOT) not in sys.path:
 from app.db import SessionLocal
 from app.schema import ensure_schema
 from app.db import engine
+from app.retrieval import knowledge_index
 
 SAMPLE_DOCS = [
     {
@@ -165,6 +166,7 @@ def main() -> None:
             text("select count(*)::int from knowledge_base where is_active = true;")
         ).scalar_one()
     print(f"\nInserted: {inserted}, Updated: {updated}, Total active documents: {int(total or 0)}")
+    print(f"Passage index: {knowledge_index.reindex()}")
 
 
 if __name__ == "__main__":
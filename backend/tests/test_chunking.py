@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from app.retrieval.chunking import chunk_text
+
+
+def test_empty_and_short_text() -> None:
+    assert chunk_text("") == []
+    assert chunk_text("   \n\n  ") == []
+    assert chunk_text("One short paragraph.") == ["One short paragraph."]
+
+
+def test_chunks_respect_size_and_keep_every_sentence() -> None:
+    sentences = [f"Sentence number {i} talks about topic {i % 7}." for i in range(200)]
+    text = "\n\n".join(" ".join(sentences[i : i + 5]) for i in range(0, 200, 5))
+    chunks = chunk_text(text, chunk_chars=400, overlap_chars=80)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    joined = "\n".join(chunks)
+    assert all(sentence in joined for sentence in sentences)
+
+
+def test_consecutive_chunks_overlap() -> None:
+    text = "\n\n".join(f"Paragraph {i} " + "word " * 40 for i in range(20))
+    chunks = chunk_text(text, chunk_chars=300, overlap_chars=60)
+    for previous, current in zip(chunks, chunks[1:]):
+        head = current.split("\n", 1)[0]
+        assert head and head in previous
+
+
+def test_long_unbroken_text_is_hard_sliced() -> None:
+    chunks = chunk_text("x" * 2000, chunk_chars=500, overlap_chars=0)
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert "".join(chunk.replace("\n", "") for chunk in chunks) == "x" * 2000
+
+
+def test_whitespace_is_collapsed_within_lines() -> None:
+    assert chunk_text("a   b\t\tc") == ["a b c"]
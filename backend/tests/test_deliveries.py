@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import deliveries as deliveries_api
+from app.db import get_db
+from app.integrations import delivery as delivery_module
+from app.integrations.delivery import (
+    DeliveryWorker,
+    OutboundDeliveryStore,
+    delivery_destination,
+    delivery_slot_key,
+    retry_delay_s,
+)
+from app.settings import settings
+
+
+def test_retry_delay_doubles_with_equal_jitter_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(settings, "outbound_delivery_backoff_s", 2.0)
+    monkeypatch.setattr(settings, "outbound_delivery_max_backoff_s", 30.0)
+    monkeypatch.setattr(delivery_module.random, "uniform", lambda low, high: high)
+    assert [retry_delay_s(attempt) for attempt in (0, 1, 2, 3, 10)] == [2.0, 2.0, 4.0, 8.0, 30.0]
+    monkeypatch.setattr(delivery_module.random, "uniform", lambda low, high: low)
+    assert [retry_delay_s(attempt) for attempt in (1, 2, 10)] == [1.0, 2.0, 15.0]
+
+
+def test_delivery_destination_keys_by_host():
+    assert delivery_destination("email", {"smtp_host": " SMTP.Example.com "}) == "smtp://smtp.example.com:587"
+    assert delivery_destination("email", {"smtp_host": "mx", "smtp_port": 465}) == "smtp://mx:465"
+    assert delivery_destination("slack", {"webhook_url": "https://Hooks.Slack.com/services/x"}) == "slack://hooks.slack.com"
+    assert delivery_destination("webhook", {"url": "https://api.example.com:8443/hook"}) == "webhook://api.example.com"
+    assert delivery_destination("webhook", {}) == "webhook://"
+    assert delivery_slot_key("webhook://api.example.com", "webhook") == "webhook://api.example.com"
+    assert delivery_slot_key("", "slack") == delivery_slot_key(None, "slack") == "slack"
+
+
+class _Result:
+    def __init__(self, row=None, rowcount: int = 0, rows=()) -> None:
+        self.row = row
+        self.rowcount = rowcount
+        self.rows = list(rows)
+
+    def first(self):
+        return self.row
+
+    def mappings(self) -> "_Result":
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class _StoreDb:
+    def __init__(self, *results: _Result) -> None:
+        self.results = list(results)
+        self.statements: list[tuple[str, dict]] = []
+        self.commits = 0
+
+    def execute(self, statement, params=None):
+        self.statements.append((" ".join(str(statement).split()), params or {}))
+        return self.results.pop(0) if self.results else _Result()
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+def test_enqueue_with_a_key_is_idempotent_and_revives_dead_letters():
+    delivery_id = uuid.uuid4()
+    db = _StoreDb(_Result((delivery_id,)))
+    returned = OutboundDeliveryStore(db).enqueue(
+        org_id="org_a",
+        channel="slack",
+        integration_id=str(uuid.uuid4()),
+        destination="slack://hooks.slack.com",
+        payload={"text": "hi"},
+        idempotency_key="run-1:step-2",
+    )
+    assert returned == str(delivery_id)
+    upsert, params = db.statements[0]
+    assert "on conflict (idempotency_key)" in upsert
+    assert "when outbound_deliveries.status = 'dead' then 'pending'" in upsert
+    assert params["idempotency_key"] == "run-1:step-2"
+    delete, params = db.statements[1]
+    assert delete.startswith("delete from outbound_dead_letters") and params["delivery_id"] == str(delivery_id)
+    assert db.commits == 1
+
+
+def test_enqueue_without_a_key_leaves_dead_letters_alone():
+    db = _StoreDb(_Result((uuid.uuid4(),)))
+    OutboundDeliveryStore(db).enqueue(
+        org_id="org_a", channel="webhook", integration_id=str(uuid.uuid4()), destination="webhook://x", payload={}
+    )
+    assert len(db.statements) == 1
+
+
+def test_claim_due_caps_each_destination_counting_busy_sends():
+    db = _StoreDb(_Result(rows=[{"delivery_id": "d1"}]))
+    claimed = OutboundDeliveryStore(db).claim_due(
+        owner="w1", limit=5, lease_s=60, per_destination=2, busy={"slack://hooks.slack.com": 1}
+    )
+    assert claimed == [{"delivery_id": "d1"}]
+    sql, params = db.statements[0]
+    assert "for update skip locked" in sql and "partition by slot_key" in sql
+    assert "slot_rank + coalesce(cast(cast(:busy as jsonb) ->> slot_key as integer), 0) <= :per_destination" in sql
+    assert json.loads(params["busy"]) == {"slack://hooks.slack.com": 1}
+    assert params["per_destination"] == 2 and params["scan_limit"] == 50
+    assert db.commits == 1
+
+
+def test_outcomes_only_apply_while_the_owner_holds_the_lease():
+    store = OutboundDeliveryStore(_StoreDb(_Result(rowcount=0)))
+    assert store.mark_delivered("d1", owner="w1", result={}) is False
+    sql, params = store.db.statements[0]
+    assert "lease_owner = :owner" in sql and params["owner"] == "w1"
+
+    store = OutboundDeliveryStore(_StoreDb(_Result(rowcount=0)))
+    assert store.schedule_retry("d1", owner="w1", error="boom", delay_s=3) is False
+
+    # A lost lease must not write a dead letter for a row another worker now owns.
+    store = OutboundDeliveryStore(_StoreDb(_Result(rowcount=0)))
+    assert store.dead_letter("d1", owner="w1", error="boom") is False
+    assert len(store.db.statements) == 1
+
+    store = OutboundDeliveryStore(_StoreDb(_Result(rowcount=1)))
+    assert store.dead_letter("d1", owner="w1", error="boom") is True
+    assert "insert into outbound_dead_letters" in store.db.statements[1][0]
+
+
+def test_requeue_only_revives_dead_deliveries():
+    store = OutboundDeliveryStore(_StoreDb(_Result(None)))
+    assert store.requeue("d1", org_id="org_a") is False
+    assert "status = 'dead'" in store.db.statements[0][0] and len(store.db.statements) == 1
+
+    store = OutboundDeliveryStore(_StoreDb(_Result(("d1",))))
+    assert store.requeue("d1", org_id="org_a") is True
+    assert store.db.statements[1][0].startswith("delete from outbound_dead_letters")
+
+
+@pytest.fixture
+def outcomes(monkeypatch):
+    recorded: list[tuple] = []
+    monkeypatch.setattr(
+        delivery_module,
+        "_load_integration",
+        lambda integration_id: {"integration_type": "webhook", "is_active": True, "config": {"url": "https://x"}},
+    )
+    monkeypatch.setattr(
+        delivery_module, "_mark_delivered", lambda delivery_id, owner, result: recorded.append(("delivered", result)) or True
+    )
+    monkeypatch.setattr(
+        delivery_module,
+        "_schedule_retry",
+        lambda delivery_id, owner, error, delay_s: recorded.append(("retry", error, delay_s)) or True,
+    )
+    monkeypatch.setattr(
+        delivery_module, "_dead_letter", lambda delivery_id, owner, error: recorded.append(("dead", error)) or True
+    )
+    monkeypatch.setattr(delivery_module, "retry_delay_s", lambda attempt: float(attempt))
+    return recorded
+
+
+def _row(attempts: int = 1, max_attempts: int = 3) -> dict:
+    return {
+        "delivery_id": "d1",
+        "channel": "webhook",
+        "integration_id": "i1",
+        "destination": "webhook://x",
+        "payload": {"body": {}},
+        "attempts": attempts,
+        "max_attempts": max_attempts,
+    }
+
+
+def _send(monkeypatch, outcome) -> None:
+    async def send_delivery(channel, config, payload, **kwargs):
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(delivery_module, "send_delivery", send_delivery)
+
+
+def test_deliver_records_success(outcomes, monkeypatch):
+    _send(monkeypatch, {"status": 200})
+    asyncio.run(DeliveryWorker()._deliver(_row()))
+    assert outcomes == [("delivered", {"status": 200})]
+
+
+def test_deliver_retries_transient_failures_until_attempts_run_out(outcomes, monkeypatch):
+    _send(monkeypatch, ConnectionError("reset"))
+    asyncio.run(DeliveryWorker()._deliver(_row(attempts=2)))
+    asyncio.run(DeliveryWorker()._deliver(_row(attempts=3)))
+    assert outcomes == [("retry", "reset", 2.0), ("dead", "reset")]
+
+
+def test_deliver_dead_letters_permanent_failures_at_once(outcomes, monkeypatch):
+    _send(monkeypatch, {"status": 200})
+    monkeypatch.setattr(
+        delivery_module, "_load_integration", lambda integration_id: {"integration_type": "slack", "is_active": True, "config": {}}
+    )
+    asyncio.run(DeliveryWorker()._deliver(_row(attempts=1)))
+    monkeypatch.setattr(delivery_module, "_load_integration", lambda integration_id: None)
+    asyncio.run(DeliveryWorker()._deliver(_row(attempts=1)))
+    assert outcomes == [("dead", "Integration is not webhook"), ("dead", "Integration is missing or inactive")]
+
+
+def test_deliver_wakes_ack_waiters_once_recorded(outcomes, monkeypatch):
+    _send(monkeypatch, {"status": 200})
+    worker = DeliveryWorker()
+
+    async def run():
+        future = asyncio.get_running_loop().create_future()
+        worker._waiters["d1"] = {future}
+        await worker._deliver(_row())
+        return future.done()
+
+    assert asyncio.run(run()) is True
+
+
+def test_delivery_routes_reject_malformed_ids():
+    app = FastAPI()
+    app.include_router(deliveries_api.router)
+    app.dependency_overrides[get_db] = lambda: None
+    client = TestClient(app)
+    assert client.get("/v1/deliveries/not-a-uuid").status_code == 422
+    assert client.post("/v1/deliveries/not-a-uuid/retry").status_code == 422
+
+
+def test_delivery_routes_look_up_well_formed_ids(monkeypatch):
+    looked_up: list[str] = []
+    monkeypatch.setattr(OutboundDeliveryStore, "get", lambda self, delivery_id, org_id=None: looked_up.append(delivery_id))
+    app = FastAPI()
+    app.include_router(deliveries_api.router)
+    app.dependency_overrides[get_db] = lambda: None
+    delivery_id = str(uuid.uuid4())
+    assert TestClient(app).get(f"/v1/deliveries/{delivery_id}").status_code == 404
+    assert looked_up == [delivery_id]
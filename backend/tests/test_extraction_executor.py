@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import signal
+import time
+
+import pytest
+
+from app.files import executor as executor_module
+from app.files.executor import ExtractionExecutor, ExtractionTimeout
+from app.settings import settings
+
+
+# Pool tasks must be importable by the spawned workers, so they live at module level.
+def _sleep(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def _sleep_through_alarm(seconds: float) -> float:
+    # Stands in for a C extension stuck where the in-worker alarm cannot interrupt it.
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    try:
+        time.sleep(seconds)
+    finally:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGALRM})
+    return seconds
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(settings, "extraction_max_workers", 1)
+    monkeypatch.setattr(settings, "extraction_timeout_s", 1.0)
+    executor = ExtractionExecutor()
+    yield executor
+    asyncio.run(executor.shutdown())
+
+
+def _warm(executor: ExtractionExecutor, monkeypatch) -> None:
+    # Spawning a worker can take longer than the short grace below; start it with a long one.
+    monkeypatch.setattr(executor_module, "_HARD_TIMEOUT_GRACE_S", 30.0)
+    asyncio.run(executor._call(_sleep, 0))
+    monkeypatch.setattr(executor_module, "_HARD_TIMEOUT_GRACE_S", 0.5)
+
+
+def test_worker_alarm_times_out_without_recycling(executor, monkeypatch):
+    _warm(executor, monkeypatch)
+    pool = executor._pool
+    with pytest.raises(ExtractionTimeout):
+        asyncio.run(executor._call(_sleep, 5))
+    assert executor._pool is pool
+
+
+def test_stuck_task_recycles_pool_and_next_call_gets_a_fresh_one(executor, monkeypatch):
+    _warm(executor, monkeypatch)
+    pool = executor._pool
+    started = time.monotonic()
+    with pytest.raises(ExtractionTimeout):
+        asyncio.run(executor._call(_sleep_through_alarm, 30))
+    assert time.monotonic() - started < 10
+    assert executor._pool is None
+    _warm(executor, monkeypatch)
+    assert executor._pool is not None and executor._pool is not pool
+
+
+def test_time_spent_waiting_for_a_worker_does_not_count(executor, monkeypatch):
+    _warm(executor, monkeypatch)
+
+    async def run():
+        # One worker, three tasks of 0.7s: the last waits 1.4s for it, past limit + grace.
+        return await asyncio.gather(*(executor._call(_sleep, 0.7) for _ in range(3)))
+
+    assert asyncio.run(run()) == [0.7, 0.7, 0.7]
+
+
+def test_queued_and_running_extractions_heartbeat(monkeypatch):
+    monkeypatch.setattr(executor_module, "EXTRACTION_HEARTBEAT_S", 0.05)
+    beats: list[list[str]] = []
+    monkeypatch.setattr(executor_module, "_heartbeat", lambda sha256s: beats.append(sorted(sha256s)))
+    executor = ExtractionExecutor()
+
+    async def slow_run(**kwargs):
+        await asyncio.sleep(0.3)
+
+    monkeypatch.setattr(executor, "_run", slow_run)
+
+    async def run():
+        executor.submit(sha256="a", path=None, mime_type="", filename="a.txt")
+        executor.submit(sha256="b", path=None, mime_type="", filename="b.txt")
+        await asyncio.sleep(0.5)
+
+    asyncio.run(run())
+    assert ["a", "b"] in beats
+    assert executor._heartbeat_task.done()
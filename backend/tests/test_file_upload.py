@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import threading
+import time
+from datetime import datetime, timezone
+
+from starlette.datastructures import Headers, UploadFile
+
+from app.api import files as files_api
+from app.settings import settings
+
+
+class _Result:
+    def __init__(self, row=None) -> None:
+        self.row = row
+
+    def first(self):
+        return self.row
+
+    def mappings(self) -> "_Result":
+        return self
+
+
+class _BlobTable:
+    """`file_blobs` with Postgres' behaviour for a conflicting insert: wait for the other transaction."""
+
+    def __init__(self) -> None:
+        self.cond = threading.Condition()
+        self.committed: dict[str, dict] = {}
+        self.pending: dict[str, tuple[object, dict]] = {}
+        self.uploads: list[dict] = []
+
+
+class _FakeSession:
+    def __init__(self, table: _BlobTable) -> None:
+        self.table = table
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        params = params or {}
+        table = self.table
+        if "insert into file_blobs" in sql:
+            with table.cond:
+                sha256 = params["sha256"]
+                while sha256 in table.pending and table.pending[sha256][0] is not self:
+                    if not table.cond.wait(timeout=5):
+                        raise TimeoutError("blocked on another upload's uncommitted claim")
+                if sha256 in table.committed or sha256 in table.pending:
+                    return _Result(None)
+                table.pending[sha256] = (self, {"blob_path": params["blob_path"], "extraction_status": "pending"})
+                return _Result((sha256,))
+        if "from file_blobs" in sql:
+            row = dict(table.committed[params["sha256"]])
+            return _Result({**row, "extracted_text": "", "stale": False})
+        if "insert into uploaded_files" in sql:
+            time.sleep(0.2)  # keep the claim open while the other upload arrives
+            table.uploads.append(params)
+            return _Result({**params, "uploaded_at": datetime.now(timezone.utc)})
+        return _Result(None)
+
+    def commit(self) -> None:
+        with self.table.cond:
+            for sha256, (owner, row) in list(self.table.pending.items()):
+                if owner is self:
+                    self.table.committed[sha256] = row
+                    del self.table.pending[sha256]
+            self.table.cond.notify_all()
+
+    def rollback(self) -> None:
+        with self.table.cond:
+            for sha256, (owner, _) in list(self.table.pending.items()):
+                if owner is self:
+                    del self.table.pending[sha256]
+            self.table.cond.notify_all()
+
+
+def test_concurrent_identical_uploads_store_one_blob(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    submitted = []
+    monkeypatch.setattr(files_api.extraction_executor, "submit", lambda **kwargs: submitted.append(kwargs))
+    table = _BlobTable()
+
+    async def upload():
+        file = UploadFile(io.BytesIO(b"same bytes"), filename="notes.txt", headers=Headers({"content-type": "text/plain"}))
+        return await files_api.upload_file(
+            file=file, org_id="org_a", uploaded_by="user", db=_FakeSession(table), x_org_id=None
+        )
+
+    async def both():
+        return await asyncio.wait_for(asyncio.gather(upload(), upload()), timeout=10)
+
+    first, second = asyncio.run(both())
+    assert sorted([first["deduplicated"], second["deduplicated"]]) == [False, True]
+    assert first["sha256"] == second["sha256"]
+    blobs = [path for path in (tmp_path / "blobs").rglob("*") if path.is_file()]
+    assert len(blobs) == 1
+    assert blobs[0].read_bytes() == b"same bytes"
+    assert {upload["file_path"] for upload in table.uploads} == {str(blobs[0])}
+    assert not [path for path in (tmp_path / "tmp").iterdir()]
+    assert len(submitted) == 1
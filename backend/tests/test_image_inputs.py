@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.llm import litellm_client
+from app.settings import settings
+from scripts import clear_image_data_uris
+
+
+class _Result:
+    def __init__(self, rows) -> None:
+        self.rows = rows
+
+    def mappings(self) -> "_Result":
+        return self
+
+    def scalars(self) -> "_Result":
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class _FakeDb:
+    def __init__(self, *results) -> None:
+        self.results = list(results)
+        self.statements: list[tuple[str, dict]] = []
+
+    def __enter__(self) -> "_FakeDb":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+    def execute(self, statement, params=None):
+        self.statements.append((str(statement), params or {}))
+        return _Result(self.results.pop(0) if self.results else [])
+
+    def commit(self) -> None:
+        pass
+
+
+def _upload(file_id: str, filename: str, file_type: str, **extra) -> dict:
+    return {"file_id": file_id, "filename": filename, "file_type": file_type, **extra}
+
+
+def test_load_image_inputs_picks_variants_and_skips_documents(monkeypatch):
+    meta = {
+        "mime_type": "image/jpeg",
+        "variants": [{"size": 512, "path": "/blobs/a.512.jpg"}, {"size": 1024, "path": "/blobs/a.1024.jpg"}],
+    }
+    rows = [
+        _upload("f1", "photo.png", "image/png", file_path="/blobs/a.png", sha256="a", image_meta=meta),
+        _upload("f2", "report.pdf", "application/pdf", file_path="/blobs/b.pdf", sha256="b", image_meta=None),
+        _upload("f3", "legacy.jpg", "image/jpeg", file_path="/blobs/c.jpg", sha256="c", image_meta=None),
+    ]
+    monkeypatch.setattr(litellm_client, "SessionLocal", lambda: _FakeDb(rows))
+    monkeypatch.setattr(settings, "vision_image_max_px", 800)
+    monkeypatch.setattr(settings, "vision_max_images", 4)
+
+    images = litellm_client.load_image_inputs(org_id="org_a", file_ids=["f1", "f2", "f3"])
+    assert [image.file_id for image in images] == ["f1", "f3"]
+    assert images[0].path == "/blobs/a.512.jpg" and images[0].resize_px is None
+    # Uploads from before variants existed are downsized from the original per request.
+    assert images[1].path == "/blobs/c.jpg" and images[1].resize_px == 800
+
+
+def test_load_image_inputs_caps_image_count(monkeypatch):
+    rows = [_upload(f"f{i}", f"{i}.png", "image/png", file_path=f"/{i}.png", sha256=str(i), image_meta=None) for i in range(6)]
+    monkeypatch.setattr(litellm_client, "SessionLocal", lambda: _FakeDb(rows))
+    monkeypatch.setattr(settings, "vision_max_images", 2)
+    assert len(litellm_client.load_image_inputs(org_id="org_a", file_ids=[row["file_id"] for row in rows])) == 2
+
+
+def test_backfill_never_indexes_image_text(monkeypatch):
+    rows = [
+        _upload("f1", "photo.png", "image/png", extracted_text="data:image/png;base64,iVBORw0KGgo="),
+        _upload("f2", "notes.txt", "text/plain", extracted_text="meeting notes"),
+    ]
+    written = []
+
+    def write_chunks(db, **kwargs):
+        written.append(kwargs["source_id"])
+        return ["chunk"], np.zeros((1, 4), dtype=np.float32)
+
+    monkeypatch.setattr(litellm_client.knowledge_index, "write_chunks", write_chunks)
+    monkeypatch.setattr(litellm_client.knowledge_index, "publish", lambda **kwargs: None)
+    litellm_client._index_unindexed_files(_FakeDb(rows), org_id="org_a", file_ids=["f1", "f2"])
+    assert written == ["f2"]
+
+
+def test_migration_removes_every_chunk_of_image_uploads():
+    uploads = [
+        _upload("f1", "photo.png", "image/png"),
+        _upload("f2", "scan", "image/webp"),
+        _upload("f3", "notes.txt", "text/plain"),
+    ]
+    conn = _FakeDb(uploads, ["org_a"] * 13 + ["org_b"])
+    chunks, orgs = clear_image_data_uris.remove_image_chunks(conn)
+    delete_sql, params = conn.statements[-1]
+    assert "delete from knowledge_chunks" in delete_sql and "content like" not in delete_sql
+    assert params["file_ids"] == ["f1", "f2"]
+    assert chunks == 14
+    assert orgs == {"org_a", "org_b"}
+
+
+def test_migration_skips_delete_without_image_uploads():
+    conn = _FakeDb([_upload("f3", "notes.txt", "text/plain")])
+    assert clear_image_data_uris.remove_image_chunks(conn) == (0, set())
+    assert len(conn.statements) == 1
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+
+from app.academy import evaluator as evaluator_module
+from app.academy.evaluator import ResponseEvaluator, _extract_json_array
+
+CRITERIA = list(ResponseEvaluator.EVALUATION_CRITERIA)
+
+
+def _scores(value: float) -> dict:
+    return {criterion: value for criterion in CRITERIA}
+
+
+def _items(count: int) -> list[dict]:
+    return [
+        {"user_message": f"question {i}", "agent_response": f"answer {i}", "agent_role": "support", "expected_qualities": []}
+        for i in range(count)
+    ]
+
+
+def _judge(monkeypatch, response: str) -> list:
+    async def fake_llm(**kwargs):
+        return {"response": response}
+
+    monkeypatch.setattr(evaluator_module, "execute_via_litellm", fake_llm)
+    return asyncio.run(ResponseEvaluator(use_cache=False)._judge_batch(_items(3)))
+
+
+def test_extract_json_array_strips_fences_and_prose():
+    assert _extract_json_array('```json\n[{"id": 1}]\n```') == [{"id": 1}]
+    assert _extract_json_array('Here you go: [{"id": 2}] done') == [{"id": 2}]
+    with pytest.raises(json.JSONDecodeError):
+        _extract_json_array('{"id": 1}')
+
+
+def test_batch_answer_is_mapped_by_id_not_position(monkeypatch):
+    answer = [dict(_scores(90), id=3), dict(_scores(10), id=1), dict(_scores(50), id="2")]
+    judged = _judge(monkeypatch, json.dumps(answer))
+    assert [subscores["clarity"] for subscores in judged] == [10.0, 50.0, 90.0]
+
+
+def test_batch_leaves_invalid_or_missing_items_unscored(monkeypatch):
+    missing_key = {k: v for k, v in _scores(70).items() if k != "accuracy"}
+    answer = [
+        dict(missing_key, id=1),
+        dict(_scores(70), id=2, helpfulness="n/a"),
+        dict(_scores(150), id=9),
+        "not an object",
+    ]
+    assert _judge(monkeypatch, json.dumps(answer)) == [None, None, None]
+
+
+def test_batch_scores_are_clamped_and_first_answer_wins(monkeypatch):
+    answer = [dict(_scores(150), id=1), dict(_scores(20), id=1), dict(_scores(-5), id=2)]
+    judged = _judge(monkeypatch, json.dumps(answer))
+    assert judged[0] == _scores(100.0)
+    assert judged[1] == _scores(0.0)
+    assert judged[2] is None
+
+
+def test_unparseable_batch_answer_scores_nothing(monkeypatch):
+    assert _judge(monkeypatch, "I cannot grade these.") == [None, None, None]
+
+
+def test_unscored_batch_items_are_rejudged_individually(monkeypatch):
+    calls = []
+
+    async def fake_llm(**kwargs):
+        calls.append(kwargs["user"])
+        if "### Response id=" in kwargs["user"]:
+            return {"response": json.dumps([dict(_scores(80), id=1)])}
+        return {"response": json.dumps(_scores(40))}
+
+    monkeypatch.setattr(evaluator_module, "execute_via_litellm", fake_llm)
+    results = asyncio.run(ResponseEvaluator(use_cache=False).evaluate_many(_items(2), batch_size=2))
+    assert [result["subscores"]["clarity"] for result in results] == [80.0, 40.0]
+    assert results[0]["overall"] == 80.0
+    assert len(calls) == 2
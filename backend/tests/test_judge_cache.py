@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from app.academy import evaluator as evaluator_module
+from app.academy.evaluator import ResponseEvaluator
+from app.academy.judge_cache import judge_cache_key
+
+CRITERIA = list(ResponseEvaluator.EVALUATION_CRITERIA)
+
+
+def _item(response: str = "answer") -> dict:
+    return {"user_message": "question", "agent_response": response, "agent_role": "support", "expected_qualities": ["polite"]}
+
+
+def _key_args(**overrides) -> dict:
+    args = dict(
+        judge_provider="groq",
+        judge_model="m",
+        rubric_version=1,
+        agent_role="support",
+        user_message="question",
+        agent_response="answer",
+        expected_qualities=["polite"],
+    )
+    args.update(overrides)
+    return args
+
+
+class _FakeCache:
+    def __init__(self, monkeypatch) -> None:
+        self.rows: dict[str, dict[str, float]] = {}
+        monkeypatch.setattr(evaluator_module, "_cache_get_many", lambda keys: {k: self.rows[k] for k in keys if k in self.rows})
+        monkeypatch.setattr(evaluator_module, "_cache_put_many", lambda entries, **kwargs: self.rows.update(entries))
+
+
+def _fake_judge(monkeypatch, answer: dict) -> list:
+    calls = []
+
+    async def fake_llm(**kwargs):
+        calls.append(kwargs)
+        return {"response": json.dumps(answer)}
+
+    monkeypatch.setattr(evaluator_module, "execute_via_litellm", fake_llm)
+    return calls
+
+
+def test_cache_key_covers_judge_rubric_and_prompt_inputs():
+    base = judge_cache_key(**_key_args())
+    assert judge_cache_key(**_key_args()) == base
+    for change in (
+        {"judge_model": "other"},
+        {"rubric_version": 2},
+        {"agent_role": "sales"},
+        {"agent_response": "answer!"},
+        {"expected_qualities": []},
+    ):
+        assert judge_cache_key(**_key_args(**change)) != base
+
+
+def test_valid_judgement_is_cached_and_reused(monkeypatch):
+    cache = _FakeCache(monkeypatch)
+    calls = _fake_judge(monkeypatch, {criterion: 72 for criterion in CRITERIA})
+    evaluator = ResponseEvaluator(use_cache=True)
+
+    first = asyncio.run(evaluator.evaluate(**_item()))
+    second = asyncio.run(evaluator.evaluate(**_item()))
+    assert first == second
+    assert first["overall"] == 72.0
+    assert len(calls) == 1
+    assert len(cache.rows) == 1
+
+
+def test_incomplete_judgement_falls_back_and_is_not_cached(monkeypatch):
+    cache = _FakeCache(monkeypatch)
+    answer = {criterion: 90 for criterion in CRITERIA}
+    answer["accuracy"] = "high"
+    del answer["clarity"]
+    calls = _fake_judge(monkeypatch, answer)
+    evaluator = ResponseEvaluator(use_cache=True)
+
+    result = asyncio.run(evaluator.evaluate(**_item()))
+    assert result["subscores"] == {criterion: 50.0 for criterion in CRITERIA}
+    assert cache.rows == {}
+    asyncio.run(evaluator.evaluate(**_item()))
+    assert len(calls) == 2
+
+
+def test_cached_entry_missing_a_criterion_is_judged_again(monkeypatch):
+    cache = _FakeCache(monkeypatch)
+    calls = _fake_judge(monkeypatch, {criterion: 60 for criterion in CRITERIA})
+    evaluator = ResponseEvaluator(use_cache=True)
+    cache.rows[evaluator._cache_key(_item())] = {"helpfulness": 99.0}
+
+    result = asyncio.run(evaluator.evaluate(**_item()))
+    assert result["subscores"]["helpfulness"] == 60.0
+    assert len(calls) == 1
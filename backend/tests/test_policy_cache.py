@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import pytest
+
+from app.runtime import policy_cache as policy_cache_module
+from app.runtime import tool_policy as tool_policy_module
+from app.runtime.policy_cache import OrgPolicyCache
+from app.settings import settings
+
+
+class _Result:
+    def __init__(self, rows=(), rowcount: int = 0) -> None:
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    def mappings(self) -> "_Result":
+        return self
+
+    def all(self):
+        return self.rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalar(self):
+        return self.rows[0] if self.rows else None
+
+
+class _PolicyDb:
+    """Committed policy rows plus a hook run when a transaction is about to commit."""
+
+    def __init__(self) -> None:
+        self.tools: dict[tuple[str, str], bool] = {}
+        self.version = 0
+        self.before_commit = None
+        self.after_load_read = None
+
+    def session(self) -> "_Session":
+        return _Session(self)
+
+
+class _Session:
+    def __init__(self, db: _PolicyDb) -> None:
+        self.db = db
+        self.pending: list = []
+
+    def __enter__(self) -> "_Session":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.pending.clear()
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        params = params or {}
+        db = self.db
+        if "union all" in sql:
+            rows = [
+                {"kind": "tool", "agent_code": agent, "tool_name": tool, "allow": allow, "version": db.version}
+                for (agent, tool), allow in db.tools.items()
+            ]
+            if db.after_load_read is not None:
+                hook, db.after_load_read = db.after_load_read, None
+                hook()
+            return _Result(rows)
+        if "select version from org_policy_versions" in sql:
+            return _Result([db.version])
+        key = (params.get("agent_code") or "", params.get("tool_name"))
+        if "update org_tool_policies" in sql:
+            if key not in db.tools:
+                return _Result(rowcount=0)
+            self.pending.append(("tool", key, params["allow"]))
+            return _Result(rowcount=1)
+        if "insert into org_tool_policies" in sql:
+            self.pending.append(("tool", key, params["allow"]))
+        elif "insert into org_policy_versions" in sql:
+            self.pending.append(("version",))
+        return _Result()
+
+    def commit(self) -> None:
+        if self.db.before_commit is not None:
+            hook, self.db.before_commit = self.db.before_commit, None
+            hook()
+        for change in self.pending:
+            if change[0] == "tool":
+                self.db.tools[change[1]] = change[2]
+            else:
+                self.db.version += 1
+        self.pending.clear()
+
+
+@pytest.fixture
+def policy_db(monkeypatch):
+    db = _PolicyDb()
+    cache = OrgPolicyCache(revalidate_s=300)
+    monkeypatch.setattr(settings, "policy_cache_enabled", True)
+    monkeypatch.setattr(policy_cache_module, "SessionLocal", db.session)
+    monkeypatch.setattr(tool_policy_module, "SessionLocal", db.session)
+    monkeypatch.setattr(tool_policy_module, "policy_cache", cache)
+    return db
+
+
+def _allowed() -> bool:
+    return tool_policy_module.tool_policy_service.is_allowed(org_id="org_a", tool_name="web_search")
+
+
+def _block() -> None:
+    tool_policy_module.tool_policy_service.upsert_policy(org_id="org_a", tool_name="web_search", allow=False)
+
+
+def test_upsert_is_visible_to_an_immediate_read_back(policy_db):
+    assert _allowed() is True
+    _block()
+    assert _allowed() is False
+
+
+def test_read_racing_the_write_does_not_recache_old_policies(policy_db):
+    assert _allowed() is True
+    # Another request on this worker reads between the version bump and the commit.
+    policy_db.before_commit = lambda: _allowed()
+    _block()
+    assert _allowed() is False
+
+
+def test_load_straddling_the_commit_is_not_cached(policy_db):
+    # A cold read fetches the old rows, then the write commits before the load is stored.
+    policy_db.after_load_read = _block
+    assert _allowed() is True
+    assert _allowed() is False
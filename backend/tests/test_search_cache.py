@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from app.tools.search_cache import SearchResultCache
+
+
+def test_normalize_keeps_non_latin_terms() -> None:
+    cache = SearchResultCache()
+    assert cache.normalize("東京の天気") == "東京の天気"
+    assert cache.normalize("Привет мир новости") == "привет мир новости"
+    assert cache.normalize("café prices") == "café prices"
+
+
+def test_distinct_non_latin_queries_get_distinct_keys() -> None:
+    cache = SearchResultCache()
+    keys = {
+        cache.make_key(normalized=cache.normalize(query), search_type="search", num_results=5)
+        for query in ("東京の天気", "大阪の天気", "Привет мир новости")
+    }
+    assert len(keys) == 3
+
+
+def test_normalize_drops_prefixes_stop_words_and_case() -> None:
+    cache = SearchResultCache()
+    assert cache.normalize("What is the price of Bitcoin?") == cache.normalize("price of bitcoin")
+    assert cache.normalize("STRASSE") == cache.normalize("straße")
+
+
+def test_normalize_is_empty_without_identifying_tokens() -> None:
+    cache = SearchResultCache()
+    assert cache.normalize("???") == ""
+    assert cache.normalize("") == ""
+
+
+def test_classify_volatile_queries() -> None:
+    cache = SearchResultCache()
+    assert cache.classify(cache.normalize("latest news on tesla")) == "volatile"
+    assert cache.classify(cache.normalize("history of the roman empire")) == "evergreen"
+
+
+def test_queries_without_cache_key_bypass_the_cache(monkeypatch) -> None:
+    import asyncio
+
+    from app.tools import web_search as web_search_module
+
+    monkeypatch.setattr(web_search_module.settings, "serper_api_key", "test-key")
+    tool = web_search_module.WebSearchTool()
+    fetched: list[str] = []
+
+    async def fake_fetch(*, query: str, num_results: int, search_type: str) -> dict:
+        fetched.append(query)
+        return {"organic": []}
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the cache must not be used for an empty key")
+
+    monkeypatch.setattr(tool, "_fetch", fake_fetch)
+    monkeypatch.setattr(web_search_module.search_cache, "get", fail)
+    monkeypatch.setattr(web_search_module.search_cache, "put", fail)
+    monkeypatch.setattr(web_search_module.settings, "web_search_cache_enabled", True)
+
+    raw, key, entry = asyncio.run(tool._cached_search(query="???", num_results=5, search_type="search"))
+    assert (raw, key, entry) == ({"organic": []}, "", None)
+    assert fetched == ["???"]
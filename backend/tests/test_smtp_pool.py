@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+from email.message import EmailMessage
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from app.integrations.email import SMTPPool
+from app.settings import settings
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self.peers: list[tuple[str, int]] = []
+        self.servers: list = []
+        self.active = 0
+        self.max_active = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.05)
+        finally:
+            self.active -= 1
+        self.peers.append(session.peer)
+        self.servers.append(server)
+        return "250 OK"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    recorder = _Recorder()
+    controller = Controller(
+        recorder,
+        hostname="127.0.0.1",
+        port=_free_port(),
+        auth_require_tls=False,
+        authenticator=lambda *args: AuthResult(success=True),
+    )
+    controller.start()
+    try:
+        yield controller, recorder
+    finally:
+        controller.stop()
+
+
+@pytest.fixture
+def pool_settings(monkeypatch):
+    monkeypatch.setattr(settings, "smtp_pool_per_server", 2)
+    monkeypatch.setattr(settings, "smtp_pool_idle_timeout_s", 60)
+    monkeypatch.setattr(settings, "smtp_pool_max_messages_per_connection", 100)
+
+
+def _pool(controller) -> SMTPPool:
+    return SMTPPool((controller.hostname, controller.port, "user", False), password="secret")
+
+
+def _message(index: int) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "agent@example.com"
+    message["To"] = "someone@example.com"
+    message["Subject"] = f"message {index}"
+    message.set_content("hello")
+    return message
+
+
+def test_sequential_sends_reuse_one_connection(smtp_server, pool_settings):
+    controller, recorder = smtp_server
+
+    async def run():
+        pool = _pool(controller)
+        for index in range(3):
+            await pool.send(_message(index))
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(recorder.peers) == 3
+    assert len(set(recorder.peers)) == 1
+
+
+def test_concurrent_sends_stay_within_per_server_cap(smtp_server, pool_settings):
+    controller, recorder = smtp_server
+
+    async def run():
+        pool = _pool(controller)
+        await asyncio.gather(*(pool.send(_message(index)) for index in range(6)))
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(recorder.peers) == 6
+    assert recorder.max_active <= 2
+    assert len(set(recorder.peers)) <= 2
+
+
+def test_reconnects_after_server_drops_idle_connection(smtp_server, pool_settings):
+    controller, recorder = smtp_server
+
+    async def run():
+        pool = _pool(controller)
+        await pool.send(_message(0))
+        controller.loop.call_soon_threadsafe(recorder.servers[-1].transport.close)
+        # Block the client loop so the pooled connection still looks alive when it is reused.
+        time.sleep(0.2)
+        await pool.send(_message(1))
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(recorder.peers) == 2
+    assert recorder.peers[0] != recorder.peers[1]
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import csv
+import io
+
+from app.files.tabular import profile_rows
+
+
+def _sample_rows(profile: str) -> list[list[str]]:
+    sample = profile.split("Sample rows:\n", 1)[1]
+    return list(csv.reader(io.StringIO(sample)))
+
+
+def test_profile_summarises_columns():
+    rows = [["id", "amount", "city"], ["1", "10.5", "Lagos"], ["2", "n/a", "Lagos"], ["3", "7", "Accra"]]
+    profile = profile_rows("orders", rows)
+    assert profile.startswith("Table: orders (3 rows, 3 columns)")
+    assert "- amount: number; nulls 33.3%; min 7, max 10.5" in profile
+    assert "top 'Lagos' (2)" in profile
+
+
+def test_sample_rows_are_quoted():
+    rows = [["name", "note"], ["Smith, Jane", 'said "hi"'], ["Line\nbreak", ""]]
+    profile = profile_rows("people", rows)
+    assert _sample_rows(profile) == [["name", "note"], ["Smith, Jane", 'said "hi"'], ["Line\nbreak", ""]]
+
+
+def test_blank_rows_skipped_and_truncation_marked():
+    rows = [["a"], [""], ["1"], ["2"], ["3"]]
+    profile = profile_rows("t", rows, max_rows=2)
+    assert profile.startswith("Table: t (2+ rows, 1 columns)")
+
+
+def test_empty_header_yields_empty_profile():
+    assert profile_rows("t", [["", None]]) == ""
+    assert profile_rows("t", []) == ""
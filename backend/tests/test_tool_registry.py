@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+import anyio
+import pytest
+
+from app.runtime import tool_registry as registry_module
+from app.runtime.tool_registry import ToolCallContext, ToolRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ToolRegistry()
+    calls: list[dict] = []
+
+    async def book_meeting(**kwargs):
+        calls.append(kwargs)
+        return {"booked": True}
+
+    registry._tools["book_meeting"] = replace(registry._tools["book_meeting"], handler=book_meeting)
+    monkeypatch.setattr(registry_module.tool_policy_service, "is_allowed", lambda **kwargs: True)
+
+    def emit(event):
+        # A hook failing after the tool ran, e.g. the audit write losing its connection.
+        if event.event_type == "tool.post_call":
+            raise RuntimeError("hook store unavailable")
+
+    monkeypatch.setattr(registry_module.hook_bus, "emit", emit)
+    registry.calls = calls
+    return registry
+
+
+def _run(registry: ToolRegistry) -> dict:
+    context = ToolCallContext(org_id="org_a", session_id=None, agent_code=None)
+    return registry.run_sync(tool_name="book_meeting", context=context, args={"slot": "10:00"})
+
+
+def test_run_sync_outside_worker_thread_runs_tool_once(registry):
+    with pytest.raises(RuntimeError, match="hook store unavailable"):
+        _run(registry)
+    assert registry.calls == [{"slot": "10:00"}]
+
+
+def test_run_sync_in_worker_thread_propagates_tool_errors_without_rerun(registry):
+    async def main():
+        await anyio.to_thread.run_sync(_run, registry)
+
+    with pytest.raises(RuntimeError, match="hook store unavailable"):
+        anyio.run(main)
+    assert registry.calls == [{"slot": "10:00"}]
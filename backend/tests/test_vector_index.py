@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.retrieval.vector_index import VectorIndexRegistry
+
+
+def test_similar_org_ids_get_separate_directories(tmp_path) -> None:
+    registry = VectorIndexRegistry(str(tmp_path), dim=4)
+    names = {registry.directory_name(org_id) for org_id in ("acme.co", "acme_co", "acme-co", "acme/co")}
+    assert len(names) == 4
+    assert registry.directory_name(None) == VectorIndexRegistry.GLOBAL
+    assert registry.directory_name("acme.co") == registry.directory_name("acme.co")
+
+
+def test_orgs_do_not_see_each_others_vectors(tmp_path) -> None:
+    registry = VectorIndexRegistry(str(tmp_path), dim=4)
+    vector = np.array([[1.0, 0.0, 0.0, 0.0]], dtype=np.float32)
+    registry.get("acme.co").replace_source("file", "doc-a", ["chunk-a"], vector)
+    registry.get("acme_co").replace_source("file", "doc-b", ["chunk-b"], vector)
+
+    hits = registry.get("acme.co").search(vector[0], 10, source_type="file")
+    assert [key for key, _ in hits] == ["chunk-a"]
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import pytest
+from fastapi import HTTPException
+
+from app.workflows.engine import WorkflowEngine
+from app.workflows.plans import CompiledCondition, CompiledTemplate, WorkflowPlanCache, _eval_node, _parse_expression
+
+
+def _textual(source: str, variables: dict) -> bool:
+    try:
+        return bool(_eval_node(_parse_expression(CompiledTemplate.parse(source).render(variables))))
+    except Exception:
+        return False
+
+
+@pytest.mark.parametrize(
+    "source, variables",
+    [
+        ("'{{status}}' == 'approved'", {"status": "approved"}),
+        ("'{{status}}' == 'approved'", {"status": "rejected"}),
+        ("{{score}} >= 7", {"score": "8"}),
+        ("{{score}} >= 7", {"score": "3"}),
+        ("{{score}} >= 7 and '{{tier}}' != 'free'", {"score": "9", "tier": "pro"}),
+        ("'urgent' in '{{subject}}'", {"subject": "an urgent request"}),
+        ("not {{flag}}", {"flag": "False"}),
+        ("{{decision}} == approved", {"decision": "approved"}),
+        # Values that change the parse take the textual path and must still agree with it.
+        ("'{{note}}' == 'x'", {"note": "it's"}),
+        ("{{expr}}", {"expr": "1 < 2"}),
+        ("{{missing}} == ''", {}),
+    ],
+)
+def test_condition_matches_textual_substitution(source, variables):
+    assert CompiledCondition.parse(source).evaluate(variables) == _textual(source, variables)
+
+
+def test_condition_parses_once_with_placeholders():
+    condition = CompiledCondition.parse("{{a}} > 1 and '{{b}}' == 'x'")
+    assert condition.tree is not None
+    assert condition.names == ("a", "b")
+
+
+def test_empty_condition_is_true_and_invalid_is_false():
+    assert CompiledCondition.parse("").evaluate({}) is True
+    assert CompiledCondition.parse("(((").evaluate({}) is False
+    assert CompiledCondition.parse("__import__('os')").evaluate({}) is False
+
+
+def test_template_render():
+    template = CompiledTemplate.parse("Hi {{name}}, re: {{topic}}.")
+    assert template.names == ("name", "topic")
+    assert template.render({"name": "Ada"}) == "Hi Ada, re: ."
+
+
+def _definition() -> dict:
+    return {
+        "execution_mode": "sequential",
+        "steps": [
+            {"id": "draft", "agent_code": "writer", "set_var": "draft"},
+            {"id": "review", "agent_code": "editor", "input": "Review: {{draft}}", "conditions": {"if": "{{score}} > 5"}},
+            {"id": "notes", "agent_code": "writer", "input": "{{initial_message}}"},
+        ],
+    }
+
+
+def test_compile_plan():
+    plan = WorkflowEngine(db=None).compile_plan(_definition())
+    assert plan.execution_mode == "sequential"
+    assert plan.order == ("draft", "review", "notes")
+    assert plan.start_step_id == "draft"
+    assert plan.dependencies["review"] == ("draft",)
+    assert plan.dependencies["notes"] == ()
+    assert set(plan.sinks) == {"review", "notes"}
+    assert plan.agent_codes == ("writer", "editor")
+    assert plan.step("review").input.names == ("draft",)
+    assert plan.step("review").condition.evaluate({"score": "9"}) is True
+    assert plan.step("unknown") is None
+    assert plan.definition() == _definition()
+
+
+def test_plan_steps_are_read_only_copies():
+    definition = _definition()
+    plan = WorkflowEngine(db=None).compile_plan(definition)
+    definition["steps"][0]["agent_code"] = "changed"
+    assert plan.step("draft").config["agent_code"] == "writer"
+    with pytest.raises(TypeError):
+        plan.step("draft").config["agent_code"] = "changed"
+
+
+def test_compile_plan_rejects_invalid_definition():
+    with pytest.raises(HTTPException) as exc:
+        WorkflowEngine(db=None).compile_plan({"steps": [{"id": "a"}, {"id": "a", "agent_code": "x"}]})
+    assert exc.value.status_code == 400
+    assert "duplicate step id: a" in exc.value.detail
+
+
+def test_plan_cache_recompiles_on_new_version():
+    cache = WorkflowPlanCache(max_entries=2)
+    compiled = []
+
+    def compile_plan():
+        plan = WorkflowEngine(db=None).compile_plan(_definition())
+        compiled.append(plan)
+        return plan
+
+    first = cache.get_or_compile("t1", "v1", compile_plan)
+    assert cache.get_or_compile("t1", "v1", compile_plan) is first
+    assert cache.get_or_compile("t1", "v2", compile_plan) is not first
+    cache.get_or_compile("t2", "v1", compile_plan)
+    cache.get_or_compile("t3", "v1", compile_plan)
+    cache.get_or_compile("t1", "v2", compile_plan)  # evicted as least recently used
+    assert len(compiled) == 5
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.workflows import engine as engine_module
+from app.workflows.engine import EngineStepResult, WorkflowEngine
+from app.workflows.runs import RunCheckpoint, WorkflowRunStore
+
+
+class _MemoryRunStore:
+    """WorkflowRunStore over dicts, with the upsert's attempt accumulation."""
+
+    runs: dict[str, dict] = {}
+    steps: dict[tuple[str, int], dict] = {}
+
+    def __init__(self, db) -> None:
+        pass
+
+    def load_checkpoint(self, workflow_id: str) -> RunCheckpoint | None:
+        run = self.runs.get(workflow_id)
+        if run is None:
+            return None
+        completed = [
+            dict(row)
+            for (run_id, _), row in sorted(self.steps.items())
+            if run_id == workflow_id and row["status"] == "completed"
+        ]
+        return RunCheckpoint(variables=dict(run["variables"]), current_step_id=run["current_step_id"], completed_steps=completed)
+
+    def record_step(self, *, workflow_id, step, attempts, variables, next_step_id) -> None:
+        self._upsert(workflow_id, step.step_index, step.step_id, "completed", attempts, response=step.response)
+        run = self.runs.setdefault(workflow_id, {})
+        run.update(variables=json.loads(json.dumps(variables)), current_step_id=next_step_id)
+
+    def record_step_failure(self, *, workflow_id, step_index, step_id, agent_code, attempts, error) -> None:
+        self._upsert(workflow_id, step_index, step_id, "failed", attempts, response="", error_message=error)
+
+    def finish_run(self, workflow_id, *, status, final_response="", error=None) -> None:
+        run = self.runs.setdefault(workflow_id, {"variables": {}, "current_step_id": None})
+        run.update(status=status, error=error)
+        if status == "completed":
+            run["current_step_id"] = None
+
+    def _upsert(self, workflow_id, step_index, step_id, status, attempts, **values) -> None:
+        previous = self.steps.get((workflow_id, step_index))
+        self.steps[(workflow_id, step_index)] = {
+            "step_index": step_index,
+            "step_id": step_id,
+            "agent_code": "writer",
+            "status": status,
+            "attempts": (previous["attempts"] if previous else 0) + attempts,
+            "input_message": "",
+            "model_used": "fake",
+            "latency_ms": 1,
+            "trace_id": "",
+            "result": {},
+            **values,
+        }
+
+
+class _FakeSteps:
+    """Step runner that echoes its input and fails on demand."""
+
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        self.failures: dict[str, list[Exception]] = {}
+
+    async def run(self, *, step, step_index, variables, **kwargs) -> EngineStepResult:
+        self.calls.append(step.step_id)
+        pending = self.failures.get(step.step_id)
+        if pending:
+            raise pending.pop(0)
+        return EngineStepResult(
+            step_index=step_index,
+            step_id=step.step_id,
+            agent_code=step.agent_code,
+            input_message="",
+            response=f"{step.step_id}({variables.get('first', '')})",
+            model_used="fake",
+            latency_ms=1,
+            trace_id="",
+        )
+
+
+_DEFINITION = {
+    "execution_mode": "sequential",
+    "steps": [
+        {"id": "s1", "agent_code": "writer", "set_var": "first"},
+        {"id": "s2", "agent_code": "writer"},
+        {"id": "s3", "agent_code": "writer"},
+        {"id": "s4", "agent_code": "writer"},
+    ],
+}
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    monkeypatch.setattr(_MemoryRunStore, "runs", {})
+    monkeypatch.setattr(_MemoryRunStore, "steps", {})
+    monkeypatch.setattr(engine_module, "WorkflowRunStore", _MemoryRunStore)
+    monkeypatch.setattr(WorkflowEngine, "_resolve_agents", lambda self, plan, org_id: None)
+    delays: list[float] = []
+
+    async def sleep(delay_s):
+        delays.append(delay_s)
+
+    monkeypatch.setattr(engine_module.asyncio, "sleep", sleep)
+    steps = _FakeSteps()
+    steps.delays = delays
+
+    def execute(*, resume: bool = False, **kwargs):
+        engine = WorkflowEngine(db=None)
+        engine._run_step = steps.run
+        return asyncio.run(
+            engine.execute_workflow(
+                org_id="org_a",
+                session_id="session",
+                initial_message="go",
+                context=None,
+                workflow_definition=_DEFINITION,
+                workflow_id="run-1",
+                resume=resume,
+                **kwargs,
+            )
+        )
+
+    steps.execute = execute
+    return steps
+
+
+def test_resume_continues_from_the_failed_step(runner):
+    runner.failures["s3"] = [RuntimeError("agent crashed")]
+    with pytest.raises(RuntimeError):
+        runner.execute()
+    assert runner.calls == ["s1", "s2", "s3"]
+    assert _MemoryRunStore.runs["run-1"]["status"] == "failed"
+    assert _MemoryRunStore.runs["run-1"]["current_step_id"] == "s3"
+
+    runner.calls.clear()
+    final_response, results = runner.execute(resume=True)
+    assert runner.calls == ["s3", "s4"]
+    assert [result.step_id for result in results] == ["s1", "s2", "s3", "s4"]
+    # Variables set by finished steps come back from the checkpoint.
+    assert final_response == "s4(s1())"
+    assert _MemoryRunStore.runs["run-1"]["status"] == "completed"
+    assert [_MemoryRunStore.steps[("run-1", index)]["attempts"] for index in (1, 2, 3, 4)] == [1, 1, 2, 1]
+
+
+def test_server_errors_retry_with_exponential_backoff(runner):
+    runner.failures["s2"] = [HTTPException(status_code=502, detail="upstream"), HTTPException(status_code=503, detail="busy")]
+    events: list[str] = []
+    final_response, _ = runner.execute(step_retries=2, retry_backoff_s=0.5, on_event=lambda event, data: events.append(event))
+    assert runner.calls == ["s1", "s2", "s2", "s2", "s3", "s4"]
+    assert runner.delays == [0.5, 1.0]
+    assert events.count("step_retry") == 2
+    assert _MemoryRunStore.steps[("run-1", 2)]["attempts"] == 3
+
+
+def test_retries_stop_at_the_budget_and_skip_client_errors(runner):
+    runner.failures["s2"] = [HTTPException(status_code=500, detail="down")] * 3
+    with pytest.raises(HTTPException):
+        runner.execute(step_retries=1, retry_backoff_s=0.5)
+    assert runner.calls == ["s1", "s2", "s2"]
+    assert _MemoryRunStore.steps[("run-1", 2)]["status"] == "failed"
+    assert _MemoryRunStore.steps[("run-1", 2)]["attempts"] == 2
+
+    runner.calls.clear()
+    runner.failures["s3"] = [HTTPException(status_code=400, detail="bad input")]
+    runner.failures["s2"] = []
+    with pytest.raises(HTTPException):
+        runner.execute(resume=True, step_retries=3)
+    assert runner.calls == ["s2", "s3"]
+    assert _MemoryRunStore.steps[("run-1", 2)]["attempts"] == 3
+    assert _MemoryRunStore.steps[("run-1", 3)]["attempts"] == 1
+
+
+class _Result:
+    def __init__(self, row=None, rows=()) -> None:
+        self.row = row
+        self.rows = list(rows)
+
+    def mappings(self) -> "_Result":
+        return self
+
+    def first(self):
+        return self.row
+
+    def all(self):
+        return self.rows
+
+
+class _SqlDb:
+    def __init__(self, *results) -> None:
+        self.results = list(results)
+        self.statements: list[tuple[str, dict]] = []
+
+    def execute(self, statement, params=None):
+        self.statements.append((" ".join(str(statement).split()), params or {}))
+        return self.results.pop(0) if self.results else _Result()
+
+    def commit(self) -> None:
+        pass
+
+
+def test_step_upsert_adds_attempts_across_resumes():
+    db = _SqlDb()
+    WorkflowRunStore(db).record_step_failure(
+        workflow_id="run-1", step_index=3, step_id="s3", agent_code="writer", attempts=2, error="x" * 5000
+    )
+    sql, params = db.statements[0]
+    assert "on conflict (workflow_id, step_index) do update" in sql
+    assert "attempts = workflow_run_steps.attempts + excluded.attempts" in sql
+    assert params["attempts"] == 2 and params["status"] == "failed"
+    assert len(params["error_message"]) == 2000
+
+
+def test_checkpoint_keeps_only_completed_steps():
+    run = {"variables": {"first": "a"}, "current_step_id": "s3"}
+    steps = [{"step_index": 1, "status": "completed"}, {"step_index": 2, "status": "completed"}, {"step_index": 3, "status": "failed"}]
+    checkpoint = WorkflowRunStore(_SqlDb(_Result(run), _Result(rows=steps))).load_checkpoint("run-1")
+    assert checkpoint.variables == {"first": "a"}
+    assert checkpoint.current_step_id == "s3"
+    assert [row["step_index"] for row in checkpoint.completed_steps] == [1, 2]
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from app.settings import settings
+from app.workflows import scheduler as scheduler_module
+from app.workflows.scheduler import ScheduleLeases, WorkflowScheduler, next_run_at, renewing_leases
+
+pytest.importorskip("croniter")
+
+
+def _utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_next_run_at_keeps_local_time_across_dst_changes():
+    # Paris moves to CEST on 2026-03-29 and back to CET on 2026-10-25.
+    assert next_run_at("0 9 * * *", "Europe/Paris", base=_utc(2026, 3, 27, 12)) == _utc(2026, 3, 28, 8)
+    assert next_run_at("0 9 * * *", "Europe/Paris", base=_utc(2026, 3, 28, 12)) == _utc(2026, 3, 29, 7)
+    assert next_run_at("0 9 * * *", "Europe/Paris", base=_utc(2026, 10, 24, 12)) == _utc(2026, 10, 25, 8)
+
+
+def test_next_run_at_falls_back_to_utc_and_rejects_bad_expressions():
+    base = _utc(2026, 3, 28, 12)
+    assert next_run_at("0 9 * * *", "Mars/Olympus_Mons", base=base) == _utc(2026, 3, 29, 9)
+    assert next_run_at("0 9 * * *", "", base=base) == _utc(2026, 3, 29, 9)
+    assert next_run_at("not a cron", "UTC", base=base) is None
+
+
+class _Result:
+    def __init__(self, value=None, rows=()) -> None:
+        self.value = value
+        self.rows = list(rows)
+
+    def scalar(self):
+        return self.value
+
+    def mappings(self) -> "_Result":
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class _LeaseDb:
+    def __init__(self, active: int, due: list[dict]) -> None:
+        self.active = active
+        self.due = due
+        self.statements: list[tuple[str, dict]] = []
+        self.commits = 0
+
+    def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        params = params or {}
+        self.statements.append((sql, params))
+        if "count(*)" in sql:
+            return _Result(self.active)
+        if "update workflow_schedules" in sql:
+            return _Result(rows=self.due[: params["limit"]])
+        return _Result()
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+def test_claim_due_serializes_claimers_and_skips_locked_rows():
+    due = [{"schedule_id": f"s{i}", "org_id": "org_a", "next_run_at": None} for i in range(5)]
+    db = _LeaseDb(active=7, due=due)
+    claimed = ScheduleLeases(db).claim_due(owner="w1", limit=4, lease_s=60, global_cap=10)
+    # Three live leases left under the cluster cap, so only three are claimed.
+    assert [row["schedule_id"] for row in claimed] == ["s0", "s1", "s2"]
+    assert "pg_advisory_xact_lock" in db.statements[0][0]
+    sql, params = db.statements[-1]
+    assert "for update skip locked" in sql and "lease_expires_at <= now()" in sql
+    assert params["owner"] == "w1" and params["limit"] == 3
+    assert db.commits == 1
+
+
+def test_claim_due_claims_nothing_at_the_global_cap():
+    db = _LeaseDb(active=10, due=[{"schedule_id": "s0", "org_id": "org_a", "next_run_at": None}])
+    assert ScheduleLeases(db).claim_due(owner="w1", limit=4, lease_s=60, global_cap=10) == []
+    assert not any("update workflow_schedules" in sql for sql, _ in db.statements)
+    # The advisory lock is transaction-scoped; committing releases it.
+    assert db.commits == 1
+
+
+def test_tick_claims_only_free_slots_and_runs_each_schedule(monkeypatch):
+    monkeypatch.setattr(settings, "workflow_scheduler_max_concurrency", 3)
+    scheduler = WorkflowScheduler()
+    limits: list[int] = []
+    ran: list[tuple[str, str, str]] = []
+
+    def claim_due(limit):
+        limits.append(limit)
+        return [{"schedule_id": "s1", "org_id": "org_a"}, {"schedule_id": "s2", "org_id": "org_b"}][:limit]
+
+    async def runner(db, *, org_id, schedule_id, lease_owner):
+        ran.append((schedule_id, org_id, lease_owner))
+
+    monkeypatch.setattr(scheduler, "_claim_due", claim_due)
+    monkeypatch.setattr(scheduler_module, "SessionLocal", _NullSession)
+    scheduler._runner = runner
+
+    async def run():
+        scheduler._inflight["busy"] = asyncio.get_running_loop().create_future()
+        started = await scheduler.tick()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return started
+
+    assert asyncio.run(run()) == 2
+    assert limits == [2]
+    assert sorted(ran) == [("s1", "org_a", scheduler.owner), ("s2", "org_b", scheduler.owner)]
+    assert list(scheduler._inflight) == ["busy"]
+
+
+class _NullSession:
+    def __enter__(self) -> "_NullSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+def test_renewing_leases_heartbeats_until_the_block_exits(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "lease_seconds", lambda: 0.15)
+    renewals: list[tuple[list[str], str]] = []
+    monkeypatch.setattr(
+        scheduler_module, "_renew_leases", lambda ids, owner, lease_s: renewals.append((list(ids), owner))
+    )
+
+    async def run():
+        async with renewing_leases(["s1"], owner="manual:1"):
+            await asyncio.sleep(0.2)
+        count = len(renewals)
+        await asyncio.sleep(0.2)
+        return count
+
+    count = asyncio.run(run())
+    assert count >= 1 and renewals[0] == (["s1"], "manual:1")
+    assert len(renewals) == count
+
+
+def test_next_run_at_never_returns_the_past_in_the_repeated_hour():
+    # 02:00-03:00 Paris happens twice on 2026-10-25; from the second 02:20 the next quarter
+    # is 02:30 of that same second pass, not the already-elapsed first one.
+    base = _utc(2026, 10, 25, 1, 20)
+    assert next_run_at("*/15 * * * *", "Europe/Paris", base=base) == _utc(2026, 10, 25, 1, 30)
+    # Schedules follow the wall clock: after the first 02:50 comes 03:00 CET.
+    assert next_run_at("*/15 * * * *", "Europe/Paris", base=_utc(2026, 10, 25, 0, 50)) == _utc(2026, 10, 25, 2, 0)